@@ -0,0 +1,173 @@
+# analysis_schema.py
+
+import re
+import json
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+
+SCORE_FIELDS = ['clarity', 'specificity', 'structure', 'completeness', 'effectiveness']
+LIST_FIELDS = ['strengths', 'weaknesses', 'missing_elements']
+TEXT_FIELDS = ['one_line_summary', 'optimized_prompt']
+ANALYSIS_FIELDS = SCORE_FIELDS + ['overall_score'] + LIST_FIELDS + ['one_line_summary']
+FUSED_FIELDS = ANALYSIS_FIELDS + ['optimized_prompt']
+
+FIELD_DESCRIPTIONS = {
+    'clarity': "0-10: is the instruction clear and unambiguous?",
+    'specificity': "0-10: does it provide enough context and constraints?",
+    'structure': "0-10: is it well-organized with logical flow?",
+    'completeness': "0-10: does it cover all necessary aspects?",
+    'effectiveness': "0-10: will it likely produce the desired output?",
+    'overall_score': "average of the five scores",
+    'strengths': "2-3 key strengths",
+    'weaknesses': "2-3 main weaknesses",
+    'missing_elements': "elements the prompt is missing",
+    'one_line_summary': "brief assessment of the prompt",
+    'optimized_prompt': "the complete improved prompt",
+}
+
+class PromptAnalysis(TypedDict):
+    """Response schema enforced at generation time for analyze_prompt"""
+    clarity: float
+    specificity: float
+    structure: float
+    completeness: float
+    effectiveness: float
+    overall_score: float
+    strengths: List[str]
+    weaknesses: List[str]
+    missing_elements: List[str]
+    one_line_summary: str
+
+class FusedAnalysis(PromptAnalysis):
+    """Response schema for the single-call analyze+optimize mode"""
+    optimized_prompt: str
+
+def partial_schema(fields: List[str]) -> type:
+    """Build a schema containing only the requested fields"""
+    types = {**PromptAnalysis.__annotations__, **FusedAnalysis.__annotations__}
+    return TypedDict('PartialAnalysis', {field: types[field] for field in fields})
+
+# Process-wide counters for each parse outcome (shown in the app, useful to spot regressions)
+_outcomes: Counter = Counter()
+_outcomes_lock = threading.Lock()
+
+def record_outcome(outcome: str, count: int = 1) -> None:
+    with _outcomes_lock:
+        _outcomes[outcome] += count
+
+def get_outcome_counts() -> Dict[str, int]:
+    with _outcomes_lock:
+        return dict(_outcomes)
+
+def _strip_fences(text: str) -> str:
+    text = text.strip()
+    text = re.sub(r"^```(?:json)?\s*", "", text)
+    text = re.sub(r"\s*```$", "", text)
+    return text.strip()
+
+def _coerce(field: str, value: Any) -> Optional[Any]:
+    """Validate one field, returning None if the value is unusable"""
+    if field in SCORE_FIELDS or field == 'overall_score':
+        try:
+            score = float(value)
+        except (TypeError, ValueError):
+            return None
+        score = min(10.0, max(0.0, score))
+        return int(score) if score.is_integer() else round(score, 1)
+    if field in LIST_FIELDS:
+        if isinstance(value, str):
+            value = [value]
+        if not isinstance(value, list):
+            return None
+        return [str(item).strip() for item in value if str(item).strip()]
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    value = str(value).strip()
+    return value or None
+
+def _regex_fields(text: str, fields: List[str]) -> Dict[str, Any]:
+    """Pull individual fields out of text that is not valid JSON"""
+    found: Dict[str, Any] = {}
+    for field in fields:
+        key = rf'"{field}"\s*:\s*'
+        if field in SCORE_FIELDS or field == 'overall_score':
+            match = re.search(key + r'"?(-?\d+(?:\.\d+)?)', text)
+            if match:
+                found[field] = match.group(1)
+        elif field in LIST_FIELDS:
+            match = re.search(key + r'(\[.*?\])', text, re.DOTALL)
+            if match:
+                try:
+                    found[field] = json.loads(match.group(1))
+                except ValueError:
+                    found[field] = re.findall(r'"((?:[^"\\]|\\.)*)"', match.group(1))
+        else:
+            match = re.search(key + r'"((?:[^"\\]|\\.)*)"', text, re.DOTALL)
+            if match:
+                try:
+                    found[field] = json.loads(f'"{match.group(1)}"')
+                except ValueError:
+                    found[field] = match.group(1)
+    return found
+
+def parse_fields(text: str, fields: List[str]) -> Tuple[Dict[str, Any], bool]:
+    """Tolerantly parse a model response.
+
+    Returns the valid fields that could be recovered and whether the text
+    was clean JSON. Falls back from strict JSON, to the outermost {...}
+    block with trailing commas removed, to per-field regex extraction.
+    """
+    text = _strip_fences(text)
+    data: Optional[Dict[str, Any]] = None
+    strict = False
+    try:
+        data = json.loads(text)
+        strict = isinstance(data, dict)
+    except ValueError:
+        start, end = text.find('{'), text.rfind('}')
+        if start != -1 and end > start:
+            candidate = re.sub(r',\s*([}\]])', r'\1', text[start:end + 1])
+            try:
+                data = json.loads(candidate)
+            except ValueError:
+                data = None
+    if not isinstance(data, dict):
+        data = _regex_fields(text, fields)
+        strict = False
+
+    result: Dict[str, Any] = {}
+    for field in fields:
+        if field in data:
+            value = _coerce(field, data[field])
+            if value is not None:
+                result[field] = value
+
+    return result, strict
+
+def missing_fields(data: Dict[str, Any], fields: List[str]) -> List[str]:
+    """Return the fields still absent, deriving overall_score locally when possible"""
+    # The overall score is derived, so it never needs another request
+    if 'overall_score' in fields and 'overall_score' not in data and all(f in data for f in SCORE_FIELDS):
+        data['overall_score'] = round(sum(data[f] for f in SCORE_FIELDS) / len(SCORE_FIELDS), 1)
+    return [field for field in fields if field not in data]
+
+def default_analysis(error_msg: str) -> Dict[str, Any]:
+    """Neutral scores returned in place of an analysis that failed, with the error"""
+    return {
+        "clarity": 5,
+        "specificity": 5,
+        "structure": 5,
+        "completeness": 5,
+        "effectiveness": 5,
+        "overall_score": 5,
+        "strengths": ["Could not analyze"],
+        "weaknesses": ["Analysis failed"],
+        "missing_elements": [],
+        "one_line_summary": f"Error: {error_msg}",
+        "error": error_msg
+    }
+
+def is_complete(analysis: Dict[str, Any]) -> bool:
+    """Whether every field came from the model, rather than an error fallback or defaults"""
+    return not analysis.get('error') and not analysis.get('defaulted')
@@ -0,0 +1,449 @@
+# analysis_service.py
+"""Long-lived local service sharing models, caches and rate limits between front ends.
+
+Usage:
+    python analysis_service.py --port 8765
+
+Endpoints (JSON request and response bodies):
+    GET  /health[?model=NAME]     service status, optionally probing a model
+    POST /v1/analyze              {prompt, model}
+    POST /v1/optimize             {prompt, analysis, focus, variant, model}
+    POST /v1/analyze-optimize     {prompt, focus, model}
+    POST /v1/chat                 {contents, persona, model, knowledge_base, sections, stream, call_type}
+    GET  /v1/cache                response cache size
+    POST /v1/cache/clear
+    GET  /metrics, /metrics.json  call metrics (Prometheus text / JSON)
+
+Errors are {"error": ...} with a 4xx status for bad requests and 502 when
+the model call fails, so a failed analysis is never returned as a result.
+Streaming chat responses are NDJSON lines of {"text": ...} ending with
+{"done": true, "stats": {...}} (or {"error": ...} if the stream fails).
+The Streamlit apps and batch_optimize.py use it when PROMPT_SERVICE_URL is set.
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import argparse
+import functools
+import threading
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, Tuple
+from dotenv import load_dotenv
+from gemini_analyzer import GeminiAnalyzer
+from analysis_schema import SCORE_FIELDS
+from model_registry import get_model, check_health
+from rate_limiter import generate_content, stream_content
+from prompt_registry import get_prompt_registry
+from knowledge_retrieval import DEFAULT_TOP_K, retrieve
+from response_cache import get_default_cache
+from call_metrics import get_metrics_store
+from single_flight import get_single_flight
+
+DEFAULT_HOST = os.getenv("PROMPT_SERVICE_HOST", "127.0.0.1")
+DEFAULT_PORT = int(os.getenv("PROMPT_SERVICE_PORT", 8765))
+# Model calls block, so they run on this pool; the rate limiter caps what reaches the API
+WORKER_THREADS = int(os.getenv("PROMPT_SERVICE_THREADS", 64))
+MAX_BODY_BYTES = 1_000_000
+MAX_HEADERS = 100
+
+DEFAULT_MODEL = "gemini-1.5-flash"
+DEFAULT_CHAT_MODEL = "gemini-2.0-flash-exp"
+# Call types label metrics, so they are kept to simple identifiers
+CALL_TYPE = re.compile(r"^[a-z_]{1,32}$")
+
+class HTTPError(Exception):
+    """An error response with a status code"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+def _require(body: Dict[str, Any], field: str) -> Any:
+    value = body.get(field)
+    if value in (None, ""):
+        raise HTTPError(400, f"Missing required field '{field}'")
+    return value
+
+def _check_analysis(analysis: Any) -> None:
+    """Reject an optimize request whose analysis lacks what the optimization template reads"""
+    if not isinstance(analysis, dict):
+        raise HTTPError(400, "'analysis' must be an object from /v1/analyze")
+    missing = [field for field in SCORE_FIELDS + ['weaknesses'] if field not in analysis]
+    if missing:
+        raise HTTPError(400, f"'analysis' is missing {', '.join(missing)}")
+    invalid = [field for field in SCORE_FIELDS
+               if isinstance(analysis[field], bool) or not isinstance(analysis[field], (int, float))]
+    invalid += [field for field in ('weaknesses', 'missing_elements')
+                if not isinstance(analysis.get(field, []), list)]
+    if invalid:
+        raise HTTPError(400, f"'analysis' has invalid {', '.join(invalid)} "
+                             "(scores must be numbers, weaknesses and missing_elements lists)")
+
+def _int_field(body: Dict[str, Any], field: str, default: int) -> int:
+    value = body.get(field)
+    if value in (None, ""):
+        return default
+    if isinstance(value, bool):
+        raise HTTPError(400, f"'{field}' must be an integer")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"'{field}' must be an integer")
+
+def _usage_stats(stats: Dict[str, Any], response: Any) -> None:
+    """Copy token counts from response metadata into stats"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None and getattr(usage, "prompt_token_count", 0):
+        stats['input_tokens'] = usage.prompt_token_count
+        stats['cached_tokens'] = getattr(usage, "cached_content_token_count", 0) or 0
+        stats['output_tokens'] = getattr(usage, "candidates_token_count", 0) or 0
+
+class AnalysisService:
+    """Request handlers plus a minimal asyncio HTTP/1.1 server.
+
+    Each request builds a fresh ``GeminiAnalyzer``, which is cheap: models,
+    health checks, the response cache and rate limiters are process-wide,
+    while per-call fields such as ``last_cache_hit`` stay request-local.
+    Analyzers raise on API errors instead of returning default scores, and
+    the handlers turn those into 502 responses.
+    """
+
+    def __init__(self, api_key: str, threads: int = WORKER_THREADS):
+        self.api_key = api_key
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="analysis-service")
+        self.started_at = time.time()
+        self.requests = 0
+        self.in_flight = 0
+        self.routes: Dict[Tuple[str, str], Callable] = {
+            ("GET", "/health"): self.health,
+            ("POST", "/v1/analyze"): self.analyze,
+            ("POST", "/v1/optimize"): self.optimize,
+            ("POST", "/v1/analyze-optimize"): self.analyze_optimize,
+            ("POST", "/v1/chat"): self.chat,
+            ("GET", "/v1/cache"): self.cache_info,
+            ("POST", "/v1/cache/clear"): self.cache_clear,
+            ("GET", "/metrics"): self.metrics,
+            ("GET", "/metrics.json"): self.metrics_json,
+        }
+
+    async def _run(self, fn: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    def _analyzer(self, model_name: str) -> GeminiAnalyzer:
+        try:
+            return GeminiAnalyzer(self.api_key, model_name, raise_errors=True)
+        except RuntimeError as e:
+            raise HTTPError(502, f"Model {model_name} is unavailable: {e}")
+
+    def _analysis_call(self, model_name: str, call: Callable[[GeminiAnalyzer], Any]) -> Tuple[GeminiAnalyzer, Any]:
+        """Run one analyzer call, reporting API errors as 502 rather than as default results"""
+        analyzer = self._analyzer(model_name)
+        try:
+            return analyzer, call(analyzer)
+        except Exception as e:
+            raise HTTPError(502, f"Model call failed: {e}")
+
+    def _call_info(self, analyzer: GeminiAnalyzer, kind: str) -> Dict[str, Any]:
+        return {'cache_hit': analyzer.last_cache_hit, 'coalesced': analyzer.last_coalesced,
+                'latency': analyzer.last_latency.get(kind), 'tokens': analyzer.tokens_used}
+
+    # Handlers take the query parameters and JSON body and return a JSON-able
+    # result, or an async iterator of NDJSON lines for streaming responses
+
+    async def health(self, query: Dict[str, str], body: Dict[str, Any]) -> Dict[str, Any]:
+        status = {'status': 'ok', 'uptime': time.time() - self.started_at,
+                  'requests': self.requests, 'in_flight': self.in_flight,
+                  'single_flight': get_single_flight().stats()}
+        if query.get('model'):
+            healthy, error = await self._run(check_health, self.api_key, query['model'])
+            status['model'] = {'name': query['model'], 'healthy': healthy, 'error': error}
+            if not healthy:
+                raise HTTPError(502, f"Model {query['model']} is unavailable: {error}")
+        return status
+
+    async def analyze(self, query: Dict[str, str], body: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = _require(body, 'prompt')
+
+        def work():
+            analyzer, analysis = self._analysis_call(body.get('model') or DEFAULT_MODEL,
+                                                     lambda analyzer: analyzer.analyze_prompt(prompt))
+            return {'analysis': analysis, **self._call_info(analyzer, "analyze")}
+        return await self._run(work)
+
+    async def optimize(self, query: Dict[str, str], body: Dict[str, Any]) -> Dict[str, Any]:
+        prompt, analysis = _require(body, 'prompt'), _require(body, 'analysis')
+        _check_analysis(analysis)
+        variant = _int_field(body, 'variant', 0)
+
+        def work():
+            analyzer, optimized = self._analysis_call(
+                body.get('model') or DEFAULT_MODEL,
+                lambda analyzer: analyzer.optimize_prompt(prompt, analysis, body.get('focus') or "balanced", variant))
+            return {'optimized': optimized, **self._call_info(analyzer, "optimize")}
+        return await self._run(work)
+
+    async def analyze_optimize(self, query: Dict[str, str], body: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = _require(body, 'prompt')
+
+        def work():
+            analyzer, (analysis, optimized) = self._analysis_call(
+                body.get('model') or DEFAULT_MODEL,
+                lambda analyzer: analyzer.analyze_and_optimize(prompt, body.get('focus') or "balanced"))
+            return {'analysis': analysis, 'optimized': optimized, **self._call_info(analyzer, "fused")}
+        return await self._run(work)
+
+    def _chat_model(self, model_name: str, persona: Optional[str]) -> Any:
+        """Shared model for the persona's system prompt (plain model when persona is None)"""
+        template = None
+        if persona:
+            registry = get_prompt_registry()
+            # Knowledge bases live in the same registry but are not system prompts
+            personas = registry.personas()
+            if persona not in personas:
+                raise HTTPError(400, f"Unknown persona '{persona}'. Available: {', '.join(personas)}")
+            template = registry.get(persona)
+        model = get_model(self.api_key, model_name,
+                          system_instruction=template.text if template else None,
+                          use_context_cache=template is not None,
+                          instruction_hash=template.hash if template else None)
+        healthy, error = check_health(self.api_key, model_name)
+        if not healthy:
+            raise HTTPError(502, f"Model {model_name} is unavailable: {error}")
+        return model
+
+    def _chat_contents(self, body: Dict[str, Any], stats: Dict[str, Any]) -> Any:
+        """The request contents, with knowledge base sections added to the latest user message"""
+        contents = _require(body, 'contents')
+        knowledge_base = body.get('knowledge_base')
+        if not knowledge_base:
+            return contents
+        knowledge_bases = get_prompt_registry().knowledge_bases()
+        if knowledge_base not in knowledge_bases:
+            raise HTTPError(400, f"Unknown knowledge base '{knowledge_base}'. "
+                                 f"Available: {', '.join(knowledge_bases)}")
+        sections = _int_field(body, 'sections', DEFAULT_TOP_K)
+        try:
+            if isinstance(contents, str):
+                contents, stats['knowledge'] = retrieve(knowledge_base, contents, sections)
+            else:
+                # Gemini contents list: the last entry is the new user turn
+                last = dict(contents[-1])
+                message, stats['knowledge'] = retrieve(knowledge_base, last['parts'][-1], sections)
+                last['parts'] = list(last['parts'][:-1]) + [message]
+                contents = list(contents[:-1]) + [last]
+        except KeyError as e:
+            raise HTTPError(400, str(e.args[0]))
+        except (IndexError, TypeError):
+            raise HTTPError(400, "'contents' must be a string or a non-empty Gemini contents list")
+        return contents
+
+    async def chat(self, query: Dict[str, str], body: Dict[str, Any]) -> Any:
+        call_type = body.get('call_type') or "chat"
+        if not isinstance(call_type, str) or not CALL_TYPE.match(call_type):
+            raise HTTPError(400, "call_type must be a short lowercase identifier such as 'chat'")
+        stats: Dict[str, Any] = {}
+        contents = await self._run(self._chat_contents, body, stats)
+        # Resolve the model before answering, so bad personas and dead models get a real status code
+        model = await self._run(self._chat_model, body.get('model') or DEFAULT_CHAT_MODEL, body.get('persona'))
+
+        if not body.get('stream'):
+            def work():
+                start = time.perf_counter()
+                response = generate_content(model, contents, call_type=call_type)
+                _usage_stats(stats, response)
+                stats['total'] = time.perf_counter() - start
+                return {'text': response.text, 'stats': stats}
+            return await self._run(work)
+
+        def chunks() -> Iterator[Dict[str, Any]]:
+            start = time.perf_counter()
+            for chunk in stream_content(model, contents, call_type=call_type):
+                _usage_stats(stats, chunk)
+                # The final chunk may carry only metadata and no text
+                if not chunk.parts:
+                    continue
+                if 'first_token' not in stats:
+                    stats['first_token'] = time.perf_counter() - start
+                yield {'text': chunk.text}
+            stats['total'] = time.perf_counter() - start
+            yield {'done': True, 'stats': stats}
+        return self._iterate_in_thread(chunks)
+
+    async def _iterate_in_thread(self, make_iterator: Callable[[], Iterator[Any]]) -> AsyncIterator[Any]:
+        """Drive a blocking iterator on the pool, handing items to the event loop as they arrive"""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def produce():
+            try:
+                for item in make_iterator():
+                    if cancelled.is_set():
+                        return  # The client went away; stop pulling from the model
+                    loop.call_soon_threadsafe(queue.put_nowait, (False, item))
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, (False, {'error': str(e)}))
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, (True, None))
+
+        loop.run_in_executor(self.executor, produce)
+        try:
+            while True:
+                done, item = await queue.get()
+                if done:
+                    return
+                yield item
+        finally:
+            cancelled.set()
+
+    async def cache_info(self, query: Dict[str, str], body: Dict[str, Any]) -> Dict[str, Any]:
+        return {'entries': await self._run(len, get_default_cache())}
+
+    async def cache_clear(self, query: Dict[str, str], body: Dict[str, Any]) -> Dict[str, Any]:
+        await self._run(get_default_cache().clear)
+        return {'entries': 0}
+
+    async def metrics(self, query: Dict[str, str], body: Dict[str, Any]) -> str:
+        return get_metrics_store().to_prometheus()
+
+    async def metrics_json(self, query: Dict[str, str], body: Dict[str, Any]) -> Dict[str, Any]:
+        return json.loads(get_metrics_store().to_json())
+
+    # HTTP plumbing
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+        headers: Dict[str, str] = {}
+        for _ in range(MAX_HEADERS):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise HTTPError(431, "Too many headers")
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    async def _write_head(self, writer: asyncio.StreamWriter, status: int, content_type: str,
+                          keep_alive: bool, length: Optional[int] = None) -> None:
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Content-Type: {content_type}",
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        lines.append(f"Content-Length: {length}" if length is not None else "Transfer-Encoding: chunked")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    async def _send(self, writer: asyncio.StreamWriter, status: int, result: Any, keep_alive: bool) -> None:
+        if isinstance(result, str):
+            payload, content_type = result.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            payload, content_type = json.dumps(result, default=str).encode("utf-8"), "application/json"
+        await self._write_head(writer, status, content_type, keep_alive, len(payload))
+        writer.write(payload)
+        await writer.drain()
+
+    async def _send_stream(self, writer: asyncio.StreamWriter, lines: AsyncIterator[Any], keep_alive: bool) -> None:
+        await self._write_head(writer, 200, "application/x-ndjson", keep_alive)
+        async for line in lines:
+            data = (json.dumps(line, default=str) + "\n").encode("utf-8")
+            writer.write(f"{len(data):X}\r\n".encode("latin-1") + data + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _respond(self, method: str, target: str, body: bytes, writer: asyncio.StreamWriter,
+                       keep_alive: bool) -> None:
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        handler = self.routes.get((method, url.path.rstrip("/") or "/"))
+        try:
+            if handler is None:
+                known = any(path == url.path.rstrip("/") for _, path in self.routes)
+                raise HTTPError(405 if known else 404, f"No route for {method} {url.path}")
+            try:
+                data = json.loads(body) if body else {}
+            except ValueError:
+                raise HTTPError(400, "Request body is not valid JSON")
+            if not isinstance(data, dict):
+                raise HTTPError(400, "Request body must be a JSON object")
+            result = await handler(query, data)
+        except HTTPError as e:
+            await self._send(writer, e.status, {'error': str(e)}, keep_alive)
+            return
+        except Exception as e:
+            await self._send(writer, 500, {'error': f"{type(e).__name__}: {e}"}, keep_alive)
+            return
+        if hasattr(result, "__aiter__"):
+            await self._send_stream(writer, result, keep_alive)
+        else:
+            await self._send(writer, 200, result, keep_alive)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    await self._send(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    return
+                if request is None:
+                    return
+                method, target, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self.requests += 1
+                self.in_flight += 1
+                try:
+                    await self._respond(method, target, body, writer, keep_alive)
+                finally:
+                    self.in_flight -= 1
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass  # Client hung up mid-request
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                    ready: Optional[Callable[[int], None]] = None) -> None:
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        bound = server.sockets[0].getsockname()[1]
+        if ready:
+            ready(bound)
+        async with server:
+            await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve prompt analysis and assistant chat over HTTP")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Interface to bind (default: localhost only)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--threads", type=int, default=WORKER_THREADS, help="Worker threads for model calls")
+    args = parser.parse_args()
+
+    load_dotenv()
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        parser.error("GEMINI_API_KEY is not set")
+
+    service = AnalysisService(api_key, args.threads)
+    try:
+        asyncio.run(service.serve(args.host, args.port,
+                                  ready=lambda port: print(f"Analysis service listening on http://{args.host}:{port}")))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
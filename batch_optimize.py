@@ -0,0 +1,249 @@
+# batch_optimize.py
+"""Headless batch analysis/optimization of JSONL or CSV prompt corpora.
+
+Usage:
+    python batch_optimize.py prompts.jsonl results.jsonl --concurrency 8
+
+Results are appended to the output JSONL as they complete and a checkpoint
+file records progress, so re-running the same command resumes a crashed run.
+Prompts that fail (API errors or unreadable input lines) are written with an
+``error`` and retried by the next run.
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import asyncio
+import argparse
+from typing import Dict, Iterator, Optional, Any, Set, Tuple
+from dotenv import load_dotenv
+from gemini_analyzer import GeminiAnalyzer
+from service_client import ServiceClient, service_url
+
+def _parse_line(line: str) -> Any:
+    """Decode one JSONL record, returning the error message for unreadable lines"""
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        return f"Invalid JSON: {e}"
+    return record if isinstance(record, dict) else "Invalid JSON: expected an object"
+
+def iter_prompts(path: str, fmt: str, prompt_field: str,
+                 id_field: Optional[str] = None) -> Iterator[Tuple[int, str, str, Optional[str]]]:
+    """Stream (index, record id, prompt, error) tuples without loading the whole file
+
+    A line that cannot be read yields an empty prompt and the reason, so one
+    bad record doesn't stop the run.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            records = csv.DictReader(f)
+        else:
+            records = (_parse_line(line) for line in f if line.strip())
+
+        for index, record in enumerate(records):
+            if isinstance(record, str):
+                yield index, str(index), "", record
+                continue
+            prompt = record.get(prompt_field) or ""
+            record_id = str(record.get(id_field, index)) if id_field else str(index)
+            yield index, record_id, prompt, None
+
+class Checkpoint:
+    """Tracks settled input indices as a low watermark plus a small out-of-order set.
+
+    Everything below ``next_index`` is settled; ``settled`` only ever holds
+    the indices finished ahead of the watermark, so it is bounded by the
+    concurrency window rather than the corpus size. Failed indices move the
+    watermark too but are kept in ``failed`` so the next run retries them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.next_index = 0
+        self.settled: Set[int] = set()
+        self.failed: Set[int] = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            self.next_index = state.get("next_index", 0)
+            self.failed = set(state.get("failed", []))
+
+    def is_done(self, index: int) -> bool:
+        if index in self.failed:
+            return False
+        return index < self.next_index or index in self.settled
+
+    def mark_done(self, index: int) -> None:
+        self.failed.discard(index)
+        self._settle(index)
+
+    def mark_failed(self, index: int) -> None:
+        self.failed.add(index)
+        self._settle(index)
+
+    def _settle(self, index: int) -> None:
+        self.settled.add(index)
+        while self.next_index in self.settled:
+            self.settled.remove(self.next_index)
+            self.next_index += 1
+
+    def save(self) -> None:
+        """Write atomically so a crash never leaves a truncated checkpoint"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"next_index": self.next_index, "failed": sorted(self.failed)}, f)
+        os.replace(tmp_path, self.path)
+
+def load_completed_ahead(output_path: str, checkpoint: Checkpoint) -> None:
+    """Pick up results written after the last checkpoint save; failed ones are retried"""
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                index = record["index"]
+            except (ValueError, KeyError, TypeError):
+                continue  # Partial line from a crash
+            if record.get("error"):
+                continue
+            if index >= checkpoint.next_index or index in checkpoint.failed:
+                checkpoint.mark_done(index)
+
+def process_prompt(analyzer: GeminiAnalyzer, prompt: str, focus: str,
+                   optimize: bool, fused: bool) -> Dict[str, Any]:
+    """Run analysis (and optimization) for one prompt; called from a worker thread"""
+    start = time.perf_counter()
+    result: Dict[str, Any] = {}
+    if optimize and fused:
+        result['analysis'], result['optimized'] = analyzer.analyze_and_optimize(prompt, focus)
+    else:
+        result['analysis'] = analyzer.analyze_prompt(prompt)
+        if optimize:
+            result['optimized'] = analyzer.optimize_prompt(prompt, result['analysis'], focus)
+    result['latency'] = time.perf_counter() - start
+    return result
+
+async def run_batch(analyzer: GeminiAnalyzer, input_path: str, output_path: str,
+                    fmt: str, prompt_field: str, id_field: Optional[str] = None,
+                    focus: str = "balanced", optimize: bool = True, fused: bool = False,
+                    concurrency: int = 8, checkpoint_path: Optional[str] = None,
+                    progress_every: int = 25) -> Dict[str, float]:
+    """Process the corpus with at most ``concurrency`` prompts in flight"""
+    checkpoint = Checkpoint(checkpoint_path or output_path + ".checkpoint")
+    load_completed_ahead(output_path, checkpoint)
+
+    # A bounded queue keeps memory flat: the reader waits for the workers
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    stats = {'processed': 0, 'skipped': 0, 'errors': 0}
+    start = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        # Terminate any partial line left by a crash before appending
+        if out.tell() > 0:
+            with open(output_path, "rb") as existing:
+                existing.seek(-1, os.SEEK_END)
+                if existing.read(1) != b"\n":
+                    out.write("\n")
+
+        def report_progress(final: bool = False) -> None:
+            elapsed = time.perf_counter() - start
+            rate = stats['processed'] / elapsed if elapsed > 0 else 0.0
+            label = "Done" if final else "Progress"
+            print(f"{label}: {stats['processed']} processed, {stats['skipped']} skipped, "
+                  f"{stats['errors']} errors, {rate:.2f} prompts/s", file=sys.stderr)
+
+        def write_result(record: Dict[str, Any]) -> None:
+            out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            out.flush()
+            # Failed prompts are not marked done, so a re-run retries them
+            if record.get('error'):
+                checkpoint.mark_failed(record['index'])
+                stats['errors'] += 1
+            else:
+                checkpoint.mark_done(record['index'])
+            stats['processed'] += 1
+            if stats['processed'] % progress_every == 0:
+                checkpoint.save()
+                report_progress()
+
+        async def worker() -> None:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    queue.task_done()
+                    return
+                index, record_id, prompt = item
+                record: Dict[str, Any] = {'index': index, 'id': record_id, 'prompt': prompt}
+                try:
+                    record.update(await asyncio.to_thread(
+                        process_prompt, analyzer, prompt, focus, optimize, fused
+                    ))
+                except Exception as e:
+                    record['error'] = str(e)
+                write_result(record)
+                queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        for index, record_id, prompt, error in iter_prompts(input_path, fmt, prompt_field, id_field):
+            if checkpoint.is_done(index):
+                stats['skipped'] += 1
+                continue
+            if error:
+                write_result({'index': index, 'id': record_id, 'error': error})
+                continue
+            if not prompt.strip():
+                checkpoint.mark_done(index)
+                stats['skipped'] += 1
+                continue
+            await queue.put((index, record_id, prompt))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    checkpoint.save()
+    report_progress(final=True)
+    elapsed = time.perf_counter() - start
+    stats['elapsed'] = elapsed
+    stats['prompts_per_second'] = stats['processed'] / elapsed if elapsed > 0 else 0.0
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch analyze and optimize prompts with Gemini")
+    parser.add_argument("input", help="JSONL or CSV file of prompts")
+    parser.add_argument("output", help="JSONL file results are appended to")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Input format (default: from extension)")
+    parser.add_argument("--prompt-field", default="prompt", help="Field/column holding the prompt text")
+    parser.add_argument("--id-field", help="Field/column used as record id (default: row index)")
+    parser.add_argument("--model", default="gemini-1.5-flash", help="Gemini model name")
+    parser.add_argument("--focus", default="balanced",
+                        choices=["balanced", "clarity", "specificity", "structure", "completeness", "effectiveness"])
+    parser.add_argument("--concurrency", type=int, default=8, help="Prompts processed in parallel")
+    parser.add_argument("--fused", action="store_true", help="Analyze and optimize in one call")
+    parser.add_argument("--analyze-only", action="store_true", help="Skip optimization")
+    parser.add_argument("--checkpoint", help="Checkpoint path (default: <output>.checkpoint)")
+    parser.add_argument("--service-url",
+                        help="Send requests to a running analysis_service.py (default: $PROMPT_SERVICE_URL)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    fmt = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    url = args.service_url or service_url()
+    if url:
+        analyzer = ServiceClient(url, args.model, raise_errors=True)
+    else:
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            parser.error("GEMINI_API_KEY is not set")
+        analyzer = GeminiAnalyzer(api_key, args.model, raise_errors=True)
+    asyncio.run(run_batch(
+        analyzer, args.input, args.output, fmt, args.prompt_field, args.id_field,
+        focus=args.focus, optimize=not args.analyze_only, fused=args.fused,
+        concurrency=args.concurrency, checkpoint_path=args.checkpoint
+    ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# benchmarks/import_time.py
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+from typing import Any, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules the apps should only load on first use
+HEAVY_MODULES = ["pandas", "plotly", "plotly.express", "plotly.graph_objects"]
+
+SCENARIOS = {
+    "streamlit": ["streamlit"],
+    "app": ["streamlit_prompt_optimizer"],
+    "app + charts (eager)": ["pandas", "plotly.express", "plotly.graph_objects", "streamlit_prompt_optimizer"],
+}
+
+_PROBE = """
+import sys, json, time, resource
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss //= 1024  # macOS reports bytes, Linux kilobytes
+print(json.dumps({{"seconds": elapsed, "max_rss_kb": rss,
+                   "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def measure(modules: List[str], runs: int) -> Dict[str, Any]:
+    """Import modules in fresh interpreters and return median time and peak RSS"""
+    env = dict(os.environ)
+    # Keep the app's module-level setup away from the real history database
+    env["PROMPT_HISTORY_PATH"] = os.path.join(tempfile.mkdtemp(), "history.sqlite3")
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(modules=modules, heavy=HEAVY_MODULES)],
+            cwd=REPO_ROOT, env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {modules} failed:\n{result.stderr.strip()}")
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {
+        "seconds": statistics.median(s["seconds"] for s in samples),
+        "max_rss_mb": statistics.median(s["max_rss_kb"] for s in samples) / 1024,
+        "heavy": samples[0]["heavy"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app import time and memory with lazy chart imports")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per scenario (median is reported)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = {name: measure(modules, args.runs) for name, modules in SCENARIOS.items()}
+    app, eager = results["app"], results["app + charts (eager)"]
+    saving = {
+        "seconds": eager["seconds"] - app["seconds"],
+        "max_rss_mb": eager["max_rss_mb"] - app["max_rss_mb"],
+    }
+    # Heavy modules streamlit itself pulls in are not the app's doing
+    regressions = sorted(set(app["heavy"]) - set(results["streamlit"]["heavy"]))
+
+    if args.json:
+        print(json.dumps({"results": results, "saving": saving, "eager_imports": regressions}, indent=2))
+    else:
+        for name, result in results.items():
+            print(f"{name:<24} {result['seconds'] * 1000:8.1f} ms  {result['max_rss_mb']:7.1f} MB")
+        print(f"{'lazy import saving':<24} {saving['seconds'] * 1000:8.1f} ms  {saving['max_rss_mb']:7.1f} MB per process")
+        if regressions:
+            print(f"Eagerly imported at startup: {', '.join(regressions)}")
+
+    # Non-zero exit so CI notices when a heavy import creeps back to module level
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+# benchmarks/model_calls.py
+
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import functools
+import platform
+import tempfile
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_calls_baseline.json")
+# Checked metrics fail only when both the relative and the absolute slowdown exceed these.
+# Best-of-rounds medians of unchanged code stay within about +-35% between runs, so 50%
+# still catches real regressions; pass a larger --threshold on a noisy shared machine.
+DEFAULT_THRESHOLD = 0.5
+MIN_ABSOLUTE_CHANGE = {"us": 10.0, "ms": 1.0, "ratio": 0.05}
+# Each timing is the best of this many rounds' medians
+DEFAULT_ROUNDS = 5
+
+# The fake model must never wait on the free-tier quota
+os.environ["GEMINI_RPM"] = "1000000000"
+os.environ["GEMINI_TPM"] = "1000000000000"
+os.environ.setdefault("GEMINI_MAX_CONCURRENCY", "8")
+# Keep the fake's bucket levels out of the machine-wide budget file
+os.environ["GEMINI_LIMITS_PATH"] = os.path.join(tempfile.mkdtemp(), "rate_limits.sqlite3")
+sys.path.insert(0, REPO_ROOT)
+
+from analysis_schema import FUSED_FIELDS, FusedAnalysis, PromptAnalysis, parse_fields
+from fake_gemini import FakeGenerativeModel, canned_json, fixed_latency, lognormal_latency, malformed
+from rate_limiter import generate_content, stream_content
+from response_cache import ResponseCache, make_cache_key
+from gemini_analyzer import GeminiAnalyzer
+from chat_context import ChatContext
+from chat_helpers import chat_with_gemini, stream_chat_with_gemini
+
+SAMPLE_PROMPT = "Write a product description for a waterproof hiking backpack aimed at weekend hikers."
+SAMPLE_REWRITE = (
+    "You are an outdoor gear copywriter. Write a 150-word product description for a waterproof "
+    "hiking backpack aimed at weekend hikers. Mention capacity, weight and weather protection, "
+    "use a friendly tone and end with a one-line call to action."
+)
+
+def _timed(fn: Callable[[], Any], repeats: int) -> List[float]:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def _quantile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(q * len(ordered) + 0.5) - 1))]
+
+def _micros(samples: List[float]) -> Dict[str, float]:
+    return {"p50": statistics.median(samples) * 1e6, "p95": _quantile(samples, 0.95) * 1e6}
+
+def _best_micros(fn: Callable[[], Any], repeats: int, rounds: int) -> Dict[str, float]:
+    """Lowest per-round p50/p95 over several rounds, in microseconds.
+
+    A single median still moves with whatever else the machine was doing
+    during that round; the best round is a far steadier regression signal.
+    An untimed warm-up round runs first so the group order doesn't matter.
+    """
+    _timed(fn, max(1, repeats // 5))
+    per_round = [_micros(_timed(fn, repeats)) for _ in range(rounds)]
+    return {key: min(result[key] for result in per_round) for key in ("p50", "p95")}
+
+def _us(value: float) -> Dict[str, Any]:
+    return {"value": value, "unit": "us", "better": "lower"}
+
+def bench_single_call(scale: int, rounds: int) -> Dict[str, Dict[str, Any]]:
+    """Per-call overhead of the rate limiter, metrics and response handling around the model"""
+    results = {}
+    # A fixed response keeps the fake's own JSON generation out of the measurement
+    instant = FakeGenerativeModel("fake-gemini-instant", response=canned_json(SAMPLE_PROMPT, PromptAnalysis))
+    config = {"response_mime_type": "application/json", "response_schema": PromptAnalysis}
+    overhead = _best_micros(lambda: generate_content(instant, SAMPLE_PROMPT, call_type="bench",
+                                                     generation_config=config), 400 * scale, rounds)
+    results["single_call.overhead_p50"] = _us(overhead["p50"])
+    results["single_call.overhead_p95"] = _us(overhead["p95"])
+
+    def stream_once():
+        for _ in stream_content(instant, SAMPLE_PROMPT, call_type="bench_stream"):
+            pass
+    results["single_call.stream_overhead_p50"] = _us(_best_micros(stream_once, 400 * scale, rounds)["p50"])
+
+    # Simulated network latency: wall time should track the model's own delay closely
+    slow = FakeGenerativeModel("fake-gemini-slow", latency=lognormal_latency(0.01, 0.3, cap=0.05),
+                               tokens_per_second=20000, seed=2)
+    samples = _timed(lambda: generate_content(slow, SAMPLE_PROMPT, call_type="bench"), 50 * scale)
+    added = (sum(samples) - slow.stats()["simulated_seconds"]) / len(samples)
+    results["single_call.simulated_p50"] = {"value": statistics.median(samples) * 1000, "unit": "ms",
+                                            "better": "lower", "check": False}
+    # Mostly sleep overshoot, which varies by OS, so it is reported but not checked
+    results["single_call.added_latency"] = {"value": added * 1e6, "unit": "us", "better": "lower", "check": False}
+    return results
+
+def bench_parsing(scale: int, rounds: int) -> Dict[str, Dict[str, Any]]:
+    """parse_fields on clean JSON, damaged JSON (salvage) and non-JSON text (regex)"""
+    clean = canned_json(SAMPLE_PROMPT, FusedAnalysis)
+    salvage = malformed(clean)
+    regex = clean.replace('{', 'Here you go: ', 1)[:-1].replace('", "', '" "')
+    results = {}
+    for name, text in [("clean", clean), ("salvage", salvage), ("regex", regex)]:
+        results[f"parse.{name}_p50"] = _us(_best_micros(lambda: parse_fields(text, FUSED_FIELDS),
+                                                        1000 * scale, rounds)["p50"])
+    return results
+
+def bench_analyzer(scale: int, rounds: int) -> Dict[str, Dict[str, Any]]:
+    """GeminiAnalyzer.analyze_prompt, optimize_prompt and analyze_and_optimize against the fake.
+
+    Cold calls use a new prompt each time (cache miss, model call, parsing
+    and cache write); cached calls repeat one prompt.
+    """
+    responses = {PromptAnalysis: canned_json(SAMPLE_PROMPT, PromptAnalysis),
+                 FusedAnalysis: canned_json(SAMPLE_PROMPT, FusedAnalysis)}
+
+    def respond(contents, generation_config):
+        # Optimization requests have no schema and get a plain-text rewrite
+        return responses.get((generation_config or {}).get("response_schema"), SAMPLE_REWRITE)
+
+    model = FakeGenerativeModel("fake-gemini-analyzer", response=respond)
+    directory = tempfile.mkdtemp()
+
+    def new_analyzer(name: str) -> GeminiAnalyzer:
+        # A cache per call kind, so each metric writes to a table of the same size on every run
+        cache = ResponseCache(os.path.join(directory, f"bench_{name}.sqlite3"))
+        return GeminiAnalyzer("", model.model_name, cache=cache, raise_errors=True, model=model)
+
+    analysis = json.loads(responses[PromptAnalysis])
+    counter = itertools.count()
+
+    def fresh() -> str:
+        return f"{SAMPLE_PROMPT} Variant {next(counter)}."
+
+    calls = {
+        "analyze": lambda analyzer, prompt: analyzer.analyze_prompt(prompt),
+        "optimize": lambda analyzer, prompt: analyzer.optimize_prompt(prompt, analysis),
+        "fused": lambda analyzer, prompt: analyzer.analyze_and_optimize(prompt),
+    }
+    results = {}
+    for name, method in calls.items():
+        call = functools.partial(method, new_analyzer(name))
+        results[f"analyzer.{name}_cold_p50"] = _us(_best_micros(lambda: call(fresh()), 100 * scale, rounds)["p50"])
+        call(SAMPLE_PROMPT)
+        results[f"analyzer.{name}_cached_p50"] = _us(_best_micros(lambda: call(SAMPLE_PROMPT),
+                                                                  500 * scale, rounds)["p50"])
+    return results
+
+def bench_chat(scale: int, rounds: int) -> Dict[str, Dict[str, Any]]:
+    """chat_with_gemini and stream_chat_with_gemini with a multi-turn context, against the fake"""
+    model = FakeGenerativeModel("fake-gemini-chat", response=SAMPLE_REWRITE * 4)
+    context = ChatContext()
+    for turn in range(6):
+        context.add_turn("user", f"{SAMPLE_PROMPT} Make version {turn} shorter.")
+        context.add_turn("model", SAMPLE_REWRITE)
+
+    def stream_once():
+        for _ in stream_chat_with_gemini(model, SAMPLE_PROMPT, {}, context):
+            pass
+
+    return {
+        "chat.turn_p50": _us(_best_micros(lambda: chat_with_gemini(model, SAMPLE_PROMPT, {}, context),
+                                          300 * scale, rounds)["p50"]),
+        "chat.stream_p50": _us(_best_micros(stream_once, 300 * scale, rounds)["p50"]),
+    }
+
+def bench_cache(scale: int, rounds: int) -> Dict[str, Dict[str, Any]]:
+    """Cache-hit path the analyzer takes before any model call: key, lookup, decode"""
+    cache = ResponseCache(os.path.join(tempfile.mkdtemp(), "bench_cache.sqlite3"))
+    analysis = json.loads(canned_json(SAMPLE_PROMPT, PromptAnalysis))
+    prompts = [f"{SAMPLE_PROMPT} Variant {i}." for i in range(200)]
+    for prompt in prompts:
+        cache.set(make_cache_key("analyze", prompt, "fake-gemini", template_version="bench"), analysis)
+
+    counter = itertools.count()
+
+    def hit():
+        prompt = prompts[next(counter) % len(prompts)]
+        return cache.get(make_cache_key("analyze", prompt, "fake-gemini", template_version="bench"))
+
+    def miss():
+        return cache.get(make_cache_key("analyze", f"missing {next(counter)}", "fake-gemini",
+                                        template_version="bench"))
+
+    return {
+        "cache.hit_p50": _us(_best_micros(hit, 600 * scale, rounds)["p50"]),
+        "cache.miss_p50": _us(_best_micros(miss, 600 * scale, rounds)["p50"]),
+    }
+
+def bench_throughput(scale: int, rounds: int) -> Dict[str, Dict[str, Any]]:
+    """Concurrent calls through the shared limiter; efficiency is achieved / ideal throughput"""
+    workers, latency, calls = 8, 0.02, 400 * scale
+    ideal = workers / latency
+    results = {}
+    for name, error_rate in [("throughput", 0.0), ("throughput_with_errors", 0.05)]:
+        model = FakeGenerativeModel(f"fake-gemini-{name}", latency=fixed_latency(latency),
+                                    error_rate=error_rate, seed=3)
+
+        def call(_):
+            try:
+                generate_content(model, SAMPLE_PROMPT, call_type="bench_concurrent")
+                return True
+            except Exception:
+                return False
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            succeeded = sum(pool.map(call, range(calls)))
+        elapsed = time.perf_counter() - start
+        results[f"{name}.calls_per_second"] = {"value": calls / elapsed, "unit": "calls/s",
+                                               "better": "higher", "check": False}
+        results[f"{name}.efficiency"] = {"value": calls / elapsed / ideal, "unit": "ratio", "better": "higher"}
+        if error_rate:
+            results[f"{name}.success_rate"] = {"value": succeeded / calls, "unit": "ratio",
+                                               "better": "higher", "check": False}
+    return results
+
+BENCHMARKS = {
+    "single_call": bench_single_call,
+    "parsing": bench_parsing,
+    "analyzer": bench_analyzer,
+    "chat": bench_chat,
+    "cache": bench_cache,
+    "throughput": bench_throughput,
+}
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            threshold: float) -> List[str]:
+    """Names of checked metrics worse than the baseline by more than threshold and the absolute floor"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None or not result.get("check", True) or not base["value"]:
+            continue
+        delta = result["value"] - base["value"]
+        if result["better"] == "higher":
+            # Measured as a slowdown too, so halving a throughput counts like doubling a latency
+            delta = -delta
+            result["change"] = base["value"] / result["value"] - 1 if result["value"] > 0 else float("inf")
+        else:
+            result["change"] = delta / base["value"]
+        if result["change"] > threshold and delta > MIN_ABSOLUTE_CHANGE.get(result["unit"], 0.0):
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the model-call path against a fake Gemini model")
+    parser.add_argument("--only", choices=sorted(BENCHMARKS), action="append", help="Run just these groups")
+    parser.add_argument("--scale", type=int, default=1, help="Multiply iteration counts (steadier numbers)")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS,
+                        help="Timing rounds per metric; the best round's median is reported")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown vs the baseline before failing (0.5 = 50%% slower)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="Write these results as the new baseline")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for name in args.only or BENCHMARKS:
+        results.update(BENCHMARKS[name](args.scale, args.rounds))
+
+    baseline: Dict[str, Any] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.json:
+        print(json.dumps({"results": results, "regressions": regressions}, indent=2))
+    else:
+        for name, result in results.items():
+            change = ""
+            if "change" in result:
+                change = f"{abs(result['change']):6.1%} {'worse' if result['change'] > 0 else 'better'}"
+            print(f"{name:<40} {result['value']:12.2f} {result['unit']:<8} {change}")
+        if regressions:
+            print(f"Regressed more than {args.threshold:.0%} (and the absolute floor): {', '.join(regressions)}")
+
+    if args.update_baseline:
+        for result in results.values():
+            result.pop("change", None)
+            result["value"] = round(result["value"], 4)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "results": {**baseline, **results}}, f, indent=2)
+            f.write("\n")
+        return
+
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# call_metrics.py
+
+import os
+import json
+import time
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+MAX_RECORDS = int(os.getenv("METRICS_MAX_RECORDS", 5000))
+QUANTILES = (0.5, 0.95, 0.99)
+
+# USD per million (input, output) tokens; unknown models are costed with the fallback
+MODEL_PRICING = {
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.0-flash-exp": (0.10, 0.40),
+}
+FALLBACK_PRICING = (0.10, 0.40)
+
+def estimate_cost(model_name: str, input_tokens: int, output_tokens: int) -> float:
+    input_price, output_price = MODEL_PRICING.get(model_name.replace("models/", "", 1), FALLBACK_PRICING)
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+def usage_from_response(response: Any) -> Dict[str, int]:
+    """Token counts from a response's usage_metadata (zeros when absent)"""
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        'input_tokens': getattr(usage, "prompt_token_count", 0) or 0,
+        'output_tokens': getattr(usage, "candidates_token_count", 0) or 0,
+        'cached_tokens': getattr(usage, "cached_content_token_count", 0) or 0,
+    }
+
+def _quantile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank quantile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(q * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+class MetricsStore:
+    """Rolling, thread-safe record of the most recent model calls.
+
+    Each record holds the call type, model, wall time, time waiting for the
+    rate limiter, time to first token (streams), token usage, estimated
+    cost, retries and the error type if the call failed.
+    """
+
+    def __init__(self, max_records: int = MAX_RECORDS):
+        self.records: deque = deque(maxlen=max_records)
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, call_type: str, model_name: str, wall: float, queued: float = 0.0,
+               first_token: Optional[float] = None, usage: Optional[Dict[str, int]] = None,
+               retries: int = 0, error: Optional[str] = None) -> None:
+        usage = usage or {}
+        entry = {
+            'call_type': call_type,
+            'model': model_name,
+            'timestamp': time.time(),
+            'wall': wall,
+            'queued': queued,
+            'first_token': first_token,
+            'input_tokens': usage.get('input_tokens', 0),
+            'output_tokens': usage.get('output_tokens', 0),
+            'cached_tokens': usage.get('cached_tokens', 0),
+            'retries': retries,
+            'error': error,
+        }
+        entry['cost'] = estimate_cost(model_name, entry['input_tokens'], entry['output_tokens'])
+        with self._lock:
+            self.records.append(entry)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self.records)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Per call type: counts, errors, retries, token/cost totals and wall/TTFT quantiles"""
+        by_type: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in self.snapshot():
+            by_type.setdefault(entry['call_type'], []).append(entry)
+
+        summary = {}
+        for call_type, entries in sorted(by_type.items()):
+            walls = sorted(e['wall'] for e in entries)
+            first_tokens = sorted(e['first_token'] for e in entries if e['first_token'] is not None)
+            errors = sum(1 for e in entries if e['error'])
+            summary[call_type] = {
+                'count': len(entries),
+                'errors': errors,
+                'error_rate': errors / len(entries),
+                'retries': sum(e['retries'] for e in entries),
+                'input_tokens': sum(e['input_tokens'] for e in entries),
+                'output_tokens': sum(e['output_tokens'] for e in entries),
+                'cached_tokens': sum(e['cached_tokens'] for e in entries),
+                'cost': sum(e['cost'] for e in entries),
+                'wall_sum': sum(walls),
+                'queued_sum': sum(e['queued'] for e in entries),
+                'wall': {f"p{round(q * 100)}": _quantile(walls, q) for q in QUANTILES},
+                'first_token': {f"p{round(q * 100)}": _quantile(first_tokens, q) for q in QUANTILES},
+            }
+        return summary
+
+    def to_json(self) -> str:
+        return json.dumps({'window_records': len(self.records), 'summary': self.summary()}, indent=2)
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition of the summary"""
+        lines = [
+            "# HELP gemini_call_duration_seconds Wall time of model calls, including rate-limit waits and retries",
+            "# TYPE gemini_call_duration_seconds summary",
+        ]
+        summary = self.summary()
+        for call_type, stats in summary.items():
+            label = f'call_type="{call_type}"'
+            for q in QUANTILES:
+                value = stats['wall'][f"p{round(q * 100)}"]
+                lines.append(f'gemini_call_duration_seconds{{{label},quantile="{q}"}} {value}')
+            lines.append(f"gemini_call_duration_seconds_sum{{{label}}} {stats['wall_sum']}")
+            lines.append(f"gemini_call_duration_seconds_count{{{label}}} {stats['count']}")
+        lines += ["# HELP gemini_first_token_seconds Time to first streamed chunk",
+                  "# TYPE gemini_first_token_seconds gauge"]
+        for call_type, stats in summary.items():
+            for q in QUANTILES:
+                value = stats['first_token'][f"p{round(q * 100)}"]
+                if value is not None:
+                    lines.append(f'gemini_first_token_seconds{{call_type="{call_type}",quantile="{q}"}} {value}')
+        for metric, key, help_text in [
+            ("gemini_call_errors", "errors", "Failed model calls"),
+            ("gemini_call_retries", "retries", "Retries after rate-limit errors"),
+            ("gemini_input_tokens", "input_tokens", "Prompt tokens"),
+            ("gemini_output_tokens", "output_tokens", "Generated tokens"),
+            ("gemini_cached_tokens", "cached_tokens", "Prompt tokens served from the context cache"),
+            ("gemini_cost_usd", "cost", "Estimated cost"),
+        ]:
+            lines += [f"# HELP {metric} {help_text} in the rolling window", f"# TYPE {metric} gauge"]
+            for call_type, stats in summary.items():
+                lines.append(f'{metric}{{call_type="{call_type}"}} {stats[key]}')
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        with self._lock:
+            self.records.clear()
+
+_default_store: Optional[MetricsStore] = None
+_default_store_lock = threading.Lock()
+
+def get_metrics_store() -> MetricsStore:
+    """Return the process-wide metrics store"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = MetricsStore()
+        return _default_store
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        store = get_metrics_store()
+        if self.path.rstrip("/") in ("", "/metrics"):
+            body, content_type = store.to_prometheus(), "text/plain; version=0.0.4"
+        elif self.path.rstrip("/") == "/metrics.json":
+            body, content_type = store.to_json(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        payload = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood the Streamlit log
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port: Optional[int] = None,
+                         host: str = os.getenv("METRICS_HOST", "127.0.0.1")) -> Optional[int]:
+    """Serve /metrics (Prometheus text) and /metrics.json from this process, once.
+
+    Uses METRICS_PORT when no port is given; returns the bound port, or None
+    when disabled or the port is taken (e.g. by another worker).
+    """
+    global _server
+    port = port if port is not None else int(os.getenv("METRICS_PORT", 0) or 0)
+    with _server_lock:
+        if _server is not None:
+            return _server.server_address[1]
+        if not port:
+            return None
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError:
+            return None
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server.server_address[1]
@@ -0,0 +1,64 @@
+# candidate_search.py
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from gemini_analyzer import GeminiAnalyzer
+from analysis_schema import is_complete
+
+OPTIMIZATION_FOCUSES = ["balanced", "clarity", "specificity", "structure", "completeness", "effectiveness"]
+
+def _build_candidate(analyzer: GeminiAnalyzer, prompt: str, analysis: Dict[str, Any],
+                     focus: str, variant: int) -> Dict[str, Any]:
+    """Optimize then score one candidate (runs in a worker thread)"""
+    start = time.perf_counter()
+    optimized = analyzer.optimize_prompt(prompt, analysis, focus, variant=variant)
+    candidate_analysis = analyzer.analyze_prompt(optimized)
+    return {
+        'focus': focus,
+        'variant': variant,
+        'optimized': optimized,
+        'analysis': candidate_analysis,
+        'score': candidate_analysis['overall_score'],
+        'latency': time.perf_counter() - start,
+    }
+
+def search_candidates(analyzer: GeminiAnalyzer, prompt: str, analysis: Dict[str, Any],
+                      focuses: Optional[List[str]] = None, variants_per_focus: int = 1,
+                      max_workers: int = 6) -> Dict[str, Any]:
+    """Generate and score rewrites for several focus modes concurrently.
+
+    Every candidate's optimize+analyze chain runs in its own worker, so with
+    enough workers the wall-clock time is close to one sequential
+    optimize+analyze. Returns the best candidate, the full ranking (best
+    first), how many candidates failed and the elapsed time. Candidates
+    whose rewrite or scoring failed are never ranked, so ``best`` is None
+    when none succeeded.
+    """
+    focuses = focuses or ["balanced"]
+    jobs = [(focus, variant) for focus in focuses for variant in range(variants_per_focus)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+        futures = [
+            executor.submit(_build_candidate, analyzer, prompt, analysis, focus, variant)
+            for focus, variant in jobs
+        ]
+        candidates = []
+        for future in futures:
+            try:
+                candidates.append(future.result())
+            except Exception:
+                continue  # One failed candidate should not sink the search
+
+    # Rewrites identical to the original prompt (failed optimizations) are not candidates,
+    # and neither are rewrites scored by a fallback or partly defaulted analysis
+    ranking = sorted((c for c in candidates
+                      if c['optimized'].strip() != prompt.strip() and is_complete(c['analysis'])),
+                     key=lambda c: c['score'], reverse=True)
+    return {
+        'best': ranking[0] if ranking else None,
+        'ranking': ranking,
+        'failed': len(jobs) - len(ranking),
+        'elapsed': time.perf_counter() - start,
+    }
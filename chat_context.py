@@ -0,0 +1,102 @@
+# chat_context.py
+
+from typing import Callable, Dict, List, Optional
+from rate_limiter import estimate_tokens
+
+DEFAULT_TOKEN_BUDGET = 8000
+
+SUMMARY_PROMPT = """
+Update the running summary of a conversation between a user and a VEO3 video prompt assistant.
+
+CURRENT SUMMARY:
+{summary}
+
+NEW TURNS TO FOLD IN:
+{turns}
+
+Write the updated summary in at most {max_words} words. Keep character details, scene decisions,
+user preferences and any JSON prompts the user accepted; drop small talk. Return only the summary.
+"""
+
+class ChatContext:
+    """Multi-turn conversation state kept within a token budget.
+
+    Recent turns are sent verbatim. When they exceed the budget, the oldest
+    turns are folded into a running summary; only the evicted turns are
+    summarized, so the summary is updated incrementally rather than rebuilt.
+    """
+
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET, keep_recent: int = 2,
+                 summary_words: int = 250):
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.summary_words = summary_words
+        self.summary = ""
+        self.summary_tokens = 0
+        self.turns: List[Dict] = []
+        self.turn_tokens = 0
+        self.summarized_turns = 0
+
+    def add_turn(self, role: str, content: str) -> None:
+        """Record a turn; role is "user" or "model" as in the Gemini API"""
+        tokens = estimate_tokens(content)
+        self.turns.append({'role': role, 'content': content, 'tokens': tokens})
+        self.turn_tokens += tokens
+
+    def build_contents(self, user_message: str) -> List[Dict]:
+        """Return the Gemini ``contents`` list for the next request"""
+        contents = []
+        if self.summary:
+            contents.append({'role': 'user', 'parts': [f"Summary of our conversation so far:\n{self.summary}"]})
+            contents.append({'role': 'model', 'parts': ["Got it, I'll keep that in mind."]})
+        for turn in self.turns:
+            contents.append({'role': turn['role'], 'parts': [turn['content']]})
+        contents.append({'role': 'user', 'parts': [user_message]})
+        return contents
+
+    @property
+    def total_tokens(self) -> int:
+        return self.summary_tokens + self.turn_tokens
+
+    def compact(self, summarize: Optional[Callable[[str], str]] = None) -> bool:
+        """Evict the oldest turns once over budget, folding them into the summary.
+
+        Evicts down to 75% of the budget so summarization happens once per
+        several turns instead of every turn. Without a summarizer (or if it
+        fails) evicted turns are simply dropped. Returns True if anything
+        was evicted.
+        """
+        if self.total_tokens <= self.token_budget:
+            return False
+
+        target = int(self.token_budget * 0.75)
+        evicted: List[Dict] = []
+        while self.total_tokens > target and len(self.turns) > self.keep_recent:
+            turn = self.turns.pop(0)
+            self.turn_tokens -= turn['tokens']
+            evicted.append(turn)
+        if not evicted:
+            return False
+
+        self.summarized_turns += len(evicted)
+        if summarize is not None:
+            transcript = "\n".join(f"{t['role'].upper()}: {t['content']}" for t in evicted)
+            try:
+                summary = summarize(SUMMARY_PROMPT.format(
+                    summary=self.summary or "(none yet)",
+                    turns=transcript,
+                    max_words=self.summary_words
+                )).strip()
+            except Exception:
+                summary = ""
+            if summary:
+                self.summary = summary
+                self.summary_tokens = estimate_tokens(summary)
+        return True
+
+    def clear(self) -> None:
+        self.summary = ""
+        self.summary_tokens = 0
+        self.turns = []
+        self.turn_tokens = 0
+        self.summarized_turns = 0
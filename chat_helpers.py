@@ -0,0 +1,107 @@
+# chat_helpers.py
+
+import time
+import streamlit as st
+from model_registry import get_model, check_health
+from rate_limiter import generate_content, stream_content
+from service_client import ServiceChatModel, ServiceError, service_url
+
+# Only the stats of the most recent requests are kept in the session
+MAX_REQUEST_STATS = 20
+
+def initialize_gemini(api_key=None, model_name='gemini-2.0-flash-exp', system_prompt=None):
+    """Initialize Gemini with provided API key, model and system prompt template"""
+    if service_url():
+        # The shared analysis service holds the API key, models and rate limits
+        try:
+            return ServiceChatModel(service_url(), model_name, system_prompt.name if system_prompt else None)
+        except ServiceError as e:
+            st.error(f"Failed to reach the analysis service: {str(e)}")
+            return None
+    if not api_key:
+        return None
+
+    # Reuse the process-wide model; the connection test is cached between reruns.
+    # The system prompt is set once on the model (context-cached where supported).
+    model = get_model(api_key, model_name,
+                      system_instruction=system_prompt.text if system_prompt else None,
+                      use_context_cache=True,
+                      instruction_hash=system_prompt.hash if system_prompt else None)
+    healthy, error = check_health(api_key, model_name)
+    if not healthy:
+        st.error(f"Failed to initialize Gemini: {error}")
+        return None
+    return model
+
+def record_usage(stats, response):
+    """Copy input token counts from the response metadata into stats"""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None and usage.prompt_token_count:
+        stats['input_tokens'] = usage.prompt_token_count
+        stats['cached_tokens'] = getattr(usage, 'cached_content_token_count', 0) or 0
+
+def record_request_stats(stats):
+    """Append to the session's request stats, keeping only the most recent"""
+    st.session_state.request_stats.append(stats)
+    del st.session_state.request_stats[:-MAX_REQUEST_STATS]
+
+def chat_with_gemini(model, user_message, stats=None, context=None):
+    """Send message to Gemini and get response"""
+    try:
+        # The system prompt lives on the model; earlier turns come from the budgeted context
+        contents = context.build_contents(user_message) if context is not None else user_message
+        response = generate_content(model, contents, call_type="chat")
+        if stats is not None:
+            record_usage(stats, response)
+        return response.text
+    except Exception as e:
+        if stats is not None:
+            stats['error'] = str(e)
+        return f"Error: {str(e)}"
+
+def stream_chat_with_gemini(model, user_message, stats, context=None):
+    """Yield response text as it arrives, recording timings and token usage in stats.
+
+    A failure, even after some text was sent, is recorded as ``stats['error']``.
+    """
+    start = time.perf_counter()
+    try:
+        contents = context.build_contents(user_message) if context is not None else user_message
+        for chunk in stream_content(model, contents, call_type="chat"):
+            record_usage(stats, chunk)
+            # The final chunk may carry only metadata and no text
+            if not chunk.parts:
+                continue
+            if 'first_token' not in stats:
+                stats['first_token'] = time.perf_counter() - start
+            yield chunk.text
+    except Exception as e:
+        stats['error'] = str(e)
+        yield f"\n\nError: {str(e)}" if 'first_token' in stats else f"Error: {str(e)}"
+    finally:
+        stats['total'] = time.perf_counter() - start
+
+def render_streamed_response(model, user_message, context=None):
+    """Render the streamed response incrementally and return (full text, stats)"""
+    stats = {}
+    placeholder = st.empty()
+    response = ""
+    for text in stream_chat_with_gemini(model, user_message, stats, context):
+        response += text
+        placeholder.markdown(response + "▌")
+    placeholder.markdown(response)
+    return response, stats
+
+def format_stats(stats):
+    """Describe request timings and token usage for display"""
+    parts = []
+    if 'first_token' in stats:
+        parts.append(f"first token {stats['first_token']:.2f}s")
+    parts.append(f"total {stats['total']:.2f}s")
+    if 'input_tokens' in stats:
+        parts.append(f"{stats['input_tokens']:,} input tokens ({stats['cached_tokens']:,} cached)")
+    if 'knowledge' in stats:
+        knowledge = stats['knowledge']
+        parts.append(f"{knowledge['sections']} KB sections, ~{knowledge['tokens']:,} of "
+                     f"{knowledge['kb_tokens']:,} KB tokens ({knowledge['retrieval_ms']:.2f} ms)")
+    return "⏱️ " + " · ".join(parts)
@@ -0,0 +1,220 @@
+# fake_gemini.py
+
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+from analysis_schema import LIST_FIELDS, SCORE_FIELDS
+from rate_limiter import estimate_tokens
+
+# A latency model draws one delay in seconds from the model's random generator
+Latency = Callable[[random.Random], float]
+
+def fixed_latency(seconds: float) -> Latency:
+    return lambda rng: seconds
+
+def uniform_latency(low: float, high: float) -> Latency:
+    return lambda rng: rng.uniform(low, high)
+
+def lognormal_latency(median: float, sigma: float = 0.5, cap: Optional[float] = None) -> Latency:
+    """Right-skewed latencies like real API calls: most near the median, a long tail"""
+    mu = math.log(median) if median > 0 else 0.0
+
+    def sample(rng: random.Random) -> float:
+        if median <= 0:
+            return 0.0
+        value = rng.lognormvariate(mu, sigma)
+        return min(value, cap) if cap is not None else value
+    return sample
+
+class ResourceExhausted(Exception):
+    """Stand-in for google-api-core's 429 error; rate_limiter retries it"""
+    code = 429
+
+class InternalServerError(Exception):
+    """Stand-in for a 500 from the API; not retried"""
+    code = 500
+
+class FakeUsage:
+    def __init__(self, prompt_tokens: int, output_tokens: int, cached_tokens: int = 0):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.cached_content_token_count = cached_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+class FakeTokenCount:
+    def __init__(self, total_tokens: int):
+        self.total_tokens = total_tokens
+
+class FakePart:
+    def __init__(self, text: str):
+        self.text = text
+
+class FakeResponse:
+    """Mimics the parts of GenerateContentResponse the apps read"""
+
+    def __init__(self, text: str, usage_metadata: Optional[FakeUsage] = None):
+        self.text = text
+        self.parts = [FakePart(text)] if text else []
+        self.usage_metadata = usage_metadata
+
+class FakeStream:
+    """Iterable of chunk responses; usage is set on the last chunk and on the stream once it ends"""
+
+    def __init__(self, chunks: Iterator[FakeResponse]):
+        self._chunks = chunks
+        self.usage_metadata: Optional[FakeUsage] = None
+        self.text = ""
+
+    def __iter__(self) -> Iterator[FakeResponse]:
+        for chunk in self._chunks:
+            self.text += chunk.text
+            if chunk.usage_metadata is not None:
+                self.usage_metadata = chunk.usage_metadata
+            yield chunk
+
+def _schema_fields(schema: Any) -> Dict[str, Any]:
+    return dict(getattr(schema, "__annotations__", {}) or {})
+
+def canned_json(contents: Any, schema: Any) -> str:
+    """A valid response for a TypedDict response schema, stable for the same contents"""
+    seed = int.from_bytes(hashlib.blake2b(str(contents).encode("utf-8"), digest_size=4).digest(), "little")
+    rng = random.Random(seed)
+    data: Dict[str, Any] = {}
+    for field in _schema_fields(schema):
+        if field in SCORE_FIELDS:
+            data[field] = rng.randint(4, 9)
+        elif field in LIST_FIELDS:
+            data[field] = [f"{field.replace('_', ' ')} {i + 1}" for i in range(rng.randint(1, 3))]
+        elif field == 'optimized_prompt':
+            data[field] = f"Improved version of: {str(contents)[-200:].strip()}"
+        else:
+            data[field] = f"Canned {field.replace('_', ' ')}"
+    scores = [data[field] for field in SCORE_FIELDS if field in data]
+    if 'overall_score' in data and scores:
+        data['overall_score'] = round(sum(scores) / len(scores), 1)
+    return json.dumps(data)
+
+def malformed(text: str) -> str:
+    """Damage a JSON response the way models do: code fences and a trailing comma"""
+    if text.endswith("}"):
+        text = text[:-1] + ",}"
+    return f"```json\n{text}\n```"
+
+DEFAULT_TEXT = (
+    "Here is a canned response from the fake model. It stands in for generated text so "
+    "that latency, token accounting and streaming can be exercised without an API key."
+)
+
+class FakeGenerativeModel:
+    """Offline stand-in for genai.GenerativeModel.
+
+    Latency is a sampled time to first token plus output tokens at
+    ``tokens_per_second``. Failures are injected at random (``error_rate``,
+    ``rate_limit_rate``) or scripted with ``fail_next``. Responses are
+    ``response`` (a string, or a callable of contents and generation config)
+    or, for JSON-schema requests, a canned object matching the schema.
+    """
+
+    def __init__(self, model_name: str = "fake-gemini", latency: Optional[Latency] = None,
+                 tokens_per_second: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, malformed_rate: float = 0.0,
+                 response: Union[str, Callable[[Any, Optional[Dict[str, Any]]], str], None] = None,
+                 stream_chunk_tokens: int = 8, seed: Optional[int] = None):
+        self.model_name = model_name
+        self.latency = latency or fixed_latency(0.0)
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_rate = malformed_rate
+        self.response = response
+        self.stream_chunk_tokens = stream_chunk_tokens
+        self.calls = 0
+        self.failures = 0
+        self.simulated_seconds = 0.0
+        self._scripted: List[Exception] = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def fail_next(self, error: Optional[Exception] = None, times: int = 1) -> None:
+        """Make the next ``times`` calls raise ``error`` (a 429 by default)"""
+        with self._lock:
+            self._scripted.extend([error or ResourceExhausted("429 Resource has been exhausted")] * times)
+
+    def _draw(self) -> Dict[str, Any]:
+        """Decide this call's outcome under the lock so runs are reproducible per seed"""
+        with self._lock:
+            self.calls += 1
+            if self._scripted:
+                error: Optional[Exception] = self._scripted.pop(0)
+            else:
+                roll = self._rng.random()
+                if roll < self.rate_limit_rate:
+                    error = ResourceExhausted("429 Resource has been exhausted (e.g. check quota)")
+                elif roll < self.rate_limit_rate + self.error_rate:
+                    error = InternalServerError("500 An internal error has occurred")
+                else:
+                    error = None
+            if error is not None:
+                self.failures += 1
+            return {
+                'error': error,
+                'first_token': max(0.0, self.latency(self._rng)),
+                'malformed': self._rng.random() < self.malformed_rate,
+            }
+
+    def _sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            with self._lock:
+                self.simulated_seconds += seconds
+            time.sleep(seconds)
+
+    def _generation_seconds(self, tokens: int) -> float:
+        return tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _text(self, contents: Any, generation_config: Optional[Dict[str, Any]], malformed_json: bool) -> str:
+        if callable(self.response):
+            return self.response(contents, generation_config)
+        if self.response is not None:
+            return self.response
+        schema = (generation_config or {}).get("response_schema")
+        if schema is not None:
+            text = canned_json(contents, schema)
+            return malformed(text) if malformed_json else text
+        return DEFAULT_TEXT
+
+    def generate_content(self, contents: Any, generation_config: Optional[Dict[str, Any]] = None,
+                         stream: bool = False, **kwargs) -> Union[FakeResponse, FakeStream]:
+        outcome = self._draw()
+        text = self._text(contents, generation_config, outcome['malformed'])
+        usage = FakeUsage(estimate_tokens(contents), estimate_tokens(text))
+        if stream:
+            return FakeStream(self._stream(text, usage, outcome))
+
+        self._sleep(outcome['first_token'])
+        if outcome['error'] is not None:
+            raise outcome['error']
+        self._sleep(self._generation_seconds(usage.candidates_token_count))
+        return FakeResponse(text, usage)
+
+    def _stream(self, text: str, usage: FakeUsage, outcome: Dict[str, Any]) -> Iterator[FakeResponse]:
+        # Like the real client, the request (and any error) happens on the first iteration
+        self._sleep(outcome['first_token'])
+        if outcome['error'] is not None:
+            raise outcome['error']
+        chunk_chars = max(1, self.stream_chunk_tokens * 4)
+        pieces = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)] or [""]
+        for i, piece in enumerate(pieces):
+            self._sleep(self._generation_seconds(estimate_tokens(piece)))
+            yield FakeResponse(piece, usage if i == len(pieces) - 1 else None)
+
+    def count_tokens(self, contents: Any) -> FakeTokenCount:
+        return FakeTokenCount(estimate_tokens(contents))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'calls': self.calls, 'failures': self.failures,
+                    'simulated_seconds': self.simulated_seconds}
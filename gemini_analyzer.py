@@ -0,0 +1,362 @@
+# gemini_analyzer.py
+
+import time
+import threading
+from typing import Dict, List, Optional, Any, Tuple
+import streamlit as st
+from analysis_schema import (
+    ANALYSIS_FIELDS, FIELD_DESCRIPTIONS, FUSED_FIELDS, FusedAnalysis, PromptAnalysis,
+    default_analysis, missing_fields, parse_fields, partial_schema, record_outcome
+)
+from model_registry import get_model, check_health
+from rate_limiter import generate_content
+from response_cache import ResponseCache, get_default_cache, make_cache_key
+from single_flight import get_single_flight
+
+class GeminiAnalyzer:
+    """Gemini-based prompt analyzer and optimizer"""
+    
+    # Bump whenever the analysis/optimization templates change so stale cache entries are ignored
+    TEMPLATE_VERSION = "2"
+    
+    def __init__(self, api_key: str, model_name: str = "gemini-1.5-flash",
+                 cache: Optional[ResponseCache] = None, raise_errors: bool = False,
+                 model: Any = None):
+        """Pass ``model`` (e.g. a ``FakeGenerativeModel``) to use it instead of the registry's"""
+        self.model_name = model_name
+        # Interactive use shows API errors and returns default results; batch runs need the exception
+        self.raise_errors = raise_errors
+        self.cache = cache if cache is not None else get_default_cache()
+        self.last_cache_hit = False
+        # Whether the most recent call shared the result of an identical request already in flight
+        self.last_coalesced = False
+        # Wall-clock seconds of the most recent call of each kind (analyze, optimize, fused)
+        self.last_latency: Dict[str, float] = {}
+        # Total tokens billed to this analyzer, from response usage metadata
+        self.tokens_used = 0
+        self._usage_lock = threading.Lock()
+        if model is not None:
+            self.model = model
+            return
+        # Models are shared across reruns and sessions; the health check is cached
+        self.model = get_model(api_key, model_name)
+        healthy, error = check_health(api_key, model_name)
+        if not healthy:
+            st.error(f"Failed to initialize model {model_name}: {error}")
+            st.info("Available models: gemini-1.5-flash, gemini-1.5-pro")
+            raise RuntimeError(error)
+        
+    def analyze_prompt(self, prompt: str) -> Dict[str, Any]:
+        """Analyze prompt and return scores"""
+        
+        start = time.perf_counter()
+        cache_key = make_cache_key("analyze", prompt, self.model_name,
+                                   template_version=self.TEMPLATE_VERSION)
+        cached = self.cache.get(cache_key)
+        self.last_cache_hit = cached is not None
+        self.last_coalesced = False
+        if cached is not None:
+            self._record_latency("analyze", start)
+            return cached
+        
+        # Identical requests from other sessions, tabs or service clients wait on this one call
+        try:
+            analysis, self.last_coalesced = get_single_flight().do(
+                cache_key, lambda: self._analyze_uncached(prompt, cache_key))
+        except Exception as e:
+            if self.raise_errors:
+                raise
+            st.error(f"Analysis error: {str(e)}")
+            return self._get_default_analysis(str(e))
+        finally:
+            self._record_latency("analyze", start)
+        return analysis
+    
+    def _analyze_uncached(self, prompt: str, cache_key: str) -> Dict[str, Any]:
+        """Model call behind analyze_prompt; complete results are cached"""
+        analysis_prompt = f"""
+        Analyze this prompt and score it on multiple dimensions. Be critical and honest.
+        
+        PROMPT: "{prompt}"
+        
+        Score each dimension from 0-10 and provide specific feedback:
+        
+        1. Clarity: Is the instruction clear and unambiguous?
+        2. Specificity: Does it provide enough context and constraints?
+        3. Structure: Is it well-organized with logical flow?
+        4. Completeness: Does it cover all necessary aspects?
+        5. Effectiveness: Will it likely produce the desired output?
+        
+        Also identify:
+        - Key strengths (2-3 points)
+        - Main weaknesses (2-3 points)
+        - Missing elements
+        
+        Respond in this exact JSON format:
+        {{
+            "clarity": <score>,
+            "specificity": <score>,
+            "structure": <score>,
+            "completeness": <score>,
+            "effectiveness": <score>,
+            "overall_score": <average of all scores>,
+            "strengths": ["strength1", "strength2"],
+            "weaknesses": ["weakness1", "weakness2"],
+            "missing_elements": ["element1", "element2"],
+            "one_line_summary": "Brief assessment of the prompt"
+        }}
+        """
+        
+        try:
+            analysis, missing = self._generate_structured(analysis_prompt, prompt,
+                                                          ANALYSIS_FIELDS, PromptAnalysis, "analyze")
+        except Exception:
+            record_outcome("api_error")
+            raise
+        
+        if missing:
+            # Only the unrecoverable fields fall back to defaults; don't cache a partial result
+            st.warning(f"Could not recover {', '.join(missing)} from the response; using defaults")
+            return self._fill_defaults(analysis, missing)
+        self.cache.set(cache_key, analysis)
+        return analysis
+    
+    def _generate_structured(self, request_prompt: str, prompt: str, fields: List[str],
+                             schema: type, call_type: str,
+                             optimization_focus: str = "balanced") -> Tuple[Dict[str, Any], List[str]]:
+        """Request schema-constrained JSON, salvaging partial responses.
+        
+        Returns the recovered fields and the names of any still missing after
+        a single follow-up request for just those fields. A missing rewrite is
+        re-requested with the same optimization focus and instructions.
+        """
+        response = generate_content(self.model, request_prompt, call_type=call_type,
+                                    generation_config=self._json_config(schema))
+        self._count_tokens(response)
+        data, strict = parse_fields(response.text, fields)
+        missing = missing_fields(data, fields)
+        if not missing:
+            record_outcome("clean" if strict else "salvaged")
+            return data, []
+        
+        record_outcome("rerequested")
+        try:
+            data.update(self._request_fields(prompt, missing, optimization_focus))
+        except Exception:
+            pass
+        missing = missing_fields(data, fields)
+        if missing:
+            record_outcome("defaulted")
+        return data, missing
+    
+    def _request_fields(self, prompt: str, fields: List[str],
+                        optimization_focus: str = "balanced") -> Dict[str, Any]:
+        """Ask the model for only the fields missing from an earlier response"""
+        field_list = "\n".join(f"- {field}: {FIELD_DESCRIPTIONS[field]}" for field in fields)
+        rewrite = ""
+        if 'optimized_prompt' in fields:
+            # Same rewrite instructions as the fused request, so the result is cacheable under its key
+            rewrite = f"""
+        For optimized_prompt, write an improved version of the prompt (OPTIMIZATION FOCUS: {optimization_focus}) that:
+        1. Addresses all weaknesses
+        2. Adds missing elements
+        3. Maintains the original intent
+        4. {self._focus_instruction(optimization_focus)}
+        
+        Any scores must describe the ORIGINAL prompt, not the improved one.
+        """
+        request_prompt = f"""
+        Analyze this prompt. Be critical and honest.
+        
+        PROMPT: "{prompt}"
+        {rewrite}
+        Respond with a JSON object containing ONLY these fields:
+        {field_list}
+        """
+        response = generate_content(self.model, request_prompt, call_type="rerequest",
+                                    generation_config=self._json_config(partial_schema(fields)))
+        self._count_tokens(response)
+        data, _ = parse_fields(response.text, fields)
+        return data
+    
+    def _json_config(self, schema: type) -> Dict[str, Any]:
+        """Generation config that makes the model emit JSON matching the schema"""
+        return {"response_mime_type": "application/json", "response_schema": schema}
+    
+    def _fill_defaults(self, analysis: Dict[str, Any], missing: List[str]) -> Dict[str, Any]:
+        """Fill only the missing fields from the default analysis, listing them under 'defaulted'"""
+        defaults = self._get_default_analysis(f"missing {', '.join(missing)}")
+        filled = {field: defaults[field] for field in missing if field in defaults}
+        return {**analysis, **filled, 'defaulted': list(filled)} if filled else analysis
+    
+    def _count_tokens(self, response: Any) -> None:
+        """Add the response's billed tokens to tokens_used"""
+        usage = getattr(response, "usage_metadata", None)
+        with self._usage_lock:
+            self.tokens_used += getattr(usage, "total_token_count", 0) or 0
+    
+    def _record_latency(self, kind: str, start: float) -> None:
+        """Remember how long the latest call of this kind took"""
+        self.last_latency[kind] = time.perf_counter() - start
+    
+    def _focus_instruction(self, optimization_focus: str) -> str:
+        """Describe the optimization focus for the prompt templates"""
+        return "Maximizes " + optimization_focus if optimization_focus != "balanced" else "Balances all aspects"
+    
+    def _get_default_analysis(self, error_msg: str) -> Dict[str, Any]:
+        """Return default analysis when actual analysis fails"""
+        return default_analysis(error_msg)
+    
+    def optimize_prompt(self, prompt: str, analysis: Dict[str, Any], 
+                       optimization_focus: str = "balanced", variant: int = 0) -> str:
+        """Generate optimized version of the prompt.
+        
+        Non-zero ``variant`` values ask for a deliberately different rewrite
+        (at a higher temperature) so several candidates can be compared.
+        """
+        
+        start = time.perf_counter()
+        cache_focus = optimization_focus if not variant else f"{optimization_focus}#{variant}"
+        cache_key = make_cache_key("optimize", prompt, self.model_name, cache_focus,
+                                   self.TEMPLATE_VERSION)
+        cached = self.cache.get(cache_key)
+        self.last_cache_hit = cached is not None
+        self.last_coalesced = False
+        if cached is not None:
+            self._record_latency("optimize", start)
+            return cached
+        
+        try:
+            optimized, self.last_coalesced = get_single_flight().do(
+                cache_key, lambda: self._optimize_uncached(prompt, analysis, optimization_focus, variant, cache_key))
+        except Exception as e:
+            if self.raise_errors:
+                raise
+            st.error(f"Optimization error: {str(e)}")
+            return prompt  # Return original if optimization fails
+        finally:
+            self._record_latency("optimize", start)
+        return optimized
+    
+    def _optimize_uncached(self, prompt: str, analysis: Dict[str, Any], optimization_focus: str,
+                           variant: int, cache_key: str) -> str:
+        """Model call behind optimize_prompt; the rewrite is cached"""
+        optimization_prompt = f"""
+        Improve this prompt based on the analysis provided.
+        
+        ORIGINAL PROMPT: "{prompt}"
+        
+        ANALYSIS:
+        - Clarity: {analysis['clarity']}/10
+        - Specificity: {analysis['specificity']}/10
+        - Structure: {analysis['structure']}/10
+        - Completeness: {analysis['completeness']}/10
+        - Effectiveness: {analysis['effectiveness']}/10
+        - Weaknesses: {', '.join(analysis['weaknesses'])}
+        - Missing elements: {', '.join(analysis.get('missing_elements', []))}
+        
+        OPTIMIZATION FOCUS: {optimization_focus}
+        
+        Create an improved version that:
+        1. Addresses all weaknesses
+        2. Adds missing elements
+        3. Maintains the original intent
+        4. {self._focus_instruction(optimization_focus)}
+        {f"5. Takes a noticeably different approach than a standard rewrite (alternative #{variant})" if variant else ""}
+        
+        Return ONLY the improved prompt, nothing else.
+        """
+        
+        generation_config = {"temperature": 1.0} if variant else None
+        response = generate_content(self.model, optimization_prompt, call_type="optimize",
+                                    generation_config=generation_config)
+        self._count_tokens(response)
+        optimized = response.text.strip()
+        self.cache.set(cache_key, optimized)
+        return optimized
+    
+    def analyze_and_optimize(self, prompt: str,
+                             optimization_focus: str = "balanced") -> Tuple[Dict[str, Any], str]:
+        """Analyze and optimize the prompt in a single model call"""
+        
+        start = time.perf_counter()
+        cache_key = make_cache_key("fused", prompt, self.model_name, optimization_focus,
+                                   self.TEMPLATE_VERSION)
+        cached = self.cache.get(cache_key)
+        self.last_cache_hit = cached is not None
+        self.last_coalesced = False
+        if cached is not None:
+            self._record_latency("fused", start)
+            return cached['analysis'], cached['optimized']
+        
+        try:
+            (analysis, optimized), self.last_coalesced = get_single_flight().do(
+                cache_key, lambda: self._analyze_and_optimize_uncached(prompt, optimization_focus, cache_key))
+        except Exception as e:
+            if self.raise_errors:
+                raise
+            st.error(f"Analysis error: {str(e)}")
+            return self._get_default_analysis(str(e)), prompt
+        finally:
+            self._record_latency("fused", start)
+        return analysis, optimized
+    
+    def _analyze_and_optimize_uncached(self, prompt: str, optimization_focus: str,
+                                       cache_key: str) -> Tuple[Dict[str, Any], str]:
+        """Model call behind analyze_and_optimize; complete results are cached"""
+        fused_prompt = f"""
+        Analyze this prompt, score it on multiple dimensions, then write an improved version. Be critical and honest.
+        
+        PROMPT: "{prompt}"
+        
+        Score each dimension from 0-10 and provide specific feedback:
+        
+        1. Clarity: Is the instruction clear and unambiguous?
+        2. Specificity: Does it provide enough context and constraints?
+        3. Structure: Is it well-organized with logical flow?
+        4. Completeness: Does it cover all necessary aspects?
+        5. Effectiveness: Will it likely produce the desired output?
+        
+        Also identify:
+        - Key strengths (2-3 points)
+        - Main weaknesses (2-3 points)
+        - Missing elements
+        
+        Then create an improved version of the prompt (OPTIMIZATION FOCUS: {optimization_focus}) that:
+        1. Addresses all weaknesses
+        2. Adds missing elements
+        3. Maintains the original intent
+        4. {self._focus_instruction(optimization_focus)}
+        
+        Scores must describe the ORIGINAL prompt, not the improved one.
+        
+        Respond in this exact JSON format:
+        {{
+            "clarity": <score>,
+            "specificity": <score>,
+            "structure": <score>,
+            "completeness": <score>,
+            "effectiveness": <score>,
+            "overall_score": <average of all scores>,
+            "strengths": ["strength1", "strength2"],
+            "weaknesses": ["weakness1", "weakness2"],
+            "missing_elements": ["element1", "element2"],
+            "one_line_summary": "Brief assessment of the prompt",
+            "optimized_prompt": "The complete improved prompt"
+        }}
+        """
+        
+        try:
+            analysis, missing = self._generate_structured(fused_prompt, prompt, FUSED_FIELDS,
+                                                          FusedAnalysis, "fused", optimization_focus)
+        except Exception:
+            record_outcome("api_error")
+            raise
+        
+        # Without a rewrite the original prompt is returned, but like any partial result it isn't cached
+        optimized = analysis.pop('optimized_prompt', prompt)
+        if missing:
+            st.warning(f"Could not recover {', '.join(missing)} from the response; using defaults")
+            return self._fill_defaults(analysis, missing), optimized
+        self.cache.set(cache_key, {'analysis': analysis, 'optimized': optimized})
+        return analysis, optimized
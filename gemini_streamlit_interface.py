@@ -1,7 +1,18 @@
 import streamlit as st
 import os
+import time
 from dotenv import load_dotenv
-import google.generativeai as genai
+from model_registry import get_model
+from rate_limiter import generate_content
+from prompt_registry import get_prompt_registry
+from knowledge_retrieval import DEFAULT_TOP_K, retrieve
+from call_metrics import start_metrics_server
+from service_client import ServiceChatModel, service_url
+from chat_helpers import (
+    MAX_REQUEST_STATS, chat_with_gemini, format_stats, initialize_gemini,
+    record_request_stats, render_streamed_response
+)
+from chat_context import ChatContext
 
 # Load environment variables
 load_dotenv()
@@ -13,244 +24,25 @@ st.set_page_config(
     layout="wide"
 )
 
+# Only the most recent messages are kept for display; older context lives in the summary
+MAX_DISPLAY_MESSAGES = 100
+
+# Persona used when none is selected; prompts are loaded from files by the registry
+DEFAULT_PERSONA = "VEO3 Assistant"
+
 # Initialize session state
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
-
-def load_system_prompt():
-    """Return the VEO3 system prompt"""
-    return """# VEO3 Video Generation Assistant System Prompt
-
-You are a specialized assistant for Google VEO3 video generation, designed to help users create, enhance, and optimize text prompts for high-quality video output. Your expertise encompasses the complete VEO3 prompting framework, technical specifications, and creative best practices.
-
-## Core Capabilities
-
-You excel at:
-- **Prompt Enhancement**: Transforming basic ideas into detailed, effective VEO3 prompts
-- **Structured Planning**: Using the 10-category framework to ensure comprehensive prompt coverage
-- **Technical Guidance**: Applying proper terminology for camera work, composition, and visual effects
-- **Creative Development**: Suggesting improvements for narrative, visual style, and audio integration
-- **Problem Diagnosis**: Identifying issues in prompts and providing specific solutions
-
-## The VEO3 10-Category Framework
-
-Always guide users through these essential categories when creating or enhancing prompts:
-
-### 1. Scene Description
-- Overall description of what's happening
-- Who's involved and general atmosphere
-- Main narrative or concept
-
-### 2. Visual Style
-- Overall look and feel (cinematic, realistic, animated, stylized, surreal)
-- Reference specific artistic styles or movements when appropriate
-- Consider film genres (horror, noir, documentary, etc.)
-
-### 3. Camera Movement
-- Specific camera actions: dolly shot, tracking shot, aerial zoom, static shot
-- Avoid slang terms; use clear, descriptive language
-- Consider POV shots, drone views, handheld effects
-
-### 4. Main Subject
-- Primary person, character, or object as the focus
-- Clear description of who is doing what
-- Physical characteristics and clothing details
-
-### 5. Background Setting
-- Specific location or environment
-- Time of day, weather conditions
-- Architectural or natural elements
-
-### 6. Lighting/Mood
-- Type of lighting: natural, artificial, dramatic, soft
-- Emotional tone: warm, cold, mysterious, uplifting
-- Specific lighting effects: backlighting, rim lighting, harsh shadows
-
-### 7. Audio Cue (Optional but Powerful)
-- Background music style and intensity
-- Environmental sounds (rain, traffic, birds)
-- Sound effects that sync with action
-- Specify audio in separate sentences for clarity
-
-### 8. Color Palette
-- Dominant colors or tones
-- Emotional impact through color choice
-- Examples: "pastel blue and pink tones," "muted orange warm tones," "cool blue tones"
-
-### 9. Dialogue/Background Noise (Optional)
-- Exact dialogue with speaker identification
-- Environmental audio elements
-- Specify subtitle preferences clearly
-
-### 10. Subtitles and Language
-- Explicitly state subtitle preferences
-- Cultural context implications of language choices
-- On-screen text specifications
-
-## Technical Terminology Guide
-
-### Shot Composition
-- **Framing**: single shot, two shot, over-the-shoulder shot, group shot
-- **Distance**: extreme close-up, close-up, medium shot, wide shot, extreme wide shot
-- **Angle**: eye level, high angle, low angle, worm's eye view, bird's eye view
-
-### Focus and Lens Effects
-- **Focus Types**: shallow focus, deep focus, soft focus, rack focus
-- **Lens Types**: macro lens, wide-angle lens, telephoto lens, fisheye lens
-- **Depth Effects**: shallow depth of field, bokeh effects, foreground blur
-
-### Camera Movement
-- **Static**: fixed shot, locked-off shot
-- **Moving**: dolly shot, tracking shot, pan shot, tilt shot, zoom shot
-- **Advanced**: crane shot, steadicam shot, handheld shot, gimbal shot
-
-## Audio Integration Best Practices
-
-### Sound Effects
-- Describe in separate sentences: "The audio features water splashing in the background."
-- Be specific about timing: "As the door creaks open, we hear..."
-- Mention intensity: "soft music," "dramatic orchestral score," "subtle ambient sounds"
-
-### Dialogue Guidelines
-- Use speaker identification: "The man in the red hat says..."
-- Include emotional direction: "whispers," "shouts confidently," "says nervously"
-- Specify accent or delivery style when relevant
-- Always clarify subtitle preferences
-
-### Musical Elements
-- Genre specifications: ambient electronic, orchestral, jazz, hip-hop
-- Mood descriptors: upbeat, melancholic, tense, playful
-- Sync requirements: "music syncs with character movement"
-
-## Prompt Enhancement Strategies
-
-### From Basic to Advanced
-1. **Start with Core Concept**: Identify the main subject and action
-2. **Add Visual Details**: Style, setting, lighting, color palette
-3. **Enhance Technical Specs**: Camera work, composition, focus effects
-4. **Layer Audio Elements**: Sound effects, music, dialogue
-5. **Fine-tune Atmosphere**: Mood, ambiance, cultural context
-
-### Common Issues to Address
-- **Vague Subjects**: Transform "a person" to "a young woman in vintage clothing"
-- **Missing Context**: Add specific locations and time periods
-- **Static Scenes**: Introduce camera movement and character actions
-- **Monochrome Descriptions**: Add color palette and lighting details
-- **Silent Videos**: Suggest appropriate audio elements
-
-## Negative Prompting Guidelines
-
-### Best Practices
-- ✅ Describe unwanted elements directly: "urban background, man-made structures"
-- ❌ Avoid instructive language: "don't show walls" or "no buildings"
-- ✅ Use comma-separated lists for multiple exclusions
-- ✅ Focus on visual elements that conflict with desired mood
-
-### Common Negative Prompt Categories
-- **Unwanted Backgrounds**: urban elements, indoor settings, crowds
-- **Mood Conflicts**: dark atmosphere, threatening elements, chaotic scenes  
-- **Technical Issues**: blurry footage, shaky camera, poor lighting
-- **Style Conflicts**: modern elements in historical scenes, realistic elements in cartoon styles
-
-## Creative Enhancement Techniques
-
-### Narrative Depth
-- Add character motivations and emotional stakes
-- Include environmental storytelling elements
-- Create visual metaphors and symbolic elements
-- Build tension through pacing and revelation
-
-### Visual Innovation
-- Combine unexpected elements (dinosaur musician, koala dance battle)
-- Use creative camera angles and movements
-- Experiment with time manipulation (slow motion, time-lapse)
-- Layer multiple visual effects for complexity
-
-### Audio-Visual Sync
-- Match music tempo to action pace
-- Use sound effects to enhance visual impact
-- Create dialogue that serves both story and character
-- Balance environmental audio with featured sounds
-
-## User Interaction Protocol
-
-### When Enhancing Prompts
-1. **Analyze Current Prompt**: Identify missing categories and weak elements
-2. **Ask Clarifying Questions**: Target specific gaps in the 10-category framework
-3. **Provide Options**: Offer multiple enhancement directions
-4. **Explain Improvements**: Detail why each change will improve output quality
-
-### When Creating New Prompts
-1. **Understand Core Vision**: Extract the essential concept from user input
-2. **Build Systematically**: Work through categories methodically
-3. **Suggest Creative Elements**: Propose unexpected but fitting additions
-4. **Validate Completeness**: Ensure all relevant categories are addressed
-
-### Quality Assurance Checklist
-- [ ] Subject clearly defined with specific details
-- [ ] Setting and context established
-- [ ] Camera work and composition specified
-- [ ] Visual style and mood articulated
-- [ ] Audio elements considered (if applicable)
-- [ ] Color palette and lighting described
-- [ ] Technical terminology properly used
-- [ ] Potential conflicts or contradictions resolved
-
-## Response Structure
-
-Always structure your responses to include:
-
-1. **Analysis**: Brief assessment of current prompt strengths/weaknesses
-2. **Enhanced Prompt**: Complete, polished version ready for VEO3
-3. **Key Improvements**: Explanation of major changes made
-4. **Technical Notes**: Any specific VEO3 considerations or alternatives
-5. **Optional Variations**: Additional creative directions to explore
-
-Remember: VEO3 responds best to detailed, descriptive prompts that paint a complete picture. Longer, more specific prompts generally produce better results than short, vague ones. Always prioritize clarity and specificity while maintaining natural language flow."""
-
-def initialize_gemini(api_key=None, model_name='gemini-2.0-flash-exp'):
-    """Initialize Gemini with provided API key and model"""
-    if not api_key:
-        return None
-    
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(model_name)
-        # Test the connection
-        response = model.generate_content("Hello")
-        return model
-    except Exception as e:
-        st.error(f"Failed to initialize Gemini: {str(e)}")
-        return None
-    
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        # Test the connection
-        response = model.generate_content("Hello")
-        return model
-    except Exception as e:
-        st.error(f"Failed to initialize Gemini: {str(e)}")
-        return None
-
-def chat_with_gemini(model, system_prompt, user_message):
-    """Send message to Gemini and get response"""
-    try:
-        # Combine system prompt and user message
-        full_prompt = f"{system_prompt}\n\nUser: {user_message}\n\nAssistant:"
-        
-        response = model.generate_content(full_prompt)
-        return response.text
-    except Exception as e:
-        return f"Error: {str(e)}"
+if 'request_stats' not in st.session_state:
+    st.session_state.request_stats = []
+if 'chat_context' not in st.session_state:
+    st.session_state.chat_context = ChatContext()
 
 def main():
+    start_metrics_server()  # Exposes /metrics when METRICS_PORT is set
     st.title("🎬 Gemini VEO3 Assistant")
     st.markdown("---")
     
-    # Load system prompt
-    system_prompt = load_system_prompt()
-    
     # API Key Input Section
     st.header("🔑 API Configuration")
     
@@ -280,22 +72,29 @@ def main():
             help="Get your API key from https://aistudio.google.com/"
         )
     
-    # Initialize Gemini with the provided API key and selected model
-    model = None
-    if api_key_input:
-        model = initialize_gemini(api_key_input, model_name)
-    
-    if not api_key_input:
-        st.info("Please enter your Gemini API key to start using the assistant.")
-        st.stop()
-    elif model is None:
-        st.error("Failed to initialize Gemini. Please check your API key.")
-        st.stop()
-    
     # Sidebar for configuration
     with st.sidebar:
         st.header("⚙️ Configuration")
-        st.info("Using VEO3 Assistant System Prompt")
+        
+        # System prompt persona (edits to the file are picked up without a restart)
+        prompts = get_prompt_registry()
+        personas = list(prompts.personas())
+        persona = st.selectbox(
+            "Persona",
+            personas,
+            index=personas.index(DEFAULT_PERSONA) if DEFAULT_PERSONA in personas else 0
+        )
+        try:
+            system_prompt = prompts.get(persona)
+        except (KeyError, OSError) as e:
+            st.error(f"Could not load the {persona} prompt: {str(e)}")
+            st.stop()
+        st.caption(f"📄 {os.path.basename(system_prompt.path)} · {system_prompt.hash[:8]}")
+        
+        # Only the knowledge base sections relevant to each message are sent
+        knowledge_base = st.selectbox("Knowledge base", ["None"] + list(prompts.knowledge_bases()))
+        knowledge_sections = st.slider("Sections per message", 1, 8, DEFAULT_TOP_K,
+                                       disabled=knowledge_base == "None")
         
         # Model selection
         model_name = st.selectbox(
@@ -304,6 +103,38 @@ def main():
             index=0
         )
         
+        stream_responses = st.checkbox(
+            "Stream responses",
+            value=True,
+            help="Show the answer as it is generated"
+        )
+        
+        # Latency of recent requests
+        if st.session_state.request_stats:
+            recent = st.session_state.request_stats[-MAX_REQUEST_STATS:]
+            first_tokens = [t['first_token'] for t in recent if 'first_token' in t]
+            if first_tokens:
+                st.metric("Avg. first token", f"{sum(first_tokens) / len(first_tokens):.2f}s")
+            st.metric("Avg. response time", f"{sum(t['total'] for t in recent) / len(recent):.2f}s")
+            input_tokens = [t['input_tokens'] for t in recent if 'input_tokens' in t]
+            if input_tokens:
+                st.metric("Avg. input tokens", f"{sum(input_tokens) / len(input_tokens):,.0f}")
+        
+        # Conversation memory
+        context = st.session_state.chat_context
+        context.token_budget = st.slider(
+            "Context budget (tokens)",
+            min_value=1000,
+            max_value=32000,
+            value=context.token_budget,
+            step=1000,
+            help="Older turns beyond this budget are summarized"
+        )
+        st.caption(
+            f"🧠 {len(context.turns)} recent turns · {context.total_tokens:,} tokens"
+            + (f" · {context.summarized_turns} summarized" if context.summarized_turns else "")
+        )
+        
         # API key info
         st.markdown("---")
         st.markdown("**API Key Help:**")
@@ -315,8 +146,21 @@ def main():
         st.markdown("---")
         if st.button("🗑️ Clear Chat History"):
             st.session_state.chat_history = []
+            st.session_state.chat_context.clear()
             st.rerun()
     
+    # Initialize Gemini with the provided API key and selected model
+    model = None
+    if api_key_input or service_url():
+        model = initialize_gemini(api_key_input, model_name, system_prompt)
+    
+    if not api_key_input and not service_url():
+        st.info("Please enter your Gemini API key to start using the assistant.")
+        st.stop()
+    elif model is None:
+        st.error("Failed to initialize Gemini. Please check your API key.")
+        st.stop()
+    
     # Main chat interface
     st.header("💬 Chat Interface")
     
@@ -336,15 +180,43 @@ def main():
                 "content": user_input
             })
             
+            # Attach the relevant knowledge base sections; the context keeps only the raw message
+            message, knowledge = user_input, None
+            if knowledge_base != "None":
+                message, knowledge = retrieve(knowledge_base, user_input, knowledge_sections)
+            
             # Get response from Gemini
-            with st.spinner("Generating response..."):
-                response = chat_with_gemini(model, system_prompt, user_input)
+            if stream_responses:
+                with st.chat_message("assistant"):
+                    response, stats = render_streamed_response(model, message, context)
+            else:
+                stats = {}
+                start = time.perf_counter()
+                with st.spinner("Generating response..."):
+                    response = chat_with_gemini(model, message, stats, context)
+                stats['total'] = time.perf_counter() - start
+            if knowledge:
+                stats['knowledge'] = knowledge
             
             # Add assistant response to history
+            record_request_stats(stats)
             st.session_state.chat_history.append({
                 "role": "assistant",
-                "content": response
+                "content": response,
+                "stats": stats
             })
+            del st.session_state.chat_history[:-MAX_DISPLAY_MESSAGES]
+            
+            # Remember the exchange unless it failed (possibly partway through a stream);
+            # fold old turns into the summary once over budget
+            if 'error' not in stats:
+                context.add_turn("user", user_input)
+                context.add_turn("model", response)
+                if context.total_tokens > context.token_budget:
+                    summary_model = (ServiceChatModel(service_url(), model_name) if service_url()
+                                     else get_model(api_key_input, model_name))
+                    with st.spinner("Summarizing earlier conversation..."):
+                        context.compact(lambda text: generate_content(summary_model, text, call_type="summarize").text)
             
             st.rerun()
     
@@ -360,6 +232,8 @@ def main():
             else:
                 with st.chat_message("assistant"):
                     st.write(message["content"])
+                    if message.get("stats"):
+                        st.caption(format_stats(message["stats"]))
     
 
 
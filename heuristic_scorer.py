@@ -0,0 +1,98 @@
+# heuristic_scorer.py
+
+import re
+from typing import Any, Dict, List
+
+# Prompts scoring at or below this are weak enough that a model call adds little
+CONCLUSIVE_BELOW = 3.5
+
+_ROLE = re.compile(r"\b(you are|act as|as an? (expert|senior|professional|experienced)|your role|persona)\b", re.I)
+_FORMAT = re.compile(r"\b(format|json|yaml|markdown|table|bullet|numbered list|list of|headings?|"
+                     r"respond (with|in)|output|return only|in \d+ (words|sentences|paragraphs))\b", re.I)
+_CONSTRAINT = re.compile(r"\b(must|should|avoid|don't|do not|never|always|at least|at most|no more than|"
+                         r"limit|within|only|exactly|maximum|minimum|between)\b", re.I)
+_EXAMPLE = re.compile(r"(\bfor example\b|\be\.g\.|\bexample:|\bsuch as\b|```|\binput:|\boutput:)", re.I)
+_CONTEXT = re.compile(r"\b(audience|readers?|context|background|goal|purpose|for (beginners|experts|"
+                      r"developers|students|customers)|tone|style)\b", re.I)
+_TASK_VERB = re.compile(r"^\W*(write|create|generate|explain|summari[sz]e|list|describe|analy[sz]e|compare|"
+                        r"draft|design|build|translate|rewrite|classify|extract|review|plan)\b", re.I | re.M)
+_VAGUE = re.compile(r"\b(something|stuff|things?|etc|some|maybe|whatever|kind of|sort of|good|nice)\b", re.I)
+_SECTION = re.compile(r"^\s*(#{1,6}\s|\d+[.)]\s|[-*•]\s|[A-Z][A-Za-z ]{2,30}:)", re.M)
+_NUMBER = re.compile(r"\d")
+_SENTENCE = re.compile(r"[.!?]+(\s|$)")
+
+def _clamp(value: float) -> float:
+    return round(min(10.0, max(0.0, value)), 1)
+
+def score_prompt(prompt: str) -> Dict[str, Any]:
+    """Score a prompt on the analyze_prompt dimensions without calling a model.
+
+    Deterministic and sub-millisecond; returns the same keys as
+    GeminiAnalyzer.analyze_prompt plus ``conclusive`` (True when the prompt
+    is clearly weak and a model analysis would add little) and ``source``.
+    """
+    text = prompt.strip()
+    words = len(text.split())
+    sentences = max(1, len(_SENTENCE.findall(text)))
+    sections = len(_SECTION.findall(text))
+    paragraphs = len([p for p in text.split("\n\n") if p.strip()])
+    constraints = len(_CONSTRAINT.findall(text))
+    vague = len(_VAGUE.findall(text))
+    has_role = bool(_ROLE.search(text))
+    has_format = bool(_FORMAT.search(text))
+    has_example = bool(_EXAMPLE.search(text))
+    has_context = bool(_CONTEXT.search(text))
+    has_task = bool(_TASK_VERB.search(text))
+    has_numbers = bool(_NUMBER.search(text))
+    words_per_sentence = words / sentences
+
+    clarity = (3 + 2 * has_task + (words_per_sentence <= 30) + has_format + min(2, words / 25)
+               - min(3, vague * 0.5))
+    specificity = (1 + min(3, constraints) + 1.5 * has_context + has_numbers + has_example
+                   + min(2, words / 40))
+    structure = (2 + min(3, sections) + (paragraphs > 1) + (sentences > 1) + 1.5 * has_format)
+    completeness = (1 + 2 * has_role + 2 * has_format + 2 * has_example + 1.5 * has_context
+                    + (constraints > 0) + min(1, words / 60))
+    scores = {
+        'clarity': _clamp(clarity),
+        'specificity': _clamp(specificity),
+        'structure': _clamp(structure),
+        'completeness': _clamp(completeness),
+    }
+    scores['effectiveness'] = _clamp(sum(scores.values()) / 4 + (words >= 15) - (words < 6) * 2)
+    overall = round(sum(scores.values()) / 5, 1)
+
+    strengths: List[str] = []
+    weaknesses: List[str] = []
+    missing: List[str] = []
+    checks = [
+        (has_task, "States a clear task", "No clear task verb", "Explicit task"),
+        (has_role, "Assigns a role or persona", "No role or persona", "Role/persona"),
+        (has_format, "Specifies the output format", "Output format not specified", "Output format"),
+        (constraints > 0, "Includes constraints", "No constraints or requirements", "Constraints"),
+        (has_example, "Provides examples", "No examples", "Examples"),
+        (has_context, "Gives audience or context", "Missing audience/context", "Audience and context"),
+        (sections > 0, "Organized into sections", "Unstructured single block", "Sections or steps"),
+    ]
+    for present, strength, weakness, element in checks:
+        if present:
+            strengths.append(strength)
+        else:
+            weaknesses.append(weakness)
+            missing.append(element)
+    if words < 10:
+        weaknesses.insert(0, f"Very short ({words} words)")
+    if vague:
+        weaknesses.append(f"Vague wording ({vague} instances)")
+
+    return {
+        **scores,
+        'overall_score': overall,
+        'strengths': strengths[:3] or ["Concise"],
+        'weaknesses': weaknesses[:3],
+        'missing_elements': missing,
+        'one_line_summary': f"Heuristic estimate from {words} words: "
+                            f"{len(strengths)} of {len(checks)} prompt elements present",
+        'conclusive': overall <= CONCLUSIVE_BELOW,
+        'source': 'heuristic',
+    }
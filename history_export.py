@@ -0,0 +1,187 @@
+# history_export.py
+
+import io
+import csv
+import json
+from datetime import datetime
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional
+from history_store import METRICS, HistoryStore
+
+# Display name -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    "NDJSON": ("ndjson", "application/x-ndjson"),
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+IMPORT_EXTENSIONS = {"ndjson": "ndjson", "jsonl": "ndjson", "json": "json", "csv": "csv", "parquet": "parquet"}
+
+CSV_COLUMNS = ['timestamp', 'prompt', 'optimized', 'overall_score'] + METRICS + ['one_line_summary']
+
+PARQUET_COMPRESSION = "zstd"
+
+Progress = Optional[Callable[[int], None]]
+
+def _parse_record(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Restore an exported record to the shape the store expects"""
+    data.pop('id', None)
+    if isinstance(data.get('timestamp'), str):
+        try:
+            data['timestamp'] = datetime.fromisoformat(data['timestamp'])
+        except ValueError:
+            data['timestamp'] = None
+    return data
+
+def _csv_row(record: Dict[str, Any]) -> List[Any]:
+    analysis = record['analysis']
+    return [record.get('timestamp'), record['prompt'], record.get('optimized', ''),
+            analysis['overall_score'], *[analysis.get(metric) for metric in METRICS],
+            analysis.get('one_line_summary', '')]
+
+def write_ndjson(store: HistoryStore, out: IO[bytes], batch_size: int = 500, progress: Progress = None) -> int:
+    """Write one JSON record per line, copying stored payloads without re-encoding them"""
+    written = 0
+    lines: List[str] = []
+    for record_id, payload in store.iter_serialized(batch_size):
+        lines.append(payload)
+        written += 1
+        if len(lines) >= batch_size:
+            out.write(("\n".join(lines) + "\n").encode("utf-8"))
+            lines = []
+            if progress:
+                progress(written)
+    if lines:
+        out.write(("\n".join(lines) + "\n").encode("utf-8"))
+    if progress:
+        progress(written)
+    return written
+
+def write_csv(store: HistoryStore, out: IO[bytes], batch_size: int = 500, progress: Progress = None) -> int:
+    """Write the scores table as CSV, one batch of rows at a time"""
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+    writer = csv.writer(text)
+    writer.writerow(CSV_COLUMNS)
+    written = 0
+    rows: List[List[Any]] = []
+    for record in store.iter_records(batch_size):
+        rows.append(_csv_row(record))
+        written += 1
+        if len(rows) >= batch_size:
+            writer.writerows(rows)
+            rows = []
+            if progress:
+                progress(written)
+    writer.writerows(rows)
+    text.detach()  # Leave the underlying stream open for the caller
+    if progress:
+        progress(written)
+    return written
+
+def _parquet_schema():
+    import pyarrow as pa
+    return pa.schema(
+        [('timestamp', pa.string()), ('prompt', pa.string()), ('optimized', pa.string()),
+         ('overall_score', pa.float64())]
+        + [(metric, pa.float64()) for metric in METRICS]
+        + [('record', pa.string())]
+    )
+
+def write_parquet(store: HistoryStore, out: IO[bytes], batch_size: int = 2000, progress: Progress = None) -> int:
+    """Write a zstd-compressed Parquet file with score columns and the full record as JSON"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema()
+    written = 0
+    with pq.ParquetWriter(out, schema, compression=PARQUET_COMPRESSION) as writer:
+        columns: Dict[str, List[Any]] = {name: [] for name in schema.names}
+        for record_id, payload in store.iter_serialized(batch_size):
+            record = json.loads(payload)
+            analysis = record['analysis']
+            columns['timestamp'].append(record.get('timestamp'))
+            columns['prompt'].append(record['prompt'])
+            columns['optimized'].append(record.get('optimized'))
+            columns['overall_score'].append(analysis['overall_score'])
+            for metric in METRICS:
+                columns[metric].append(analysis.get(metric))
+            columns['record'].append(payload)
+            written += 1
+            if written % batch_size == 0:
+                writer.write_table(pa.table(columns, schema=schema))
+                columns = {name: [] for name in schema.names}
+                if progress:
+                    progress(written)
+        if columns['record']:
+            writer.write_table(pa.table(columns, schema=schema))
+    if progress:
+        progress(written)
+    return written
+
+WRITERS = {"ndjson": write_ndjson, "csv": write_csv, "parquet": write_parquet}
+
+def export_history(store: HistoryStore, out: IO[bytes], fmt: str, progress: Progress = None) -> int:
+    """Stream the whole history to a binary file in ndjson, csv or parquet format"""
+    return WRITERS[fmt](store, out, progress=progress)
+
+def _read_ndjson(source: IO[bytes], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+    for line in source:
+        line = line.strip()
+        if line:
+            batch.append(_parse_record(json.loads(line)))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _read_json(source: IO[bytes], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    # The old export format: one JSON array holding every record
+    records = json.load(source)
+    for start in range(0, len(records), batch_size):
+        yield [_parse_record(item) for item in records[start:start + batch_size]]
+
+def _read_csv(source: IO[bytes], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    text = io.TextIOWrapper(source, encoding="utf-8", newline="")
+    batch = []
+    for row in csv.DictReader(text):
+        # CSV only carries the scores, so the rest of the analysis comes back empty
+        analysis: Dict[str, Any] = {'strengths': [], 'weaknesses': [], 'missing_elements': [],
+                                    'one_line_summary': row.get('one_line_summary') or ''}
+        for column in ['overall_score'] + METRICS:
+            value = row.get(column)
+            analysis[column] = float(value) if value not in (None, '') else 0
+        record = {'prompt': row.get('prompt') or '', 'analysis': analysis, 'timestamp': row.get('timestamp')}
+        if row.get('optimized'):
+            record['optimized'] = row['optimized']
+        batch.append(_parse_record(record))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _read_parquet(source: IO[bytes], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(source).iter_batches(batch_size=batch_size, columns=['record']):
+        yield [_parse_record(json.loads(payload)) for payload in batch.column(0).to_pylist()]
+
+READERS = {"ndjson": _read_ndjson, "json": _read_json, "csv": _read_csv, "parquet": _read_parquet}
+
+def import_history(store: HistoryStore, source: IO[bytes], fmt: str, batch_size: int = 500,
+                   progress: Progress = None) -> int:
+    """Append records from an exported file to the store, one transaction per batch"""
+    imported = 0
+    for batch in READERS[fmt](source, batch_size):
+        imported += store.append_many(
+            record for record in batch
+            if record.get('prompt') and 'overall_score' in (record.get('analysis') or {})
+        )
+        if progress:
+            progress(imported)
+    return imported
+
+def detect_format(filename: str) -> Optional[str]:
+    """Import format from a file name, or None if unsupported"""
+    return IMPORT_EXTENSIONS.get(filename.rsplit(".", 1)[-1].lower())
@@ -0,0 +1,554 @@
+# history_store.py
+
+import os
+import re
+import copy
+import math
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+DEFAULT_HISTORY_PATH = os.getenv("PROMPT_HISTORY_PATH", os.path.join(".cache", "history.sqlite3"))
+# Owners not seen for this many days are swept, records and all
+RETENTION_DAYS = float(os.getenv("PROMPT_HISTORY_RETENTION_DAYS", 90))
+
+METRICS = ['clarity', 'specificity', 'structure', 'completeness', 'effectiveness']
+
+SORT_ORDERS = {
+    "Best Match": "rank, id DESC",
+    "Newest First": "id DESC",
+    "Oldest First": "id ASC",
+    "Highest Score": "overall_score DESC, id DESC",
+    "Lowest Score": "overall_score ASC, id DESC",
+}
+
+# Columns with running aggregates, and the histogram resolution used for quantiles
+AGGREGATE_COLUMNS = ['overall_score'] + METRICS
+BUCKETS_PER_POINT = 10
+
+# bm25 column weights: original prompt, optimized prompt, analysis text
+FTS_WEIGHTS = (1.0, 0.6, 0.3)
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+def _fts_query(search: str) -> str:
+    """Turn free text into an FTS5 query where every word must match as a prefix"""
+    return " ".join(f'"{term}"*' for term in _TERM.findall(search))
+
+def _analysis_text(record: Dict[str, Any]) -> str:
+    """Searchable text from an analysis: summary, strengths, weaknesses and missing elements"""
+    analysis = record.get('analysis') or {}
+    parts = [str(analysis.get('one_line_summary') or '')]
+    for field in ('strengths', 'weaknesses', 'missing_elements'):
+        parts.extend(str(item) for item in analysis.get(field) or [])
+    return "\n".join(part for part in parts if part)
+
+def _serialize(record: Dict[str, Any]) -> str:
+    data = dict(record)
+    if isinstance(data.get('timestamp'), datetime):
+        data['timestamp'] = data['timestamp'].isoformat()
+    data.pop('id', None)
+    return json.dumps(data, default=str)
+
+def _deserialize(record_id: int, payload: str) -> Dict[str, Any]:
+    record = json.loads(payload)
+    record['id'] = record_id
+    if isinstance(record.get('timestamp'), str):
+        try:
+            record['timestamp'] = datetime.fromisoformat(record['timestamp'])
+        except ValueError:
+            pass
+    return record
+
+def _quantile(histogram: List[Tuple[int, int]], count: int, q: float) -> Optional[float]:
+    """Nearest-rank quantile from sorted (bucket, count) pairs"""
+    if not count:
+        return None
+    rank = max(1, math.ceil(q * count))
+    seen = 0
+    for bucket, bucket_count in histogram:
+        seen += bucket_count
+        if seen >= rank:
+            return bucket / BUCKETS_PER_POINT
+    return histogram[-1][0] / BUCKETS_PER_POINT if histogram else None
+
+class HistoryStore:
+    """Append-only, SQLite-backed store of analysis records with paginated reads.
+
+    Scores are kept in their own columns so sorting, pagination and
+    aggregates run in SQLite; sessions only ever hold the page they show.
+    An FTS5 index over the original prompt, optimized prompt and analysis
+    text is kept in step with every write and gives ranked prefix search.
+    Running aggregates (count, sum, min, max, first/last and a 0.1-point
+    histogram for quantiles) are updated in the same transaction, so
+    reading them costs the same at any history size.
+
+    Every record belongs to an owner (a browser's history id in the app). A
+    store only reads, writes, aggregates and clears its own owner's records;
+    ``scoped`` gives a view for another owner that shares the connections.
+    Owners record when they were last seen so abandoned ones can be swept.
+    """
+
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH, owner: str = ""):
+        self.path = path
+        self.owner = owner
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                owner TEXT NOT NULL DEFAULT '',
+                created_at TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                optimized TEXT,
+                overall_score REAL NOT NULL,
+                {", ".join(f"{metric} REAL" for metric in METRICS)},
+                record TEXT NOT NULL
+            )
+            """
+        )
+        if 'owner' not in {row[1] for row in conn.execute("PRAGMA table_info(history)")}:
+            # Stores from before history was per session: existing records belong to no session,
+            # and the aggregates are rebuilt per owner below
+            conn.execute("ALTER TABLE history ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+            conn.execute("DROP TABLE IF EXISTS history_stats")
+            conn.execute("DROP TABLE IF EXISTS history_histogram")
+        conn.execute("DROP INDEX IF EXISTS idx_history_score")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_history_owner_score ON history(owner, overall_score)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_history_owner ON history(owner, id)")
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'history_owners'").fetchone():
+            conn.execute("CREATE TABLE IF NOT EXISTS history_owners (owner TEXT PRIMARY KEY, last_seen REAL NOT NULL)")
+            # Owners from before last-seen tracking start their retention period now
+            conn.execute(
+                "INSERT OR IGNORE INTO history_owners (owner, last_seen) SELECT DISTINCT owner, ? FROM history",
+                (time.time(),)
+            )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS history_stats (
+                owner TEXT NOT NULL,
+                name TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                total REAL NOT NULL DEFAULT 0,
+                min_value REAL,
+                max_value REAL,
+                first_value REAL,
+                last_value REAL,
+                PRIMARY KEY (owner, name)
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS history_histogram (
+                owner TEXT NOT NULL,
+                name TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (owner, name, bucket)
+            )
+            """
+        )
+        try:
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5("
+                "prompt, optimized, analysis, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+            self.full_text = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5; search falls back to a substring scan
+            self.full_text = False
+        conn.commit()
+        if self.full_text:
+            self._backfill_index()
+        self._backfill_aggregates()
+
+    def _backfill_index(self) -> None:
+        """Index records written before the index existed (for every owner)"""
+        conn = self._connect()
+        indexed = conn.execute("SELECT COUNT(*) FROM history_fts").fetchone()[0]
+        if indexed == conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]:
+            return
+        conn.execute("DELETE FROM history_fts")
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, record FROM history WHERE id > ? ORDER BY id LIMIT 500", (last_id,)
+            ).fetchall()
+            if not rows:
+                break
+            for record_id, payload in rows:
+                self._index(conn, record_id, _deserialize(record_id, payload))
+            last_id = rows[-1][0]
+        conn.commit()
+
+    def _backfill_aggregates(self) -> None:
+        """Build the running aggregates for records written before they existed"""
+        conn = self._connect()
+        tracked = conn.execute("SELECT SUM(count) FROM history_stats WHERE name = 'overall_score'").fetchone()[0]
+        if (tracked or 0) == conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]:
+            return
+        conn.execute("DELETE FROM history_stats")
+        conn.execute("DELETE FROM history_histogram")
+        rows = conn.execute(f"SELECT owner, {', '.join(AGGREGATE_COLUMNS)} FROM history ORDER BY id")
+        for owner, *scores in rows.fetchall():
+            self._add_scores(conn, owner, dict(zip(AGGREGATE_COLUMNS, scores)))
+        conn.commit()
+
+    def _rebuild_aggregates(self, conn: sqlite3.Connection, owner: str) -> None:
+        conn.execute("DELETE FROM history_stats WHERE owner = ?", (owner,))
+        conn.execute("DELETE FROM history_histogram WHERE owner = ?", (owner,))
+        rows = conn.execute(f"SELECT {', '.join(AGGREGATE_COLUMNS)} FROM history WHERE owner = ? ORDER BY id",
+                            (owner,))
+        for scores in rows.fetchall():
+            self._add_scores(conn, owner, dict(zip(AGGREGATE_COLUMNS, scores)))
+
+    def scoped(self, owner: str) -> "HistoryStore":
+        """Return a view of the same store limited to ``owner``'s records"""
+        view = copy.copy(self)
+        view.owner = owner
+        return view
+
+    def _scores(self, record: Dict[str, Any]) -> Dict[str, Optional[float]]:
+        analysis = record['analysis']
+        return {column: analysis.get(column) for column in AGGREGATE_COLUMNS}
+
+    def _add_scores(self, conn: sqlite3.Connection, owner: str, scores: Dict[str, Optional[float]]) -> None:
+        """Fold one record's scores into its owner's running aggregates"""
+        for name, value in scores.items():
+            if value is None:
+                continue
+            conn.execute(
+                """
+                INSERT INTO history_stats (owner, name, count, total, min_value, max_value, first_value, last_value)
+                VALUES (?, ?, 1, ?, ?, ?, ?, ?)
+                ON CONFLICT(owner, name) DO UPDATE SET
+                    count = count + 1,
+                    total = total + excluded.total,
+                    min_value = MIN(min_value, excluded.min_value),
+                    max_value = MAX(max_value, excluded.max_value),
+                    last_value = excluded.last_value
+                """,
+                (owner, name, value, value, value, value, value)
+            )
+            conn.execute(
+                """
+                INSERT INTO history_histogram (owner, name, bucket, count) VALUES (?, ?, ?, 1)
+                ON CONFLICT(owner, name, bucket) DO UPDATE SET count = count + 1
+                """,
+                (owner, name, round(value * BUCKETS_PER_POINT))
+            )
+
+    def _replace_scores(self, conn: sqlite3.Connection, record_id: int,
+                        old: Dict[str, Optional[float]], new: Dict[str, Optional[float]]) -> None:
+        """Swap an updated record's old scores for its new ones in the running aggregates"""
+        owner = self.owner
+        is_first = conn.execute("SELECT MIN(id) FROM history WHERE owner = ?", (owner,)).fetchone()[0] == record_id
+        is_last = conn.execute("SELECT MAX(id) FROM history WHERE owner = ?", (owner,)).fetchone()[0] == record_id
+        for name in AGGREGATE_COLUMNS:
+            if old[name] == new[name] or old[name] is None or new[name] is None:
+                continue
+            conn.execute(
+                "UPDATE history_histogram SET count = count - 1 WHERE owner = ? AND name = ? AND bucket = ?",
+                (owner, name, round(old[name] * BUCKETS_PER_POINT))
+            )
+            conn.execute(
+                """
+                INSERT INTO history_histogram (owner, name, bucket, count) VALUES (?, ?, ?, 1)
+                ON CONFLICT(owner, name, bucket) DO UPDATE SET count = count + 1
+                """,
+                (owner, name, round(new[name] * BUCKETS_PER_POINT))
+            )
+            conn.execute("DELETE FROM history_histogram WHERE owner = ? AND count <= 0", (owner,))
+            # The extremes may have been the old value, so re-read them from the histogram
+            low, high = conn.execute(
+                "SELECT MIN(bucket), MAX(bucket) FROM history_histogram WHERE owner = ? AND name = ?", (owner, name)
+            ).fetchone()
+            conn.execute(
+                f"""
+                UPDATE history_stats SET total = total - ? + ?, min_value = MIN(?, ?), max_value = MAX(?, ?)
+                    {", first_value = ?" if is_first else ""} {", last_value = ?" if is_last else ""}
+                WHERE owner = ? AND name = ?
+                """,
+                [old[name], new[name], low / BUCKETS_PER_POINT, new[name], high / BUCKETS_PER_POINT, new[name],
+                 *([new[name]] if is_first else []), *([new[name]] if is_last else []), owner, name]
+            )
+
+    def _index(self, conn: sqlite3.Connection, record_id: int, record: Dict[str, Any]) -> None:
+        if not self.full_text:
+            return
+        conn.execute("DELETE FROM history_fts WHERE rowid = ?", (record_id,))
+        conn.execute(
+            "INSERT INTO history_fts (rowid, prompt, optimized, analysis) VALUES (?, ?, ?, ?)",
+            (record_id, record['prompt'], record.get('optimized') or '', _analysis_text(record))
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _columns(self, record: Dict[str, Any]) -> List[Any]:
+        analysis = record['analysis']
+        return [
+            record['prompt'],
+            record.get('optimized'),
+            analysis['overall_score'],
+            *[analysis.get(metric) for metric in METRICS],
+            _serialize(record),
+        ]
+
+    def _insert(self, conn: sqlite3.Connection, record: Dict[str, Any]) -> int:
+        timestamp = record.get('timestamp') or datetime.now()
+        cursor = conn.execute(
+            f"""
+            INSERT INTO history (owner, created_at, prompt, optimized, overall_score,
+                                 {", ".join(METRICS)}, record)
+            VALUES (?, ?, ?, ?, ?, {", ".join("?" for _ in METRICS)}, ?)
+            """,
+            [self.owner, timestamp.isoformat() if isinstance(timestamp, datetime) else str(timestamp),
+             *self._columns(record)]
+        )
+        self._index(conn, cursor.lastrowid, record)
+        self._add_scores(conn, self.owner, self._scores(record))
+        return cursor.lastrowid
+
+    def append(self, record: Dict[str, Any]) -> int:
+        """Store a record and return its id"""
+        conn = self._connect()
+        record_id = self._insert(conn, record)
+        conn.commit()
+        return record_id
+
+    def append_many(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Store several records in one transaction and return how many were written"""
+        conn = self._connect()
+        written = 0
+        for record in records:
+            self._insert(conn, record)
+            written += 1
+        conn.commit()
+        return written
+
+    def update(self, record_id: int, record: Dict[str, Any]) -> None:
+        """Replace a record's contents (e.g. once its optimized version is known)"""
+        conn = self._connect()
+        row = conn.execute(
+            f"SELECT {', '.join(AGGREGATE_COLUMNS)} FROM history WHERE id = ? AND owner = ?",
+            (record_id, self.owner)
+        ).fetchone()
+        if row is None:
+            return
+        conn.execute(
+            f"""
+            UPDATE history SET prompt = ?, optimized = ?, overall_score = ?,
+                {", ".join(f"{metric} = ?" for metric in METRICS)}, record = ?
+            WHERE id = ?
+            """,
+            [*self._columns(record), record_id]
+        )
+        self._index(conn, record_id, record)
+        self._replace_scores(conn, record_id, dict(zip(AGGREGATE_COLUMNS, row)), self._scores(record))
+        conn.commit()
+
+    def get(self, record_id: int) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT id, record FROM history WHERE id = ? AND owner = ?", (record_id, self.owner)
+        ).fetchone()
+        return _deserialize(*row) if row else None
+
+    def _where(self, search: Optional[str], min_score: Optional[float],
+               max_score: Optional[float]) -> Tuple[str, str, List[Any]]:
+        """Return the FROM clause, WHERE clause and parameters for a filtered query"""
+        source, conditions, params = "history", ["owner = ?"], []
+        query = _fts_query(search) if search and self.full_text else ""
+        if query:
+            # Join the index so bm25 rank is available for ordering. CROSS JOIN keeps the
+            # matches as the outer loop; otherwise SQLite walks the owner/score index and
+            # re-runs the MATCH for every row, which takes seconds on a large history.
+            source = (
+                "(SELECT rowid, bm25(history_fts, "
+                + ", ".join(str(w) for w in FTS_WEIGHTS)
+                + ") AS rank FROM history_fts WHERE history_fts MATCH ?) AS matches "
+                "CROSS JOIN history ON history.id = matches.rowid"
+            )
+            params.append(query)
+        params.append(self.owner)
+        if not query and search and search.strip():
+            conditions.append("(prompt LIKE ? ESCAPE '\\' OR optimized LIKE ? ESCAPE '\\')")
+            pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            params.extend([pattern, pattern])
+        if min_score is not None:
+            conditions.append("overall_score >= ?")
+            params.append(min_score)
+        if max_score is not None:
+            conditions.append("overall_score <= ?")
+            params.append(max_score)
+        return source, "WHERE " + " AND ".join(conditions), params
+
+    def count(self, search: Optional[str] = None, min_score: Optional[float] = None,
+              max_score: Optional[float] = None) -> int:
+        source, where, params = self._where(search, min_score, max_score)
+        return self._connect().execute(f"SELECT COUNT(*) FROM {source} {where}", params).fetchone()[0]
+
+    def page(self, offset: int = 0, limit: int = 20, sort_by: str = "Newest First",
+             search: Optional[str] = None, min_score: Optional[float] = None,
+             max_score: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Return one page of records; "Best Match" ranks by relevance when searching"""
+        source, where, params = self._where(search, min_score, max_score)
+        if sort_by == "Best Match" and source == "history":
+            sort_by = "Newest First"  # No search terms, so nothing to rank
+        rows = self._connect().execute(
+            f"SELECT history.id, history.record FROM {source} {where} "
+            f"ORDER BY {SORT_ORDERS[sort_by]} LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return [_deserialize(*row) for row in rows]
+
+    def iter_serialized(self, batch_size: int = 500) -> Iterator[Tuple[int, str]]:
+        """Stream (id, JSON payload) for every record, oldest first, without decoding them"""
+        last_id = 0
+        while True:
+            rows = self._connect().execute(
+                "SELECT id, record FROM history WHERE owner = ? AND id > ? ORDER BY id LIMIT ?",
+                (self.owner, last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1][0]
+
+    def iter_records(self, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """Stream every record, oldest first, without loading them all"""
+        for row in self.iter_serialized(batch_size):
+            yield _deserialize(*row)
+
+    def score_series(self) -> List[Dict[str, Any]]:
+        """Iteration number, overall score and prompt preview per record, oldest first, for charts"""
+        rows = self._connect().execute(
+            "SELECT overall_score, substr(prompt, 1, 53) FROM history WHERE owner = ? ORDER BY id", (self.owner,)
+        ).fetchall()
+        return [
+            {'iteration': i + 1, 'overall_score': score,
+             'prompt_preview': preview[:50] + '...' if len(preview) > 50 else preview}
+            for i, (score, preview) in enumerate(rows)
+        ]
+
+    def version(self) -> tuple:
+        """Cheap token that changes whenever the overall score series does (for chart caching).
+
+        It includes the owner, so two sessions with equal scores never share a cached chart.
+        """
+        row = self._connect().execute(
+            "SELECT count, total, min_value, max_value, first_value, last_value FROM history_stats "
+            "WHERE owner = ? AND name = 'overall_score'", (self.owner,)
+        ).fetchone()
+        return (self.owner, *row) if row else (self.owner, 0)
+
+    def aggregates(self, quantiles: Tuple[float, ...] = (0.5,)) -> Dict[str, Any]:
+        """Count, first/last overall score and avg/min/max/quantiles per metric, from the running aggregates"""
+        conn = self._connect()
+        rows = {
+            row[0]: row[1:]
+            for row in conn.execute(
+                "SELECT name, count, total, min_value, max_value, first_value, last_value FROM history_stats "
+                "WHERE owner = ?", (self.owner,)
+            )
+        }
+        histograms: Dict[str, List[Tuple[int, int]]] = {}
+        for name, bucket, count in conn.execute(
+            "SELECT name, bucket, count FROM history_histogram WHERE owner = ? AND count > 0 ORDER BY name, bucket",
+            (self.owner,)
+        ):
+            histograms.setdefault(name, []).append((bucket, count))
+
+        overall = rows.get('overall_score')
+        stats: Dict[str, Any] = {
+            'count': overall[0] if overall else 0,
+            'first_score': overall[4] if overall else None,
+            'last_score': overall[5] if overall else None,
+        }
+        for column in AGGREGATE_COLUMNS:
+            count, total, low, high = rows.get(column, (0, 0.0, None, None, None, None))[:4]
+            stats[column] = {
+                'avg': total / count if count else None,
+                'min': low,
+                'max': high,
+                **{f"p{round(q * 100)}": _quantile(histograms.get(column, []), count, q) for q in quantiles},
+            }
+        return stats
+
+    def clear(self) -> None:
+        """Delete this owner's records and aggregates; other owners are untouched"""
+        conn = self._connect()
+        self._delete_owner(conn, self.owner)
+        conn.commit()
+
+    def _delete_owner(self, conn: sqlite3.Connection, owner: str) -> None:
+        if self.full_text:
+            conn.execute("DELETE FROM history_fts WHERE rowid IN (SELECT id FROM history WHERE owner = ?)", (owner,))
+        conn.execute("DELETE FROM history WHERE owner = ?", (owner,))
+        conn.execute("DELETE FROM history_stats WHERE owner = ?", (owner,))
+        conn.execute("DELETE FROM history_histogram WHERE owner = ?", (owner,))
+
+    def touch(self) -> None:
+        """Mark this owner as active now, restarting its retention period"""
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO history_owners (owner, last_seen) VALUES (?, ?) "
+            "ON CONFLICT(owner) DO UPDATE SET last_seen = excluded.last_seen",
+            (self.owner, time.time())
+        )
+        conn.commit()
+
+    def claim_legacy(self) -> int:
+        """Move records stored before history had owners to this owner; returns how many moved.
+
+        Only the first owner to claim gets them, so call this for the
+        deployment's single user or first visitor, not for every session.
+        """
+        if not self.owner:
+            return 0
+        conn = self._connect()
+        moved = conn.execute("UPDATE history SET owner = ? WHERE owner = ''", (self.owner,)).rowcount
+        if moved:
+            self._rebuild_aggregates(conn, '')
+            self._rebuild_aggregates(conn, self.owner)
+            conn.execute("DELETE FROM history_owners WHERE owner = ''")
+        conn.commit()
+        return moved
+
+    def sweep(self, max_age_days: float = RETENTION_DAYS) -> List[str]:
+        """Delete every owner not seen for ``max_age_days``, with their records; returns those owners"""
+        conn = self._connect()
+        cutoff = time.time() - max_age_days * 86400
+        owners = [row[0] for row in conn.execute(
+            "SELECT owner FROM history_owners WHERE last_seen < ?", (cutoff,)
+        ).fetchall()]
+        for owner in owners:
+            self._delete_owner(conn, owner)
+            conn.execute("DELETE FROM history_owners WHERE owner = ?", (owner,))
+        conn.commit()
+        return owners
+
+_default_store: Optional[HistoryStore] = None
+_default_store_lock = threading.Lock()
+
+def get_history_store(owner: str = "") -> HistoryStore:
+    """Return a view of the process-wide history store limited to ``owner``'s records"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = HistoryStore()
+    return _default_store.scoped(owner)
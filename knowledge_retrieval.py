@@ -0,0 +1,161 @@
+# knowledge_retrieval.py
+
+import re
+import math
+import time
+import threading
+from collections import Counter
+from typing import Dict, List, Tuple
+from prompt_registry import get_prompt_registry
+from rate_limiter import estimate_tokens
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+DEFAULT_TOP_K = 3
+
+_MARKDOWN_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*$")
+_LABEL_HEADING = re.compile(r"^([A-Z][A-Z0-9 &/'’()-]+):\s*$")
+_BANNER_HEADING = re.compile(r"^([A-Z][A-Z0-9 &/'’()-]{3,})\s*$")
+_YAML_BLOCK_KEY = re.compile(r"^( {0,2})([A-Za-z_][\w-]*):\s*$")
+_SEPARATOR = re.compile(r"^\s*[=\-]{3,}\s*$")
+_TOKEN = re.compile(r"[a-z0-9$]+")
+
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in is it its me my "
+    "no not of on or our so that the their them there this to us was we what when where which "
+    "who why will with you your".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords, with plural 's' stripped"""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+class Section:
+    """A retrievable piece of a knowledge base with its heading path"""
+
+    def __init__(self, path: List[str], lines: List[str]):
+        self.path = path
+        self.title = " › ".join(path)
+        self.text = "\n".join(lines).strip("\n")
+
+    def render(self) -> str:
+        return f"[{self.title}]\n{self.text}" if self.title else self.text
+
+def split_sections(text: str) -> List[Section]:
+    """Split a knowledge base at markdown headings, UPPERCASE banners/labels and top two YAML key levels"""
+    sections: List[Section] = []
+    stack: List[Tuple[int, str]] = []
+    lines: List[str] = []
+
+    def flush():
+        if any(line.strip() for line in lines):
+            sections.append(Section([title for _, title in stack], lines))
+
+    for line in text.splitlines():
+        if _SEPARATOR.match(line):
+            continue
+        heading = _MARKDOWN_HEADING.match(line)
+        label = _LABEL_HEADING.match(line)
+        banner = _BANNER_HEADING.match(line)
+        yaml_key = _YAML_BLOCK_KEY.match(line)
+        if heading:
+            level, title, keep = len(heading.group(1)), heading.group(2), False
+        elif banner:
+            level, title, keep = 1, banner.group(1), False
+        elif label:
+            level, title, keep = 7, label.group(1), False
+        elif yaml_key:
+            # YAML keys nest under the headings; the key line stays in the text for context
+            level, title, keep = 10 + len(yaml_key.group(1)) // 2, yaml_key.group(2), True
+        else:
+            lines.append(line)
+            continue
+
+        flush()
+        lines = [line] if keep else []
+        while stack and stack[-1][0] >= level:
+            stack.pop()
+        stack.append((level, title))
+    flush()
+
+    # A parent whose children became sections leaves only its key line behind
+    return [s for s in sections if len(s.text.splitlines()) > 1 or not _YAML_BLOCK_KEY.match(s.text)]
+
+class KnowledgeIndex:
+    """In-memory BM25 index over the sections of one knowledge base"""
+
+    def __init__(self, sections: List[Section]):
+        self.sections = sections
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.lengths: List[int] = []
+        for i, section in enumerate(sections):
+            # Heading path is searchable too ("pricing", "support", ...)
+            terms = Counter(tokenize(section.title + " " + section.text))
+            self.lengths.append(sum(terms.values()))
+            for term, count in terms.items():
+                self.postings.setdefault(term, []).append((i, count))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        count = len(sections)
+        self.idf = {
+            term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+        self.total_tokens = sum(estimate_tokens(section.render()) for section in sections)
+
+    @classmethod
+    def from_text(cls, text: str) -> "KnowledgeIndex":
+        return cls(split_sections(text))
+
+    def search(self, query: str, k: int = DEFAULT_TOP_K) -> List[Tuple[float, Section]]:
+        """Top-k sections for the query by BM25 score, best first"""
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[i] / self.average_length)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(score, self.sections[i]) for i, score in best]
+
+def build_knowledge_message(user_message: str, results: List[Tuple[float, Section]]) -> str:
+    """User message prefixed with the retrieved sections, in the order they ranked"""
+    if not results:
+        return user_message
+    knowledge = "\n\n".join(section.render() for _, section in results)
+    return f"Relevant knowledge base sections:\n\n{knowledge}\n\n---\n\n{user_message}"
+
+_indexes: Dict[str, Tuple[str, KnowledgeIndex]] = {}
+_indexes_lock = threading.Lock()
+
+def get_knowledge_index(name: str) -> KnowledgeIndex:
+    """Index for a knowledge base in the prompt registry, rebuilt only when its file changes"""
+    template = get_prompt_registry().get(name)
+    with _indexes_lock:
+        cached = _indexes.get(name)
+        if cached is None or cached[0] != template.hash:
+            cached = (template.hash, KnowledgeIndex.from_text(template.text))
+            _indexes[name] = cached
+        return cached[1]
+
+def retrieve(name: str, query: str, k: int = DEFAULT_TOP_K) -> Tuple[str, Dict[str, float]]:
+    """Build the message to send for a user turn, plus retrieval stats for display"""
+    index = get_knowledge_index(name)
+    start = time.perf_counter()
+    results = index.search(query, k)
+    elapsed = time.perf_counter() - start
+    message = build_knowledge_message(query, results)
+    return message, {
+        'sections': len(results),
+        'tokens': sum(estimate_tokens(section.render()) for _, section in results),
+        'kb_tokens': index.total_tokens,
+        'retrieval_ms': elapsed * 1000,
+    }
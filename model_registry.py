@@ -0,0 +1,175 @@
+# model_registry.py
+
+import os
+import time
+import hashlib
+import datetime
+import threading
+from typing import Dict, Optional, Tuple
+import google.generativeai as genai
+from google.generativeai.client import get_default_generative_client
+from call_metrics import get_metrics_store
+from rate_limiter import base_model_name
+
+# How long a health check result is trusted before the model is probed again
+HEALTH_OK_TTL = float(os.getenv("MODEL_HEALTH_OK_TTL", 600))
+HEALTH_FAILED_TTL = float(os.getenv("MODEL_HEALTH_FAILED_TTL", 15))
+# Lifetime of server-side context caches holding system prompts
+CONTEXT_CACHE_TTL = float(os.getenv("CONTEXT_CACHE_TTL", 3600))
+
+class _ModelEntry:
+    """Cached model object plus the result of its last health check"""
+
+    def __init__(self, model: genai.GenerativeModel, expires_at: Optional[float] = None):
+        self.model = model
+        # Models bound to a context cache must be rebuilt once the cache expires
+        self.expires_at = expires_at
+        self.healthy: Optional[bool] = None
+        self.error: Optional[str] = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+_registry: Dict[Tuple[str, str, str], _ModelEntry] = {}
+_registry_lock = threading.Lock()
+# Entries are built outside _registry_lock (building may call the caching API);
+# only callers wanting the same entry wait on its build lock
+_build_locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+# genai keeps one global client configuration: anything that resolves a client
+# for a particular key (configure plus binding or caching calls) holds this lock
+_client_lock = threading.RLock()
+_configured_key_hash: Optional[str] = None
+
+def _hash_key(api_key: str) -> str:
+    """Never keep raw API keys as registry keys"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+def prompt_hash(text: str) -> str:
+    """Content hash identifying a system prompt version"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _configure(api_key: str, key_hash: str) -> None:
+    """Point the global genai client at this key; callers hold _client_lock"""
+    global _configured_key_hash
+    if _configured_key_hash != key_hash:
+        genai.configure(api_key=api_key)
+        _configured_key_hash = key_hash
+
+def _get_context_cache(model_name: str, system_instruction: str, instruction_hash: str):
+    """Find or create the server-side context cache for this system prompt.
+
+    Caches are looked up by display name first so every process and restart
+    shares one handle per prompt version. Returns None when the model or the
+    prompt size does not support context caching.
+    """
+    display_name = f"sysprompt-{instruction_hash[:16]}"
+    ttl = datetime.timedelta(seconds=CONTEXT_CACHE_TTL)
+    try:
+        for cached in genai.caching.CachedContent.list():
+            # The server reports versioned names such as models/gemini-1.5-flash-001
+            if (cached.display_name == display_name
+                    and base_model_name(cached.model) == base_model_name(model_name)):
+                cached.update(ttl=ttl)
+                return cached
+        return genai.caching.CachedContent.create(
+            model=model_name,
+            display_name=display_name,
+            system_instruction=system_instruction,
+            ttl=ttl
+        )
+    except Exception:
+        return None
+
+def _build_entry(api_key: str, key_hash: str, model_name: str, system_instruction: Optional[str],
+                 instruction_hash: str, use_context_cache: bool) -> _ModelEntry:
+    with _client_lock:
+        _configure(api_key, key_hash)
+        entry = _new_entry(model_name, system_instruction, instruction_hash, use_context_cache)
+        # Models resolve the default client lazily on their first call, by which time another
+        # session may have configured a different key; bind this key's client up front instead
+        entry.model._client = get_default_generative_client()
+        return entry
+
+def _new_entry(model_name: str, system_instruction: Optional[str], instruction_hash: str,
+               use_context_cache: bool) -> _ModelEntry:
+    if not system_instruction:
+        return _ModelEntry(genai.GenerativeModel(model_name))
+
+    if use_context_cache:
+        cached = _get_context_cache(model_name, system_instruction, instruction_hash)
+        if cached is not None:
+            # Rebuild a little before the server-side cache expires
+            return _ModelEntry(genai.GenerativeModel.from_cached_content(cached),
+                               expires_at=time.time() + CONTEXT_CACHE_TTL * 0.9)
+    # Plain system instruction: still sent per call, but as model config rather than user text
+    return _ModelEntry(genai.GenerativeModel(model_name, system_instruction=system_instruction))
+
+def _get_entry(api_key: str, model_name: str, system_instruction: Optional[str] = None,
+               use_context_cache: bool = False, instruction_hash: Optional[str] = None) -> _ModelEntry:
+    key_hash = _hash_key(api_key)
+    if not system_instruction:
+        instruction_hash = ""
+    elif instruction_hash is None:
+        instruction_hash = prompt_hash(system_instruction)
+    registry_key = (key_hash, model_name, instruction_hash)
+    with _registry_lock:
+        entry = _registry.get(registry_key)
+        if _is_fresh(entry):
+            return entry
+        build_lock = _build_locks.setdefault(registry_key, threading.Lock())
+
+    with build_lock:
+        # Another caller may have built it while this one waited
+        with _registry_lock:
+            entry = _registry.get(registry_key)
+        if _is_fresh(entry):
+            return entry
+        entry = _build_entry(api_key, key_hash, model_name, system_instruction, instruction_hash,
+                             use_context_cache)
+        with _registry_lock:
+            _registry[registry_key] = entry
+        return entry
+
+def _is_fresh(entry: Optional[_ModelEntry]) -> bool:
+    return entry is not None and (entry.expires_at is None or time.time() < entry.expires_at)
+
+def get_model(api_key: str, model_name: str, system_instruction: Optional[str] = None,
+              use_context_cache: bool = False, instruction_hash: Optional[str] = None) -> genai.GenerativeModel:
+    """Return the shared model object for this API key, model name and system prompt.
+
+    Plain models are created without a network call, so this is free on every
+    rerun. Because the registry is keyed by the prompt's content hash, editing
+    the system prompt transparently builds (and context-caches) a new model.
+    Pass ``instruction_hash`` when it is already known (e.g. from the prompt
+    registry) to skip re-hashing the prompt.
+    """
+    return _get_entry(api_key, model_name, system_instruction, use_context_cache, instruction_hash).model
+
+def check_health(api_key: str, model_name: str, force: bool = False) -> Tuple[bool, Optional[str]]:
+    """Probe the model at most once per TTL and return (healthy, error message)"""
+    entry = _get_entry(api_key, model_name)
+    with entry.lock:
+        ttl = HEALTH_OK_TTL if entry.healthy else HEALTH_FAILED_TTL
+        if not force and entry.healthy is not None and time.time() - entry.checked_at < ttl:
+            return entry.healthy, entry.error
+
+        start = time.perf_counter()
+        error = None
+        try:
+            # count_tokens validates the key and model without a billed generation
+            entry.model.count_tokens("ping")
+            entry.healthy, entry.error = True, None
+        except Exception as e:
+            error = e
+            entry.healthy, entry.error = False, str(e)
+        get_metrics_store().record("health_check", model_name, time.perf_counter() - start,
+                                   error=type(error).__name__ if error else None)
+        entry.checked_at = time.time()
+        return entry.healthy, entry.error
+
+def clear_registry() -> None:
+    """Drop every cached model (e.g. after rotating API keys)"""
+    global _configured_key_hash
+    with _registry_lock, _client_lock:
+        _registry.clear()
+        _build_locks.clear()
+        _configured_key_hash = None
@@ -0,0 +1,102 @@
+# optimization_loop.py
+
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+from gemini_analyzer import GeminiAnalyzer
+from analysis_schema import is_complete
+
+def optimize_until_converged(analyzer: GeminiAnalyzer, prompt: str,
+                             optimization_focus: str = "balanced",
+                             target_score: float = 8.5,
+                             max_iterations: int = 5,
+                             max_seconds: Optional[float] = 120,
+                             max_tokens: Optional[int] = None,
+                             min_improvement: float = 0.2,
+                             fused: bool = True) -> Iterator[Dict[str, Any]]:
+    """Run analyze -> optimize -> re-analyze until the score stops improving.
+
+    Yields one history record per iteration (prompt, analysis, optimized,
+    timestamp) as soon as it is ready, so callers can show progress. The
+    last record carries ``stop_reason`` (target_reached, plateau,
+    max_iterations, time_budget, token_budget or analysis_failed) and
+    ``best_prompt``. A failed or partly defaulted analysis is not a
+    measurement: it stops the loop with analysis_failed and an ``error``,
+    and never becomes the best prompt (``best_score`` is None if no
+    iteration was scored).
+
+    In fused mode each iteration is a single call that scores the current
+    prompt and proposes the next one; otherwise the optimize call is skipped
+    on the final iteration.
+    """
+    start = time.perf_counter()
+    tokens_start = analyzer.tokens_used
+    current = prompt
+    previous_score: Optional[float] = None
+    best_prompt, best_score = prompt, float("-inf")
+
+    for iteration in range(1, max_iterations + 1):
+        if fused:
+            analysis, optimized = analyzer.analyze_and_optimize(current, optimization_focus)
+        else:
+            analysis, optimized = analyzer.analyze_prompt(current), None
+
+        if not is_complete(analysis):
+            yield {
+                'prompt': current,
+                'analysis': analysis,
+                'timestamp': datetime.now(),
+                'iteration': iteration,
+                'elapsed': time.perf_counter() - start,
+                'tokens': analyzer.tokens_used - tokens_start,
+                'stop_reason': "analysis_failed",
+                'error': analysis.get('error') or f"missing {', '.join(analysis['defaulted'])}",
+                'best_prompt': best_prompt,
+                'best_score': best_score if best_score > float("-inf") else None,
+            }
+            return
+
+        score = analysis['overall_score']
+        if score > best_score:
+            best_prompt, best_score = current, score
+
+        elapsed = time.perf_counter() - start
+        tokens = analyzer.tokens_used - tokens_start
+        stop_reason = None
+        if score >= target_score:
+            stop_reason = "target_reached"
+        elif previous_score is not None and score - previous_score < min_improvement:
+            stop_reason = "plateau"
+        elif iteration == max_iterations:
+            stop_reason = "max_iterations"
+        elif max_seconds is not None and elapsed >= max_seconds:
+            stop_reason = "time_budget"
+        elif max_tokens is not None and tokens >= max_tokens:
+            stop_reason = "token_budget"
+
+        if optimized is None and stop_reason is None:
+            optimized = analyzer.optimize_prompt(current, analysis, optimization_focus)
+        if stop_reason is None and optimized == current:
+            # The model returned the prompt unchanged; nothing left to try
+            stop_reason = "plateau"
+
+        record: Dict[str, Any] = {
+            'prompt': current,
+            'analysis': analysis,
+            'timestamp': datetime.now(),
+            'iteration': iteration,
+            'elapsed': elapsed,
+            'tokens': tokens,
+        }
+        if optimized is not None and optimized != current:
+            record['optimized'] = optimized
+        if stop_reason:
+            record['stop_reason'] = stop_reason
+            record['best_prompt'] = best_prompt
+            record['best_score'] = best_score
+        yield record
+
+        if stop_reason:
+            return
+        previous_score = score
+        current = optimized
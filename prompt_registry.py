@@ -0,0 +1,112 @@
+# prompt_registry.py
+
+import os
+import glob
+import time
+import hashlib
+import threading
+from typing import Dict, Optional
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+PROMPTS_DIR = os.getenv("PROMPTS_DIR", os.path.join(REPO_DIR, "prompts"))
+
+# How often a template's file is re-checked for edits
+RELOAD_CHECK_SECONDS = float(os.getenv("PROMPT_RELOAD_SECONDS", 2.0))
+
+# Persona name -> template file (relative to the repo). Other .md files dropped
+# into PROMPTS_DIR are picked up as personas named after the file.
+PERSONAS = {
+    "VEO3 Assistant": "veo3-assistant-system-prompt.md",
+    "VEO3 JSON Assistant": os.path.join("prompts", "veo3-json-assistant.md"),
+    "Soleil Hair Spa Voice Agent": os.path.join("prompts", "Prompts(HAIR-SPA).md"),
+    "Motivated Seller Leads Agent": os.path.join("prompts", "Prompts(llama).md"),
+}
+
+# Knowledge bases are reference material for personas, not personas themselves
+KNOWLEDGE_BASES = {
+    "Soleil Hair Spa": os.path.join("prompts", "KB(Hair-SPA).md"),
+    "Motivated Seller Leads": os.path.join("prompts", "knowledge(leads).md"),
+}
+
+class PromptTemplate:
+    """A prompt file's text with its content hash"""
+
+    def __init__(self, name: str, path: str, text: str, mtime: float, size: int):
+        self.name = name
+        self.path = path
+        self.text = text
+        # Same hash as model_registry.prompt_hash, so it doubles as the context-cache key
+        self.hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        self.mtime = mtime
+        self.size = size
+        self.checked_at = time.monotonic()
+
+class PromptRegistry:
+    """Loads prompt files once per process and reloads them when they change on disk.
+
+    Lookups between checks return the cached template without touching the
+    file system; afterwards a single stat decides whether to re-read it, so
+    edited prompts go live without a restart or redeploy.
+    """
+
+    def __init__(self, prompts_dir: str = PROMPTS_DIR, base_dir: str = REPO_DIR,
+                 reload_check_seconds: float = RELOAD_CHECK_SECONDS):
+        self.prompts_dir = prompts_dir
+        self.base_dir = base_dir
+        self.reload_check_seconds = reload_check_seconds
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._lock = threading.Lock()
+
+    def personas(self) -> Dict[str, str]:
+        """Persona name -> file path, including unlisted files in the prompts directory"""
+        personas = {name: os.path.join(self.base_dir, path) for name, path in PERSONAS.items()}
+        known = set(personas.values()) | set(self.knowledge_bases().values())
+        for path in sorted(glob.glob(os.path.join(self.prompts_dir, "*.md"))):
+            if path not in known:
+                personas[os.path.splitext(os.path.basename(path))[0]] = path
+        return personas
+
+    def knowledge_bases(self) -> Dict[str, str]:
+        """Knowledge base name -> file path"""
+        return {name: os.path.join(self.base_dir, path) for name, path in KNOWLEDGE_BASES.items()}
+
+    def _resolve(self, name: str) -> str:
+        paths = {**self.personas(), **self.knowledge_bases()}
+        if name in paths:
+            return paths[name]
+        raise KeyError(f"Unknown prompt '{name}'. Available: {', '.join(paths)}")
+
+    def get(self, name: str) -> PromptTemplate:
+        """Return a persona or knowledge base by name, reloading it if the file changed"""
+        with self._lock:
+            template = self._templates.get(name)
+            now = time.monotonic()
+            if template is not None and now - template.checked_at < self.reload_check_seconds:
+                return template
+
+            path = template.path if template is not None else self._resolve(name)
+            stat = os.stat(path)
+            if template is not None and (stat.st_mtime, stat.st_size) == (template.mtime, template.size):
+                template.checked_at = now
+                return template
+
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            template = PromptTemplate(name, path, text, stat.st_mtime, stat.st_size)
+            self._templates[name] = template
+            return template
+
+    def clear(self) -> None:
+        with self._lock:
+            self._templates.clear()
+
+_default_registry: Optional[PromptRegistry] = None
+_default_registry_lock = threading.Lock()
+
+def get_prompt_registry() -> PromptRegistry:
+    """Return the process-wide prompt registry"""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = PromptRegistry()
+        return _default_registry
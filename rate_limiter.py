@@ -0,0 +1,342 @@
+# rate_limiter.py
+
+import os
+import re
+import time
+import random
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from call_metrics import get_metrics_store, usage_from_response
+
+# (requests per minute, tokens per minute) per model; GEMINI_RPM / GEMINI_TPM override all models
+DEFAULT_LIMITS: Dict[str, Tuple[int, int]] = {
+    "gemini-1.5-flash": (15, 1_000_000),
+    "gemini-1.5-pro": (2, 32_000),
+    "gemini-2.0-flash-exp": (10, 4_000_000),
+}
+FALLBACK_LIMITS = (15, 1_000_000)
+MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 8))
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", 4))
+# Bucket levels are kept here so every process on the machine shares one quota;
+# set GEMINI_LIMITS_PATH to an empty string for separate per-process budgets
+SHARED_LIMITS_PATH = os.getenv("GEMINI_LIMITS_PATH", os.path.join(".cache", "rate_limits.sqlite3"))
+
+def base_model_name(model_name: str) -> str:
+    """Strip the resource prefix and version suffix: 'models/gemini-1.5-flash-001' -> 'gemini-1.5-flash'"""
+    return re.sub(r"-(\d{3}|latest)$", "", model_name.rsplit("/", 1)[-1])
+
+def estimate_tokens(contents: Any) -> int:
+    """Cheap token estimate (~4 characters per token) used before the real count is known"""
+    return max(1, len(str(contents)) // 4)
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Recognize quota errors from google-api-core without importing it"""
+    if getattr(error, "code", None) == 429 or type(error).__name__ == "ResourceExhausted":
+        return True
+    message = str(error).lower()
+    return "429" in message or "quota" in message or "rate limit" in message
+
+class TokenBucket:
+    """Classic token bucket; callers hold the limiter lock"""
+
+    def __init__(self, capacity: float, per_second: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity = capacity
+        self.per_second = per_second
+        self.clock = clock
+        self.tokens = capacity
+        self.updated_at = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` tokens are available (0 if available now)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.per_second
+
+    def take(self, amount: float) -> None:
+        """Consume tokens; may go negative when reconciling an underestimate"""
+        self._refill()
+        self.tokens -= amount
+
+class LocalBudget:
+    """Requests/min and tokens/min buckets held in this process"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int,
+                 clock: Callable[[], float] = time.monotonic):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60, clock)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60, clock)
+
+    def reserve(self, estimated_tokens: int) -> float:
+        """Take one request and the estimated tokens, or return the seconds to wait first"""
+        wait = max(self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+        if wait <= 0:
+            self.requests.take(1)
+            self.tokens.take(estimated_tokens)
+        return wait
+
+    def charge(self, tokens: int) -> None:
+        """Adjust the token bucket once the real usage is known"""
+        self.tokens.take(tokens)
+
+class SharedBudget(LocalBudget):
+    """The same buckets kept in SQLite, shared by every process using the file.
+
+    Both Streamlit apps, the optimizer, batch runs and the analysis service
+    each run in their own process; with per-process buckets each would get
+    the full quota. Every reserve/charge is one short IMMEDIATE transaction,
+    and bucket times are wall-clock so they compare across processes.
+    """
+
+    def __init__(self, path: str, model_name: str, requests_per_minute: int, tokens_per_minute: int):
+        super().__init__(requests_per_minute, tokens_per_minute, clock=time.time)
+        self.path = path
+        self.model_name = model_name
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS buckets (
+                model TEXT PRIMARY KEY,
+                requests REAL NOT NULL,
+                requests_at REAL NOT NULL,
+                tokens REAL NOT NULL,
+                tokens_at REAL NOT NULL
+            )
+            """
+        )
+        now = time.time()
+        conn.execute("INSERT OR IGNORE INTO buckets VALUES (?, ?, ?, ?, ?)",
+                     (model_name, requests_per_minute, now, tokens_per_minute, now))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode so each update can open its own IMMEDIATE transaction
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _shared(self, update: Callable[[], Any]) -> Any:
+        """Run ``update`` on the buckets as stored in the file and write them back"""
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error:
+            # Budget file unusable (read-only, locked too long): keep limiting in this process
+            return update()
+        try:
+            row = conn.execute(
+                "SELECT requests, requests_at, tokens, tokens_at FROM buckets WHERE model = ?",
+                (self.model_name,)
+            ).fetchone()
+            if row is not None:
+                self.requests.tokens, self.requests.updated_at, self.tokens.tokens, self.tokens.updated_at = row
+            result = update()
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?, ?)",
+                (self.model_name, self.requests.tokens, self.requests.updated_at,
+                 self.tokens.tokens, self.tokens.updated_at)
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+            return update()
+        return result
+
+    def reserve(self, estimated_tokens: int) -> float:
+        return self._shared(lambda: LocalBudget.reserve(self, estimated_tokens))
+
+    def charge(self, tokens: int) -> None:
+        self._shared(lambda: LocalBudget.charge(self, tokens))
+
+class RateLimiter:
+    """Requests/min and tokens/min budgets plus AIMD concurrency for one model.
+
+    Concurrency grows by one slot per window of successful calls and halves
+    on every rate-limit response, so throughput settles just below quota.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int,
+                 max_concurrency: int = MAX_CONCURRENCY, min_concurrency: int = 1,
+                 max_retries: int = MAX_RETRIES, model_name: str = "default",
+                 budget: Optional[LocalBudget] = None):
+        self.model_name = model_name
+        self.budget = budget if budget is not None else LocalBudget(requests_per_minute, tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.max_retries = max_retries
+        self.in_flight = 0
+        self.calls = 0
+        self.rate_limited = 0
+        self._cond = threading.Condition()
+
+    def _acquire(self, estimated_tokens: int) -> None:
+        with self._cond:
+            while True:
+                wait = None
+                if self.in_flight < int(self.concurrency_limit):
+                    wait = self.budget.reserve(estimated_tokens)
+                    if wait <= 0:
+                        self.in_flight += 1
+                        return
+                self._cond.wait(timeout=wait)
+
+    def _release(self, rate_limited: bool = False) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self.calls += 1
+            if rate_limited:
+                # Multiplicative decrease
+                self.rate_limited += 1
+                self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+            else:
+                # Additive increase: +1 slot per concurrency_limit successes
+                self.concurrency_limit = min(self.max_concurrency,
+                                             self.concurrency_limit + 1 / self.concurrency_limit)
+            self._cond.notify_all()
+
+    def _reconcile(self, response: Any, estimated_tokens: int) -> None:
+        """Charge the real token usage reported by the API"""
+        usage = getattr(response, "usage_metadata", None)
+        actual = getattr(usage, "total_token_count", None) if usage is not None else None
+        if actual:
+            with self._cond:
+                self.budget.charge(actual - estimated_tokens)
+
+    def _acquire_timed(self, estimated_tokens: int) -> float:
+        """Acquire a slot and return the seconds spent waiting for it"""
+        start = time.perf_counter()
+        self._acquire(estimated_tokens)
+        return time.perf_counter() - start
+
+    def _record(self, call_type: str, start: float, queued: float, retries: int,
+                response: Any = None, error: Optional[Exception] = None,
+                first_token: Optional[float] = None) -> None:
+        get_metrics_store().record(
+            call_type, self.model_name, time.perf_counter() - start, queued, first_token,
+            usage_from_response(response) if response is not None else None,
+            retries, type(error).__name__ if error is not None else None
+        )
+
+    def call(self, fn: Callable[..., Any], *args,
+             estimated_tokens: int = 1, call_type: str = "other", **kwargs) -> Any:
+        """Run ``fn`` within the budgets, retrying with backoff on rate-limit errors"""
+        start = time.perf_counter()
+        queued = 0.0
+        for attempt in range(self.max_retries + 1):
+            queued += self._acquire_timed(estimated_tokens)
+            try:
+                response = fn(*args, **kwargs)
+            except Exception as e:
+                limited = is_rate_limit_error(e)
+                self._release(rate_limited=limited)
+                if not limited or attempt == self.max_retries:
+                    self._record(call_type, start, queued, attempt, error=e)
+                    raise
+                time.sleep(min(30.0, 2 ** attempt) + random.random())
+                continue
+            self._release()
+            self._reconcile(response, estimated_tokens)
+            self._record(call_type, start, queued, attempt, response=response)
+            return response
+
+    def stream(self, fn: Callable[..., Any], *args,
+               estimated_tokens: int = 1, call_type: str = "other", **kwargs) -> Iterator[Any]:
+        """Like ``call`` for streaming responses; the slot is held until the stream ends"""
+        start = time.perf_counter()
+        queued = 0.0
+        for attempt in range(self.max_retries + 1):
+            queued += self._acquire_timed(estimated_tokens)
+            try:
+                response = fn(*args, **kwargs)
+                chunks = iter(response)
+                # Errors on a stream surface with the first chunk, so fetch it inside the retry loop
+                first = next(chunks, None)
+            except Exception as e:
+                limited = is_rate_limit_error(e)
+                self._release(rate_limited=limited)
+                if not limited or attempt == self.max_retries:
+                    self._record(call_type, start, queued, attempt, error=e)
+                    raise
+                time.sleep(min(30.0, 2 ** attempt) + random.random())
+                continue
+            break
+
+        first_token = time.perf_counter() - start
+        error = None
+        try:
+            if first is not None:
+                yield first
+            yield from chunks
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._release()
+            self._record(call_type, start, queued, attempt, response=response, error=error,
+                         first_token=first_token)
+        self._reconcile(response, estimated_tokens)
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            return {
+                'concurrency_limit': self.concurrency_limit,
+                'in_flight': self.in_flight,
+                'calls': self.calls,
+                'rate_limited': self.rate_limited,
+            }
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(model_name: str) -> RateLimiter:
+    """Return the process-wide limiter for a model, drawing on the machine-wide budget"""
+    # Versioned and cached-content models report names like 'models/gemini-1.5-flash-001'
+    model_name = base_model_name(model_name)
+    with _limiters_lock:
+        limiter = _limiters.get(model_name)
+        if limiter is None:
+            rpm, tpm = DEFAULT_LIMITS.get(model_name, FALLBACK_LIMITS)
+            rpm = int(os.getenv("GEMINI_RPM", rpm))
+            tpm = int(os.getenv("GEMINI_TPM", tpm))
+            budget = None
+            if SHARED_LIMITS_PATH:
+                try:
+                    budget = SharedBudget(SHARED_LIMITS_PATH, model_name, rpm, tpm)
+                except (OSError, sqlite3.Error):
+                    pass  # Fall back to a budget for this process only
+            limiter = RateLimiter(rpm, tpm, model_name=model_name, budget=budget)
+            _limiters[model_name] = limiter
+        return limiter
+
+def generate_content(model: Any, contents: Any, call_type: str = "other", **kwargs) -> Any:
+    """Rate-limited, instrumented replacement for ``model.generate_content``"""
+    if getattr(model, "remote", False):
+        # Remote models (the analysis service) are rate limited and metered where they run
+        return model.generate_content(contents, call_type=call_type, **kwargs)
+    limiter = get_rate_limiter(getattr(model, "model_name", "default"))
+    return limiter.call(model.generate_content, contents,
+                        estimated_tokens=estimate_tokens(contents), call_type=call_type, **kwargs)
+
+def stream_content(model: Any, contents: Any, call_type: str = "other", **kwargs) -> Iterator[Any]:
+    """Rate-limited, instrumented ``model.generate_content(..., stream=True)`` yielding chunks"""
+    if getattr(model, "remote", False):
+        return iter(model.generate_content(contents, stream=True, call_type=call_type, **kwargs))
+    limiter = get_rate_limiter(getattr(model, "model_name", "default"))
+    return limiter.stream(model.generate_content, contents, stream=True,
+                          estimated_tokens=estimate_tokens(contents), call_type=call_type, **kwargs)
@@ -0,0 +1,146 @@
+# response_cache.py
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Optional
+
+# Defaults can be overridden from the environment (.env is loaded by the apps)
+DEFAULT_CACHE_PATH = os.getenv("PROMPT_CACHE_PATH", os.path.join(".cache", "prompt_cache.sqlite3"))
+DEFAULT_TTL_SECONDS = float(os.getenv("PROMPT_CACHE_TTL", 7 * 24 * 3600))
+DEFAULT_MAX_ENTRIES = int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", 5000))
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize line endings and surrounding whitespace so trivial edits hit the cache"""
+    lines = prompt.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+def make_cache_key(kind: str, prompt: str, model_name: str,
+                   focus: str = "", template_version: str = "") -> str:
+    """Hash the request identity into a fixed-size cache key"""
+    payload = json.dumps(
+        [kind, normalize_prompt(prompt), model_name, focus, template_version],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """SQLite-backed response cache with TTL and LRU eviction.
+
+    SQLite handles locking between processes, so every Streamlit worker
+    pointed at the same file shares one cache that survives restarts.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection (Streamlit runs each session in its own thread)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None when missing or expired"""
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            value, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                self.misses += 1
+                return None
+
+            # Touch the entry so LRU eviction keeps it
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            return json.loads(value)
+        except (sqlite3.Error, ValueError):
+            # A broken cache must never break analysis
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable value and evict least recently used entries"""
+        try:
+            conn = self._connect()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, default=str), now, now)
+            )
+            if self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            if self.max_entries:
+                conn.execute(
+                    """
+                    DELETE FROM responses WHERE key IN (
+                        SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.max_entries,)
+                )
+            conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def clear(self) -> None:
+        """Remove every cached response"""
+        conn = self._connect()
+        conn.execute("DELETE FROM responses")
+        conn.commit()
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+_default_cache: Optional[ResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+def get_default_cache() -> ResponseCache:
+    """Return the process-wide cache instance"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
@@ -0,0 +1,188 @@
+# service_client.py
+
+import os
+import json
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import quote
+from typing import Any, Dict, Iterator, Optional, Tuple
+from analysis_schema import default_analysis
+
+DEFAULT_TIMEOUT = float(os.getenv("PROMPT_SERVICE_TIMEOUT", 300))
+
+def service_url() -> str:
+    """PROMPT_SERVICE_URL, read on use so a .env loaded by the app applies.
+
+    When set, the apps and batch runner call the shared analysis service
+    instead of Gemini directly.
+    """
+    return os.getenv("PROMPT_SERVICE_URL", "")
+
+class ServiceError(RuntimeError):
+    """The analysis service could not be reached or rejected the request"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def rejected(self) -> bool:
+        """Whether the service refused the request itself (4xx), rather than failing it"""
+        return self.status is not None and self.status < 500
+
+def _request(base_url: str, method: str, path: str, payload: Optional[Dict[str, Any]] = None,
+             timeout: float = DEFAULT_TIMEOUT, stream: bool = False) -> Any:
+    """Send a JSON request; returns the decoded body, or the open response when streaming"""
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = urllib.request.Request(base_url.rstrip("/") + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read()).get('error', str(e))
+        except ValueError:
+            message = str(e)
+        raise ServiceError(f"{e.code}: {message}", e.code) from e
+    except OSError as e:
+        raise ServiceError(f"Analysis service unavailable at {base_url}: {e}") from e
+    if stream:
+        return response
+    with response:
+        return json.loads(response.read())
+
+class RemoteCache:
+    """The service's response cache, with the ``len`` and ``clear`` the app uses"""
+
+    def __init__(self, base_url: str, timeout: float = DEFAULT_TIMEOUT):
+        self.base_url = base_url
+        self.timeout = timeout
+
+    def __len__(self) -> int:
+        return _request(self.base_url, "GET", "/v1/cache", timeout=self.timeout)['entries']
+
+    def clear(self) -> None:
+        _request(self.base_url, "POST", "/v1/cache/clear", {}, timeout=self.timeout)
+
+class ServiceClient:
+    """Thin client with the same analysis methods and bookkeeping as ``GeminiAnalyzer``.
+
+    Like the analyzer, construction fails with a RuntimeError when the model
+    is unavailable. The service reports failed model calls as errors; they
+    come back as the analyzer's default results (with an ``error`` field),
+    or as ``ServiceError`` with ``raise_errors``. Requests the service
+    rejects as invalid (4xx) always raise, since a default result would
+    hide the bug.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, model_name: str = "gemini-1.5-flash",
+                 timeout: float = DEFAULT_TIMEOUT, raise_errors: bool = False):
+        self.base_url = base_url = base_url or service_url()
+        self.model_name = model_name
+        self.timeout = timeout
+        self.raise_errors = raise_errors
+        self.cache = RemoteCache(base_url, timeout)
+        self.last_cache_hit = False
+        self.last_coalesced = False
+        self.last_latency: Dict[str, float] = {}
+        self.tokens_used = 0
+        self._usage_lock = threading.Lock()
+        _request(base_url, "GET", f"/health?model={quote(model_name)}", timeout=timeout)
+
+    def _call(self, path: str, kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        result = _request(self.base_url, "POST", path, {**payload, 'model': self.model_name}, self.timeout)
+        self.last_cache_hit = result['cache_hit']
+        self.last_coalesced = result.get('coalesced', False)
+        if result.get('latency') is not None:
+            self.last_latency[kind] = result['latency']
+        with self._usage_lock:
+            self.tokens_used += result.get('tokens') or 0
+        return result
+
+    def analyze_prompt(self, prompt: str) -> Dict[str, Any]:
+        try:
+            return self._call("/v1/analyze", "analyze", {'prompt': prompt})['analysis']
+        except ServiceError as e:
+            if self.raise_errors or e.rejected:
+                raise
+            return default_analysis(str(e))
+
+    def optimize_prompt(self, prompt: str, analysis: Dict[str, Any],
+                        optimization_focus: str = "balanced", variant: int = 0) -> str:
+        payload = {'prompt': prompt, 'analysis': analysis, 'focus': optimization_focus, 'variant': variant}
+        try:
+            return self._call("/v1/optimize", "optimize", payload)['optimized']
+        except ServiceError as e:
+            if self.raise_errors or e.rejected:
+                raise
+            return prompt
+
+    def analyze_and_optimize(self, prompt: str,
+                             optimization_focus: str = "balanced") -> Tuple[Dict[str, Any], str]:
+        try:
+            result = self._call("/v1/analyze-optimize", "fused", {'prompt': prompt, 'focus': optimization_focus})
+        except ServiceError as e:
+            if self.raise_errors or e.rejected:
+                raise
+            return default_analysis(str(e)), prompt
+        return result['analysis'], result['optimized']
+
+class ServiceUsage:
+    def __init__(self, stats: Dict[str, Any]):
+        self.prompt_token_count = stats.get('input_tokens', 0)
+        self.cached_content_token_count = stats.get('cached_tokens', 0)
+        self.candidates_token_count = stats.get('output_tokens', 0)
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+class ServicePart:
+    def __init__(self, text: str):
+        self.text = text
+
+class ServiceResponse:
+    """Response object shaped like the Gemini client's (text, parts, usage_metadata)"""
+
+    def __init__(self, text: str, stats: Optional[Dict[str, Any]] = None):
+        self.text = text
+        self.parts = [ServicePart(text)] if text else []
+        self.usage_metadata = ServiceUsage(stats) if stats else None
+
+class ServiceChatModel:
+    """Stand-in for a persona's model whose calls run in the analysis service.
+
+    ``rate_limiter.generate_content`` and ``stream_content`` pass remote
+    models straight through: the service applies the rate limits and
+    records the call metrics.
+    """
+
+    remote = True
+
+    def __init__(self, base_url: Optional[str] = None, model_name: str = "gemini-2.0-flash-exp",
+                 persona: Optional[str] = None, timeout: float = DEFAULT_TIMEOUT):
+        self.base_url = base_url = base_url or service_url()
+        self.model_name = model_name
+        self.persona = persona
+        self.timeout = timeout
+        _request(base_url, "GET", f"/health?model={quote(model_name)}", timeout=timeout)
+
+    def generate_content(self, contents: Any, stream: bool = False, call_type: str = "chat", **kwargs) -> Any:
+        payload = {'contents': contents, 'persona': self.persona, 'model': self.model_name,
+                   'stream': stream, 'call_type': call_type}
+        if stream:
+            return self._stream(payload)
+        result = _request(self.base_url, "POST", "/v1/chat", payload, self.timeout)
+        return ServiceResponse(result['text'], result['stats'])
+
+    def _stream(self, payload: Dict[str, Any]) -> Iterator[ServiceResponse]:
+        with _request(self.base_url, "POST", "/v1/chat", payload, self.timeout, stream=True) as response:
+            for line in response:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if 'error' in item:
+                    raise ServiceError(item['error'])
+                if item.get('done'):
+                    # Metadata-only final chunk, like the Gemini client's last chunk
+                    yield ServiceResponse("", item['stats'])
+                    return
+                yield ServiceResponse(item['text'])
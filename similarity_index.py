@@ -0,0 +1,255 @@
+# similarity_index.py
+
+import os
+import re
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+from array import array
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from response_cache import normalize_prompt
+
+DEFAULT_INDEX_PATH = os.getenv("PROMPT_SIMILARITY_PATH", os.path.join(".cache", "similarity.sqlite3"))
+DEFAULT_THRESHOLD = float(os.getenv("PROMPT_SIMILARITY_THRESHOLD", 0.9))
+
+# 32 bands of 4 rows: prompts above ~0.45 estimated Jaccard usually share a bucket
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 4
+MAX_CANDIDATES = 200
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Fixed seed so signatures stay comparable across processes and restarts
+_rng = random.Random(1729)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+def _shingles(text: str) -> set:
+    """Character shingles over already lowercased, whitespace-collapsed text"""
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+def _hash64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+def minhash_signature(prompt: str) -> Tuple[int, ...]:
+    """MinHash signature of a prompt's shingle set.
+
+    Pure Python and proportional to the prompt length (tens of ms for a few
+    thousand characters), so signatures are memoized per normalized prompt:
+    the lookup and the add for one Analyze compute it once.
+    """
+    return _signature(re.sub(r"\s+", " ", normalize_prompt(prompt).lower()))
+
+@lru_cache(maxsize=256)
+def _signature(text: str) -> Tuple[int, ...]:
+    hashes = [_hash64(shingle.encode("utf-8")) for shingle in _shingles(text)]
+    return tuple(
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes) & _MAX_HASH
+        for a, b in _PERMUTATIONS
+    )
+
+def estimate_similarity(left: Tuple[int, ...], right: List[int]) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for x, y in zip(left, right) if x == y) / len(left)
+
+def _band_keys(signature: Tuple[int, ...]) -> List[int]:
+    """One signed 64-bit bucket key per band (fits an SQLite INTEGER)"""
+    keys = []
+    for band in range(BANDS):
+        rows = array("I", signature[band * ROWS:(band + 1) * ROWS]).tobytes()
+        keys.append(_hash64(bytes([band]) + rows) - (1 << 63))
+    return keys
+
+class SimilarityIndex:
+    """MinHash/LSH index of analyzed prompts for finding near-duplicates.
+
+    Signatures and LSH buckets live in SQLite, so lookups touch only the
+    prompts sharing a bucket and the index is shared by every worker.
+    Entries are scoped to the model and analysis template version, so a
+    template change never reuses analyses made with the old one, and record
+    the owner (browser session) that added them so it can remove its own.
+    Tracks how often a near-duplicate analysis was reused and roughly how
+    much model time that saved.
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH, threshold: float = DEFAULT_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self._analysis_seconds = 0.0
+        self._analysis_count = 0
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS prompts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL UNIQUE,
+                model_name TEXT NOT NULL,
+                template_version TEXT NOT NULL DEFAULT '',
+                owner TEXT NOT NULL DEFAULT '',
+                prompt TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                analysis TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(prompts)")}
+        for column in ("template_version", "owner"):
+            if column not in columns:
+                # Older indexes: existing entries match no template version, so they are never reused
+                conn.execute(f"ALTER TABLE prompts ADD COLUMN {column} TEXT NOT NULL DEFAULT ''")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (band_key INTEGER NOT NULL, prompt_id INTEGER NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_buckets_key ON buckets(band_key)")
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, prompt: str, analysis: Dict[str, Any], model_name: str,
+            template_version: str = "", owner: str = "") -> None:
+        """Index an analyzed prompt, replacing any earlier analysis of the same text.
+
+        Only add complete model analyses: whatever is indexed is served as-is to
+        later near-duplicates.
+        """
+        signature = minhash_signature(prompt)
+        key = hashlib.sha256(
+            f"{model_name}\n{template_version}\n{normalize_prompt(prompt)}".encode("utf-8")
+        ).hexdigest()
+        try:
+            conn = self._connect()
+            old = conn.execute("SELECT id FROM prompts WHERE key = ?", (key,)).fetchone()
+            if old:
+                conn.execute("DELETE FROM buckets WHERE prompt_id = ?", old)
+                conn.execute("DELETE FROM prompts WHERE id = ?", old)
+            cursor = conn.execute(
+                "INSERT INTO prompts (key, model_name, template_version, owner, prompt, signature, analysis, "
+                "created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model_name, template_version, owner, prompt, array("I", signature).tobytes(),
+                 json.dumps(analysis, default=str), time.time())
+            )
+            conn.executemany(
+                "INSERT INTO buckets (band_key, prompt_id) VALUES (?, ?)",
+                [(band_key, cursor.lastrowid) for band_key in _band_keys(signature)]
+            )
+            conn.commit()
+        except sqlite3.Error:
+            pass  # The index is an optimization; analysis results are never lost without it
+
+    def nearest(self, prompt: str, model_name: str, template_version: str = "") -> Optional[Dict[str, Any]]:
+        """Most similar previously analyzed prompt as {prompt, analysis, similarity}, or None"""
+        signature = minhash_signature(prompt)
+        band_keys = _band_keys(signature)
+        try:
+            # Filter by model and template before limiting, so other models' entries can't crowd
+            # out valid matches; prompts sharing more bands are likelier to be close, so go first
+            rows = self._connect().execute(
+                f"""
+                SELECT prompts.prompt, prompts.signature, prompts.analysis
+                FROM (
+                    SELECT prompt_id, COUNT(*) AS shared FROM buckets
+                    WHERE band_key IN ({", ".join("?" for _ in band_keys)})
+                    GROUP BY prompt_id
+                ) AS matches
+                JOIN prompts ON prompts.id = matches.prompt_id
+                WHERE prompts.model_name = ? AND prompts.template_version = ?
+                ORDER BY matches.shared DESC, prompts.id DESC
+                LIMIT {MAX_CANDIDATES}
+                """,
+                [*band_keys, model_name, template_version]
+            ).fetchall()
+        except sqlite3.Error:
+            return None
+
+        best: Optional[Dict[str, Any]] = None
+        for candidate, blob, analysis in rows:
+            stored = array("I")
+            stored.frombytes(blob)
+            similarity = estimate_similarity(signature, stored.tolist())
+            if best is None or similarity > best['similarity']:
+                best = {'prompt': candidate, 'analysis': analysis, 'similarity': similarity}
+        if best:
+            best['analysis'] = json.loads(best['analysis'])
+        return best
+
+    def reusable(self, prompt: str, model_name: str, template_version: str = "",
+                 threshold: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Nearest match if it clears the reuse threshold, counting the hit or miss"""
+        return self.reuse(self.nearest(prompt, model_name, template_version), threshold)
+
+    def reuse(self, match: Optional[Dict[str, Any]], threshold: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """``reusable`` for a match already looked up with ``nearest``"""
+        threshold = self.threshold if threshold is None else threshold
+        with self._stats_lock:
+            if match and match['similarity'] >= threshold:
+                self.hits += 1
+                self.seconds_saved += self.average_analysis_seconds()
+                return match
+            self.misses += 1
+        return None
+
+    def record_analysis_time(self, seconds: float) -> None:
+        """Record a real analysis call's latency, used to estimate time saved by reuse"""
+        with self._stats_lock:
+            self._analysis_seconds += seconds
+            self._analysis_count += 1
+
+    def average_analysis_seconds(self) -> float:
+        return self._analysis_seconds / self._analysis_count if self._analysis_count else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'seconds_saved': self.seconds_saved,
+        }
+
+    def clear(self, owner: Optional[str] = None) -> None:
+        """Remove every entry, or only those added by ``owner``"""
+        conn = self._connect()
+        if owner is None:
+            conn.execute("DELETE FROM buckets")
+            conn.execute("DELETE FROM prompts")
+        else:
+            conn.execute("DELETE FROM buckets WHERE prompt_id IN (SELECT id FROM prompts WHERE owner = ?)", (owner,))
+            conn.execute("DELETE FROM prompts WHERE owner = ?", (owner,))
+        conn.commit()
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM prompts").fetchone()[0]
+
+_default_index: Optional[SimilarityIndex] = None
+_default_index_lock = threading.Lock()
+
+def get_similarity_index() -> SimilarityIndex:
+    """Return the process-wide similarity index"""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = SimilarityIndex()
+        return _default_index
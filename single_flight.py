@@ -0,0 +1,72 @@
+# single_flight.py
+
+import copy
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait and receive a copy of its result (or its exception).
+    Keys are forgotten as soon as the call finishes, so this only removes
+    duplicates during bursts and never serves stale results; the response
+    cache handles reuse afterwards.
+    """
+
+    def __init__(self):
+        self.executed = 0
+        self.coalesced = 0
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run ``fn`` once per in-flight key; returns (result, whether it was shared)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            # Callers may mutate what they get back, so waiters never share the leader's object
+            return copy.deepcopy(flight.result), True
+
+        try:
+            flight.result = fn()
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'executed': self.executed, 'coalesced': self.coalesced, 'in_flight': len(self._flights)}
+
+_default_flights: Optional[SingleFlight] = None
+_default_flights_lock = threading.Lock()
+
+def get_single_flight() -> SingleFlight:
+    """Return the process-wide single-flight group shared by every analyzer"""
+    global _default_flights
+    with _default_flights_lock:
+        if _default_flights is None:
+            _default_flights = SingleFlight()
+        return _default_flights
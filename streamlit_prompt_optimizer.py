@@ -2,15 +2,27 @@
 
 import streamlit as st
 import os
-import json
-import time
+import re
+import uuid
+import tempfile
 from datetime import datetime
-import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
-from typing import Dict, List, Optional, Any
+from typing import TYPE_CHECKING, Dict, List, Optional, Any
 from dotenv import load_dotenv
-import google.generativeai as genai
+from gemini_analyzer import GeminiAnalyzer
+from analysis_schema import get_outcome_counts, is_complete
+from heuristic_scorer import score_prompt
+from optimization_loop import optimize_until_converged
+from candidate_search import OPTIMIZATION_FOCUSES, search_candidates
+from history_store import METRICS, HistoryStore, get_history_store
+from similarity_index import DEFAULT_THRESHOLD, get_similarity_index
+from single_flight import get_single_flight
+from call_metrics import get_metrics_store, start_metrics_server
+from service_client import ServiceClient, ServiceError, service_url
+from history_export import EXPORT_FORMATS, IMPORT_EXTENSIONS, detect_format, export_history, import_history
+
+# pandas and plotly are imported on first use so cold starts and idle workers don't pay for them
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
 
 # Load environment variables
 load_dotenv()
@@ -23,137 +35,50 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# History lives on disk; sessions only hold the page they display
+HISTORY_PAGE_SIZE = 20
+# Pins every visitor to one history, e.g. for a single-user deployment
+HISTORY_OWNER = os.getenv("PROMPT_HISTORY_OWNER", "")
+HISTORY_ID = re.compile(r"^[0-9a-f]{32}$")
+
+def resolve_history_owner() -> str:
+    """Stable id of this browser's history, kept in the page URL (``?history=...``).
+
+    Reloads, bookmarks and server restarts keep the same history; anyone
+    given the link sees it too.
+    """
+    if HISTORY_OWNER:
+        return HISTORY_OWNER
+    owner = st.query_params.get("history", "")
+    if not HISTORY_ID.match(owner):
+        owner = uuid.uuid4().hex
+        st.query_params["history"] = owner
+    return owner
+
 # Initialize session state
-if 'history' not in st.session_state:
-    st.session_state.history = []
+if 'history_page' not in st.session_state:
+    st.session_state.history_page = 0
 if 'current_analysis' not in st.session_state:
     st.session_state.current_analysis = None
 if 'gemini_configured' not in st.session_state:
     st.session_state.gemini_configured = False
+if 'history_owner' not in st.session_state:
+    # Each browser sees and clears only its own history in the shared store
+    st.session_state.history_owner = resolve_history_owner()
+    _history = get_history_store(st.session_state.history_owner)
+    _history.touch()
+    # Records from before history had owners go to the first browser to open the app
+    _history.claim_legacy()
+    for _owner in _history.sweep():
+        get_similarity_index().clear(_owner)
 
-class GeminiAnalyzer:
-    """Gemini-based prompt analyzer and optimizer"""
-    
-    def __init__(self, api_key: str, model_name: str = "gemini-1.5-flash"):
-        genai.configure(api_key=api_key)
-        try:
-            self.model = genai.GenerativeModel(model_name)
-            # Test the model
-            self.model.generate_content("test")
-        except Exception as e:
-            st.error(f"Failed to initialize model {model_name}: {str(e)}")
-            st.info("Available models: gemini-1.5-flash, gemini-1.5-pro")
-            raise e
-        
-    def analyze_prompt(self, prompt: str) -> Dict[str, Any]:
-        """Analyze prompt and return scores"""
-        
-        analysis_prompt = f"""
-        Analyze this prompt and score it on multiple dimensions. Be critical and honest.
-        
-        PROMPT: "{prompt}"
-        
-        Score each dimension from 0-10 and provide specific feedback:
-        
-        1. Clarity: Is the instruction clear and unambiguous?
-        2. Specificity: Does it provide enough context and constraints?
-        3. Structure: Is it well-organized with logical flow?
-        4. Completeness: Does it cover all necessary aspects?
-        5. Effectiveness: Will it likely produce the desired output?
-        
-        Also identify:
-        - Key strengths (2-3 points)
-        - Main weaknesses (2-3 points)
-        - Missing elements
-        
-        Respond in this exact JSON format:
-        {{
-            "clarity": <score>,
-            "specificity": <score>,
-            "structure": <score>,
-            "completeness": <score>,
-            "effectiveness": <score>,
-            "overall_score": <average of all scores>,
-            "strengths": ["strength1", "strength2"],
-            "weaknesses": ["weakness1", "weakness2"],
-            "missing_elements": ["element1", "element2"],
-            "one_line_summary": "Brief assessment of the prompt"
-        }}
-        """
-        
-        try:
-            response = self.model.generate_content(analysis_prompt)
-            # Clean the response text
-            response_text = response.text.strip()
-            # Remove markdown code blocks if present
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
-            response_text = response_text.strip()
-            
-            analysis = json.loads(response_text)
-            return analysis
-        except json.JSONDecodeError as e:
-            st.warning(f"Failed to parse JSON response: {str(e)}")
-            return self._get_default_analysis("JSON parsing failed")
-        except Exception as e:
-            st.error(f"Analysis error: {str(e)}")
-            return self._get_default_analysis(str(e))
-    
-    def _get_default_analysis(self, error_msg: str) -> Dict[str, Any]:
-        """Return default analysis when actual analysis fails"""
-        return {
-            "clarity": 5,
-            "specificity": 5,
-            "structure": 5,
-            "completeness": 5,
-            "effectiveness": 5,
-            "overall_score": 5,
-            "strengths": ["Could not analyze"],
-            "weaknesses": ["Analysis failed"],
-            "missing_elements": [],
-            "one_line_summary": f"Error: {error_msg}"
-        }
-    
-    def optimize_prompt(self, prompt: str, analysis: Dict[str, Any], 
-                       optimization_focus: str = "balanced") -> str:
-        """Generate optimized version of the prompt"""
-        
-        optimization_prompt = f"""
-        Improve this prompt based on the analysis provided.
-        
-        ORIGINAL PROMPT: "{prompt}"
-        
-        ANALYSIS:
-        - Clarity: {analysis['clarity']}/10
-        - Specificity: {analysis['specificity']}/10
-        - Structure: {analysis['structure']}/10
-        - Completeness: {analysis['completeness']}/10
-        - Effectiveness: {analysis['effectiveness']}/10
-        - Weaknesses: {', '.join(analysis['weaknesses'])}
-        - Missing elements: {', '.join(analysis.get('missing_elements', []))}
-        
-        OPTIMIZATION FOCUS: {optimization_focus}
-        
-        Create an improved version that:
-        1. Addresses all weaknesses
-        2. Adds missing elements
-        3. Maintains the original intent
-        4. {"Maximizes " + optimization_focus if optimization_focus != "balanced" else "Balances all aspects"}
-        
-        Return ONLY the improved prompt, nothing else.
-        """
-        
-        try:
-            response = self.model.generate_content(optimization_prompt)
-            return response.text.strip()
-        except Exception as e:
-            st.error(f"Optimization error: {str(e)}")
-            return prompt  # Return original if optimization fails
+# Past this many points the progression chart is downsampled
+HISTORY_CHART_MAX_POINTS = 500
 
-def create_score_chart(scores: Dict[str, float]) -> go.Figure:
+@st.cache_data(max_entries=64, show_spinner=False)
+def create_score_chart(scores: Dict[str, float]) -> "go.Figure":
     """Create radar chart for scores"""
+    import plotly.graph_objects as go
     
     categories = ['Clarity', 'Specificity', 'Structure', 'Completeness', 'Effectiveness']
     values = [scores.get(cat.lower(), 0) for cat in categories]
@@ -177,27 +102,56 @@ def create_score_chart(scores: Dict[str, float]) -> go.Figure:
     
     return fig
 
-def create_history_chart(history: List[Dict]) -> go.Figure:
+def downsample_points(points: List[Dict], threshold: int) -> List[Dict]:
+    """Largest-Triangle-Three-Buckets downsampling of score points, keeping the first and last"""
+    if threshold < 3 or len(points) <= threshold:
+        return points
+    
+    sampled = [points[0]]
+    bucket_size = (len(points) - 2) / (threshold - 2)
+    previous = points[0]
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        # Average of the next bucket is the third corner of the triangle
+        next_bucket = points[end:min(int((i + 2) * bucket_size) + 1, len(points) - 1)] or [points[-1]]
+        avg_x = sum(p['iteration'] for p in next_bucket) / len(next_bucket)
+        avg_y = sum(p['overall_score'] for p in next_bucket) / len(next_bucket)
+        
+        best, best_area = None, -1.0
+        for point in points[start:end]:
+            area = abs(
+                (previous['iteration'] - avg_x) * (point['overall_score'] - previous['overall_score'])
+                - (previous['iteration'] - point['iteration']) * (avg_y - previous['overall_score'])
+            )
+            if area > best_area:
+                best, best_area = point, area
+        sampled.append(best)
+        previous = best
+    sampled.append(points[-1])
+    return sampled
+
+def create_history_chart(points: List[Dict]) -> "go.Figure":
     """Create line chart showing score progression"""
+    import pandas as pd
+    import plotly.express as px
+    import plotly.graph_objects as go
     
-    if not history:
+    if not points:
         return go.Figure()
     
-    df = pd.DataFrame([
-        {
-            'iteration': i + 1,
-            'overall_score': h['analysis']['overall_score'],
-            'prompt_preview': h['prompt'][:50] + '...' if len(h['prompt']) > 50 else h['prompt']
-        }
-        for i, h in enumerate(history)
-    ])
+    shown = downsample_points(points, HISTORY_CHART_MAX_POINTS)
+    df = pd.DataFrame(shown)
     
     fig = px.line(df, x='iteration', y='overall_score', 
                   hover_data=['prompt_preview'],
-                  markers=True)
+                  markers=len(shown) == len(points))
     
+    title = 'Score Progression'
+    if len(shown) < len(points):
+        title += f' ({len(shown)} of {len(points)} points)'
     fig.update_layout(
-        title='Score Progression',
+        title=title,
         xaxis_title='Iteration',
         yaxis_title='Overall Score',
         yaxis=dict(range=[0, 10]),
@@ -206,7 +160,36 @@ def create_history_chart(history: List[Dict]) -> go.Figure:
     
     return fig
 
+@st.cache_data(max_entries=8, show_spinner=False)
+def cached_history_chart(version: tuple, _history: HistoryStore) -> "go.Figure":
+    """Progression chart, rebuilt only when the history's score series changes"""
+    return create_history_chart(_history.score_series())
+
+def create_category_chart(stats: Dict[str, Any]) -> "go.Figure":
+    """Create grouped bar chart of per-category score aggregates"""
+    import pandas as pd
+    import plotly.express as px
+    
+    category_data = []
+    for metric in METRICS:
+        category_data.append({
+            'Category': metric.title(),
+            'Average Score': stats[metric]['avg'],
+            'Median Score': stats[metric]['p50'],
+            'Best Score': stats[metric]['max'],
+            'Worst Score': stats[metric]['min']
+        })
+    
+    df = pd.DataFrame(category_data)
+    
+    return px.bar(df, x='Category', y=['Average Score', 'Median Score', 'Best Score', 'Worst Score'],
+                  barmode='group', height=400)
+
 def main():
+    history = get_history_store(st.session_state.history_owner)
+    metrics_port = start_metrics_server()  # Only when METRICS_PORT is set
+    similarity = get_similarity_index()
+    
     # Header
     col1, col2 = st.columns([3, 1])
     with col1:
@@ -214,7 +197,9 @@ def main():
         st.markdown("*Transform your prompts into precision instruments*")
     with col2:
         if st.button("🗑️ Clear History", type="secondary"):
-            st.session_state.history = []
+            history.clear()
+            similarity.clear(st.session_state.history_owner)
+            st.session_state.history_page = 0
             st.session_state.current_analysis = None
             st.rerun()
     
@@ -237,7 +222,17 @@ def main():
             help="Choose the Gemini model to use"
         )
         
-        if api_key:
+        if service_url():
+            # Thin client: models, caches and rate limits live in the shared analysis service
+            try:
+                analyzer = ServiceClient(service_url(), model_name)
+                st.session_state.gemini_configured = True
+                st.success(f"✅ Connected to {model_name} via the analysis service")
+            except ServiceError as e:
+                st.session_state.gemini_configured = False
+                st.error(f"Failed to reach the analysis service: {str(e)}")
+                st.stop()
+        elif api_key:
             try:
                 st.session_state.gemini_configured = True
                 analyzer = GeminiAnalyzer(api_key, model_name)
@@ -266,19 +261,73 @@ def main():
             help="Automatically generate optimized version"
         )
         
+        fused_mode = st.checkbox(
+            "⚡ Single-call mode",
+            value=False,
+            disabled=not auto_optimize,
+            help="Analyze and optimize in one model call instead of two"
+        )
+        
+        skip_weak_prompts = st.checkbox(
+            "Score clearly weak prompts locally",
+            value=False,
+            help="Skip the model analysis when the instant estimate is conclusive"
+        )
+        
+        reuse_near_duplicates = st.checkbox(
+            "Reuse analyses of near-duplicate prompts",
+            value=False,
+            help="Skip the model analysis when a previously analyzed prompt is almost identical"
+        )
+        similarity_threshold = st.slider(
+            "Similarity threshold", 0.7, 1.0, DEFAULT_THRESHOLD, 0.01,
+            disabled=not reuse_near_duplicates
+        )
+        
+        with st.expander("🔁 Auto-optimize loop"):
+            loop_target = st.slider("Target score", 5.0, 10.0, 8.5, 0.5)
+            loop_iterations = st.slider("Max iterations", 1, 10, 5)
+            loop_seconds = st.number_input("Time budget (s)", min_value=10, max_value=1800, value=120, step=10)
+            loop_tokens = st.number_input("Token budget (0 = unlimited)", min_value=0, value=0, step=1000)
+        
+        with st.expander("🧪 Multi-candidate search"):
+            candidate_all_focuses = st.checkbox("Try all focus modes", value=True)
+            candidate_variants = st.slider("Variants per focus", 1, 3, 1)
+            candidate_workers = st.slider("Concurrency", 1, 12, 6)
+        
+        # Response cache
+        cache_col1, cache_col2 = st.columns([2, 1])
+        with cache_col1:
+            st.caption(f"💾 {len(analyzer.cache)} cached responses")
+        with cache_col2:
+            if st.button("Clear", key="clear_cache"):
+                analyzer.cache.clear()
+                similarity.clear()
+                st.rerun()
+        reuse_stats = similarity.stats()
+        if reuse_stats['hits'] + reuse_stats['misses']:
+            st.caption(f"♻️ Near-duplicates reused: {reuse_stats['hits']}/{reuse_stats['hits'] + reuse_stats['misses']} "
+                       f"({reuse_stats['hit_rate']:.0%}), ~{reuse_stats['seconds_saved']:.0f}s saved")
+        flights = get_single_flight().stats()
+        if flights['coalesced']:
+            st.caption(f"🔗 Identical in-flight requests coalesced: {flights['coalesced']} model calls saved")
+        parse_outcomes = get_outcome_counts()
+        if parse_outcomes:
+            st.caption("🧾 Responses: " + ", ".join(f"{k} {v}" for k, v in sorted(parse_outcomes.items())))
+        
         st.divider()
         
         # History
         st.subheader("📊 History")
-        if st.session_state.history:
-            st.metric("Total Optimizations", len(st.session_state.history))
-            avg_improvement = sum(h['analysis']['overall_score'] for h in st.session_state.history) / len(st.session_state.history)
-            st.metric("Average Score", f"{avg_improvement:.1f}/10")
+        stats = history.aggregates()
+        if stats['count']:
+            st.metric("Total Optimizations", stats['count'])
+            st.metric("Average Score", f"{stats['overall_score']['avg']:.1f}/10")
         else:
             st.info("No optimization history yet")
     
     # Main content area
-    tab1, tab2, tab3 = st.tabs(["✍️ Optimize", "📈 Analysis", "📜 History"])
+    tab1, tab2, tab3, tab4 = st.tabs(["✍️ Optimize", "📈 Analysis", "📜 History", "⏱️ Metrics"])
     
     with tab1:
         # Input section
@@ -299,7 +348,18 @@ def main():
             help="The more detailed your prompt, the better the analysis"
         )
         
-        col1, col2, col3 = st.columns([2, 2, 6])
+        # Instant local estimate (no model call)
+        preview = score_prompt(prompt_input) if prompt_input.strip() else None
+        if preview:
+            st.caption(
+                f"⚡ Instant estimate: {preview['overall_score']:.1f}/10 · "
+                + " · ".join(f"{m.title()} {preview[m]:.0f}" for m in
+                             ['clarity', 'specificity', 'structure', 'completeness', 'effectiveness'])
+            )
+            if preview['conclusive']:
+                st.caption("💡 Consider adding: " + ", ".join(preview['missing_elements'][:4]))
+        
+        col1, col2, col3, col4 = st.columns([2, 2, 2, 4])
         with col1:
             analyze_button = st.button("🔍 Analyze", type="primary", use_container_width=True)
         with col2:
@@ -307,29 +367,150 @@ def main():
                 optimize_button = st.button("🚀 Optimize", type="secondary", use_container_width=True)
             else:
                 optimize_button = False
+        with col3:
+            loop_button = st.button("🔁 Auto-loop", use_container_width=True,
+                                    help="Analyze and optimize repeatedly until the score converges")
+        with col4:
+            if st.session_state.current_analysis:
+                candidates_button = st.button("🧪 Best of N", use_container_width=True,
+                                              help="Generate and score several rewrites in parallel")
+            else:
+                candidates_button = False
+        
+        # Automated optimize -> re-analyze loop
+        if loop_button and prompt_input:
+            # Progress goes to the top of the History tab as each iteration finishes
+            live_progress = tab3.container()
+            live_progress.info("🔁 Auto-optimize loop in progress")
+            record = best_record = None
+            with st.spinner("🔁 Optimizing until the score converges..."):
+                try:
+                    for record in optimize_until_converged(
+                        analyzer, prompt_input, optimization_focus,
+                        target_score=loop_target,
+                        max_iterations=loop_iterations,
+                        max_seconds=loop_seconds,
+                        max_tokens=loop_tokens or None,
+                        fused=fused_mode
+                    ):
+                        if record.get('stop_reason') == "analysis_failed":
+                            # Default scores are not a measurement, so this isn't kept
+                            live_progress.write(f"Iteration {record['iteration']}: analysis failed")
+                            continue
+                        record['id'] = history.append(record)
+                        score = record['analysis']['overall_score']
+                        live_progress.write(f"Iteration {record['iteration']}: {score:.1f}/10 "
+                                            f"({record['elapsed']:.1f}s, {record['tokens']:,} tokens)")
+                        if best_record is None or score > best_record['analysis']['overall_score']:
+                            best_record = record
+                except Exception as e:
+                    st.error(f"Auto-optimize loop failed: {str(e)}")
+            
+            if best_record is None:
+                st.warning("The loop stopped before any iteration completed"
+                           + (f": {record['error']}" if record and 'error' in record else ""))
+            else:
+                st.session_state.current_analysis = best_record
+                # Only the final record carries the stop reason; a failed loop ends early
+                if record.get('stop_reason') == "analysis_failed":
+                    st.warning(f"Stopped at iteration {record['iteration']} because the analysis failed "
+                               f"({record['error']}); showing the best scored iteration")
+                elif 'stop_reason' in record:
+                    reason = record['stop_reason'].replace('_', ' ')
+                    st.success(f"Stopped ({reason}) after {record['iteration']} iterations: "
+                               f"best score {record['best_score']:.1f}/10, {record['tokens']:,} tokens")
         
         # Analysis section
         if analyze_button and prompt_input:
             with st.spinner("🧠 Analyzing your prompt..."):
                 try:
-                    analysis = analyzer.analyze_prompt(prompt_input)
+                    use_heuristic = bool(skip_weak_prompts and preview and preview['conclusive'])
+                    # Near-duplicate lookups hash the prompt, so they only run when Analyze is clicked
+                    template_version = GeminiAnalyzer.TEMPLATE_VERSION
+                    nearest = reused = None
+                    if not use_heuristic:
+                        # Looked up before the model call so the closest earlier prompt shows at once
+                        nearest = similarity.nearest(prompt_input, analyzer.model_name, template_version)
+                        if reuse_near_duplicates:
+                            reused = similarity.reuse(nearest, similarity_threshold)
+                        if nearest and not reused and nearest['similarity'] >= 0.5:
+                            # Its text may be another session's, so only the score is shown
+                            st.caption(f"🔁 {nearest['similarity']:.0%} similar to a previously analyzed prompt "
+                                       f"scored {nearest['analysis']['overall_score']:.1f}/10")
+                    if use_heuristic:
+                        # The estimate is conclusive, so skip the model analysis entirely
+                        analysis = {k: v for k, v in preview.items() if k != 'conclusive'}
+                        latency = {}
+                        st.caption("⚡ Scored locally: the prompt is clearly underspecified")
+                    elif reused:
+                        analysis = {**reused['analysis'], 'source': 'near_duplicate'}
+                        latency = {}
+                        st.caption(f"♻️ Reused the analysis of a {reused['similarity']:.0%} similar prompt")
+                    elif auto_optimize and fused_mode:
+                        analysis, optimized = analyzer.analyze_and_optimize(prompt_input, optimization_focus)
+                        latency = {'fused': analyzer.last_latency['fused']}
+                    else:
+                        analysis = analyzer.analyze_prompt(prompt_input)
+                        latency = {'analyze': analyzer.last_latency['analyze']}
+                    if not use_heuristic and not reused:
+                        if analyzer.last_cache_hit:
+                            st.caption("⚡ Served from cache")
+                        elif analyzer.last_coalesced:
+                            st.caption("🔗 Shared the result of an identical request already in progress")
+                        else:
+                            similarity.record_analysis_time(sum(latency.values()))
+                        # Fallbacks and partly defaulted analyses must never be reused
+                        if is_complete(analysis):
+                            similarity.add(prompt_input, analysis, analyzer.model_name, template_version,
+                                           st.session_state.history_owner)
                     st.session_state.current_analysis = {
                         'prompt': prompt_input,
                         'analysis': analysis,
-                        'timestamp': datetime.now()
+                        'timestamp': datetime.now(),
+                        'latency': latency
                     }
                     
                     # Add to history
-                    st.session_state.history.append(st.session_state.current_analysis)
+                    st.session_state.current_analysis['id'] = history.append(st.session_state.current_analysis)
                     
                     # Auto-optimize if enabled
-                    if auto_optimize:
-                        time.sleep(0.5)  # Brief pause for UX
+                    if auto_optimize and fused_mode and not use_heuristic and not reused:
+                        st.session_state.current_analysis['optimized'] = optimized
+                    elif auto_optimize:
                         optimized = analyzer.optimize_prompt(prompt_input, analysis, optimization_focus)
                         st.session_state.current_analysis['optimized'] = optimized
+                        latency['optimize'] = analyzer.last_latency['optimize']
+                    if auto_optimize:
+                        history.update(st.session_state.current_analysis['id'], st.session_state.current_analysis)
                 except Exception as e:
                     st.error(f"Analysis failed: {str(e)}")
         
+        # Parallel multi-candidate optimization
+        if candidates_button:
+            current = st.session_state.current_analysis
+            focuses = OPTIMIZATION_FOCUSES if candidate_all_focuses else [optimization_focus]
+            total = len(focuses) * candidate_variants
+            with st.spinner(f"🧪 Generating and scoring {total} candidates..."):
+                result = search_candidates(
+                    analyzer, current['prompt'], current['analysis'],
+                    focuses=focuses,
+                    variants_per_focus=candidate_variants,
+                    max_workers=candidate_workers
+                )
+            if result['best']:
+                current['optimized'] = result['best']['optimized']
+                current['candidates'] = [
+                    {k: c[k] for k in ['focus', 'variant', 'score', 'optimized']}
+                    for c in result['ranking']
+                ]
+                current.setdefault('latency', {})['candidates'] = result['elapsed']
+                if 'id' in current:
+                    history.update(current['id'], current)
+                if result['failed']:
+                    st.caption(f"⚠️ {result['failed']} of {total} candidates failed and were not ranked")
+            else:
+                st.warning(f"No valid candidate: all {total} rewrites or their analyses failed")
+        
         # Display current analysis
         if st.session_state.current_analysis:
             analysis = st.session_state.current_analysis['analysis']
@@ -359,6 +540,11 @@ def main():
                 """, unsafe_allow_html=True)
                 
                 st.markdown(f"**Summary:** {analysis['one_line_summary']}")
+                
+                latency = st.session_state.current_analysis.get('latency')
+                if latency:
+                    parts = " + ".join(f"{kind} {seconds:.2f}s" for kind, seconds in latency.items())
+                    st.caption(f"⏱️ {parts}")
             
             with col2:
                 # Radar chart
@@ -413,6 +599,12 @@ def main():
                                 optimization_focus
                             )
                             st.session_state.current_analysis['optimized'] = optimized
+                            st.session_state.current_analysis.pop('candidates', None)
+                            st.session_state.current_analysis.setdefault('latency', {})['optimize'] = \
+                                analyzer.last_latency['optimize']
+                            if 'id' in st.session_state.current_analysis:
+                                history.update(st.session_state.current_analysis['id'],
+                                               st.session_state.current_analysis)
                         except Exception as e:
                             st.error(f"Optimization failed: {str(e)}")
                 
@@ -420,6 +612,11 @@ def main():
                     st.divider()
                     st.subheader("✨ Optimized Prompt")
                     
+                    if st.session_state.current_analysis.get('candidates'):
+                        with st.expander(f"🧪 Candidate ranking ({len(st.session_state.current_analysis['candidates'])})"):
+                            st.dataframe(st.session_state.current_analysis['candidates'],
+                                         use_container_width=True, hide_index=True)
+                    
                     # Show before/after
                     col1, col2 = st.columns(2)
                     
@@ -446,74 +643,62 @@ def main():
     with tab2:
         st.subheader("📈 Performance Analytics")
         
-        if st.session_state.history:
+        stats = history.aggregates()
+        if stats['count']:
             # Score progression
-            fig = create_history_chart(st.session_state.history)
+            fig = cached_history_chart(history.version(), history)
             st.plotly_chart(fig, use_container_width=True)
             
             # Statistics
             col1, col2, col3, col4 = st.columns(4)
             
-            scores = [h['analysis']['overall_score'] for h in st.session_state.history]
-            
             with col1:
-                st.metric("Best Score", f"{max(scores):.1f}/10")
+                st.metric("Best Score", f"{stats['overall_score']['max']:.1f}/10")
             with col2:
-                st.metric("Average Score", f"{sum(scores)/len(scores):.1f}/10")
+                st.metric("Average Score", f"{stats['overall_score']['avg']:.1f}/10")
             with col3:
-                st.metric("Total Prompts", len(scores))
+                st.metric("Total Prompts", stats['count'])
             with col4:
-                improvement = scores[-1] - scores[0] if len(scores) > 1 else 0
+                improvement = stats['last_score'] - stats['first_score'] if stats['count'] > 1 else 0
                 st.metric("Net Improvement", f"{improvement:+.1f}", 
                          delta_color="normal" if improvement >= 0 else "inverse")
             
-            # Category breakdown
+            # Category breakdown (from the store's running aggregates)
             st.subheader("📊 Category Performance")
-            
-            category_data = []
-            for metric in ['clarity', 'specificity', 'structure', 'completeness', 'effectiveness']:
-                metric_scores = [h['analysis'][metric] for h in st.session_state.history]
-                category_data.append({
-                    'Category': metric.title(),
-                    'Average Score': sum(metric_scores) / len(metric_scores),
-                    'Best Score': max(metric_scores),
-                    'Worst Score': min(metric_scores)
-                })
-            
-            df = pd.DataFrame(category_data)
-            
-            fig = px.bar(df, x='Category', y=['Average Score', 'Best Score', 'Worst Score'],
-                        barmode='group', height=400)
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(create_category_chart(stats), use_container_width=True)
         else:
             st.info("No analysis data yet. Start by optimizing a prompt!")
     
     with tab3:
         st.subheader("📜 Optimization History")
         
-        if st.session_state.history:
+        if history.count():
             # Filter and sort options
-            col1, col2 = st.columns([2, 1])
+            col1, col2, col3 = st.columns([2, 1, 1])
             with col1:
-                search = st.text_input("🔍 Search prompts", placeholder="Filter by prompt content...")
+                search = st.text_input("🔍 Search prompts",
+                                       placeholder="Search prompts, optimized versions and analyses...")
             with col2:
-                sort_by = st.selectbox("Sort by", ["Newest First", "Oldest First", "Highest Score", "Lowest Score"])
+                sort_by = st.selectbox("Sort by", ["Best Match", "Newest First", "Oldest First",
+                                                   "Highest Score", "Lowest Score"])
+            with col3:
+                min_score, max_score = st.slider("Score range", 0.0, 10.0, (0.0, 10.0), 0.5)
             
-            # Filter history
-            filtered_history = st.session_state.history
-            if search:
-                filtered_history = [h for h in filtered_history if search.lower() in h['prompt'].lower()]
+            # Start from the first page whenever the filter changes
+            history_filter = (search, sort_by, min_score, max_score)
+            if st.session_state.get('history_filter') != history_filter:
+                st.session_state.history_filter = history_filter
+                st.session_state.history_page = 0
             
-            # Sort history
-            if sort_by == "Newest First":
-                filtered_history = filtered_history[::-1]
-            elif sort_by == "Highest Score":
-                filtered_history = sorted(filtered_history, key=lambda x: x['analysis']['overall_score'], reverse=True)
-            elif sort_by == "Lowest Score":
-                filtered_history = sorted(filtered_history, key=lambda x: x['analysis']['overall_score'])
+            # Only the current page is loaded from the store
+            total = history.count(search, min_score, max_score)
+            pages = max(1, (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE)
+            page = min(st.session_state.history_page, pages - 1)
+            page_items = history.page(page * HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE, sort_by,
+                                      search, min_score, max_score)
             
             # Display history
-            for i, item in enumerate(filtered_history):
+            for item in page_items:
                 with st.expander(
                     f"📝 {item['prompt'][:60]}... | "
                     f"Score: {item['analysis']['overall_score']:.1f}/10 | "
@@ -531,51 +716,136 @@ def main():
                     
                     with col2:
                         st.markdown("**Scores:**")
-                        for metric in ['clarity', 'specificity', 'structure', 'completeness', 'effectiveness']:
+                        for metric in METRICS:
                             st.write(f"{metric.title()}: {item['analysis'][metric]}/10")
                         
-                        if st.button(f"🔄 Use This", key=f"use_{i}"):
+                        if st.button(f"🔄 Use This", key=f"use_{item['id']}"):
                             st.session_state.load_prompt = item.get('optimized', item['prompt'])
                             st.rerun()
             
-            # Export options
+            # Pagination
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col1:
+                if st.button("◀ Previous", disabled=page == 0, use_container_width=True):
+                    st.session_state.history_page = page - 1
+                    st.rerun()
+            with col2:
+                st.caption(f"Page {page + 1} of {pages} · {total} entries")
+            with col3:
+                if st.button("Next ▶", disabled=page >= pages - 1, use_container_width=True):
+                    st.session_state.history_page = page + 1
+                    st.rerun()
+            
+            # Export options (written to a temp file in batches, never held as one big string)
             st.divider()
-            col1, col2 = st.columns(2)
+            col1, col2 = st.columns([1, 2])
             
             with col1:
-                if st.button("📥 Export History (JSON)", use_container_width=True):
-                    json_str = json.dumps(st.session_state.history, indent=2, default=str)
-                    st.download_button(
-                        label="Download JSON",
-                        data=json_str,
-                        file_name=f"prompt_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                        mime="application/json"
-                    )
+                export_format = st.selectbox("Export format", list(EXPORT_FORMATS))
             
             with col2:
-                if st.button("📊 Export Analytics (CSV)", use_container_width=True):
-                    # Create DataFrame for export
-                    export_data = []
-                    for item in st.session_state.history:
-                        row = {
-                            'timestamp': item['timestamp'],
-                            'prompt': item['prompt'],
-                            'overall_score': item['analysis']['overall_score'],
-                            **{k: v for k, v in item['analysis'].items() if k in ['clarity', 'specificity', 'structure', 'completeness', 'effectiveness']}
-                        }
-                        export_data.append(row)
+                if st.button("📥 Prepare Export", use_container_width=True):
+                    extension, mime = EXPORT_FORMATS[export_format]
+                    previous = st.session_state.get('history_export')
+                    if previous and os.path.exists(previous['path']):
+                        os.remove(previous['path'])
                     
-                    df = pd.DataFrame(export_data)
-                    csv = df.to_csv(index=False)
+                    st.session_state.history_export = None
                     
-                    st.download_button(
-                        label="Download CSV",
-                        data=csv,
-                        file_name=f"prompt_analytics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                        mime="text/csv"
-                    )
+                    # The friendly name is only the download name; the file itself gets a unique,
+                    # private path so sessions exporting at once never share or delete each other's
+                    file_name = f"prompt_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+                    fd, path = tempfile.mkstemp(prefix="prompt_history_", suffix=f".{extension}")
+                    total = history.count()
+                    progress = st.progress(0.0, text=f"Exporting {total} entries...")
+                    try:
+                        with os.fdopen(fd, 'wb') as f:
+                            export_history(history, f, extension,
+                                           progress=lambda done: progress.progress(min(1.0, done / total)))
+                        st.session_state.history_export = {'path': path, 'file_name': file_name, 'mime': mime}
+                    except ImportError:
+                        os.remove(path)
+                        st.error("Parquet export requires pyarrow (pip install pyarrow)")
+                    finally:
+                        progress.empty()
+                
+                export = st.session_state.get('history_export')
+                if export and os.path.exists(export['path']):
+                    with open(export['path'], 'rb') as f:
+                        st.download_button(
+                            label=f"Download {export['file_name']}",
+                            data=f,
+                            file_name=export['file_name'],
+                            mime=export['mime'],
+                            use_container_width=True
+                        )
         else:
             st.info("No history yet. Start optimizing prompts to build your history!")
+        
+        with st.expander("📤 Import History"):
+            uploaded = st.file_uploader("NDJSON, CSV, Parquet or JSON history export",
+                                        type=list(IMPORT_EXTENSIONS))
+            if uploaded is not None and st.button("Import", use_container_width=True):
+                fmt = detect_format(uploaded.name)
+                try:
+                    imported = import_history(history, uploaded, fmt)
+                    st.toast(f"Imported {imported} entries")
+                    st.rerun()
+                except ImportError:
+                    st.error("Parquet import requires pyarrow (pip install pyarrow)")
+                except (ValueError, KeyError, TypeError) as e:
+                    st.error(f"Could not import {uploaded.name}: {str(e)}")
+    
+    with tab4:
+        st.subheader("⏱️ Model Call Metrics")
+        
+        metrics = get_metrics_store()
+        summary = metrics.summary()
+        if summary:
+            totals = list(summary.values())
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Calls", sum(s['count'] for s in totals))
+            with col2:
+                st.metric("Errors", sum(s['errors'] for s in totals))
+            with col3:
+                st.metric("Tokens", f"{sum(s['input_tokens'] + s['output_tokens'] for s in totals):,}")
+            with col4:
+                st.metric("Est. Cost", f"${sum(s['cost'] for s in totals):.4f}")
+            
+            # One row per call type, slowest (by p95) first
+            rows = [
+                {
+                    'Call type': call_type,
+                    'Calls': stats['count'],
+                    'Errors': stats['errors'],
+                    'Retries': stats['retries'],
+                    'p50 (s)': stats['wall']['p50'],
+                    'p95 (s)': stats['wall']['p95'],
+                    'p99 (s)': stats['wall']['p99'],
+                    'First token p50 (s)': stats['first_token']['p50'],
+                    'Queued (s)': stats['queued_sum'],
+                    'Input tokens': stats['input_tokens'],
+                    'Output tokens': stats['output_tokens'],
+                    'Cached tokens': stats['cached_tokens'],
+                    'Cost ($)': round(stats['cost'], 5),
+                }
+                for call_type, stats in sorted(summary.items(), key=lambda item: item[1]['wall']['p95'], reverse=True)
+            ]
+            st.dataframe(rows, use_container_width=True, hide_index=True)
+            st.caption(f"Rolling window of the last {metrics.records.maxlen:,} calls in this process")
+        else:
+            st.info("No model calls recorded yet in this process.")
+        
+        if metrics_port:
+            st.caption(f"📡 Scrape endpoint: http://localhost:{metrics_port}/metrics (Prometheus text), "
+                       f"/metrics.json")
+        else:
+            st.caption("📡 Set METRICS_PORT to expose /metrics and /metrics.json for scraping")
+        
+        if st.button("Clear Metrics"):
+            metrics.clear()
+            st.rerun()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,7 +1,15 @@
 import streamlit as st
 import os
+import time
 from dotenv import load_dotenv
-import google.generativeai as genai
+from prompt_registry import get_prompt_registry
+from knowledge_retrieval import DEFAULT_TOP_K, retrieve
+from call_metrics import start_metrics_server
+from service_client import service_url
+from chat_helpers import (
+    MAX_REQUEST_STATS, chat_with_gemini, format_stats, initialize_gemini,
+    record_request_stats, render_streamed_response
+)
 
 # Load environment variables
 load_dotenv()
@@ -13,244 +21,18 @@ st.set_page_config(
     layout="wide"
 )
 
-def load_system_prompt():
-    """Return the VEO3 system prompt"""
-    return """# VEO3 Video Generation Assistant System Prompt
-
-You are a specialized assistant for Google VEO3 video generation, designed to help users create, enhance, and optimize text prompts for high-quality video output. Your expertise encompasses the complete VEO3 prompting framework, technical specifications, and creative best practices.
-
-## Core Capabilities
-
-You excel at:
-- **Prompt Enhancement**: Transforming basic ideas into detailed, effective VEO3 prompts
-- **Structured Planning**: Using the 10-category framework to ensure comprehensive prompt coverage
-- **Technical Guidance**: Applying proper terminology for camera work, composition, and visual effects
-- **Creative Development**: Suggesting improvements for narrative, visual style, and audio integration
-- **Problem Diagnosis**: Identifying issues in prompts and providing specific solutions
-
-## The VEO3 JSON Framework
-
-Always use these essential elements when creating JSON prompts for character-consistent video generation:
-
-### 1. Character Details (NEVER CHANGES)
-- Extremely detailed physical description: height, build, hair, skin, eyes
-- Specific clothing and accessories that define the character
-- Unique identifiers that make the character recognizable
-- Props or distinctive features that remain constant
-
-### 2. Scene Description (VARIES)
-- Always starts with "real footage selfie video of [character_details]"
-- Specific modern-day location or environment
-- Clear action or behavior the character is performing
-- Context and surroundings that set the scene
-
-### 3. Dialogue (VARIES)
-- Short, natural spoken lines or inner thoughts
-- Casual, emotional, or contextually appropriate tone
-- Should match the scene and character personality
-- Keep authentic and conversational
-
-### 4. Visual Style (CONSISTENT)
-- Always "real footage" for authentic, documentary-style videos
-- Maintains realistic, unfiltered appearance
-- Supports the selfie/personal video aesthetic
-
-### 5. Camera Movement (VARIES)
-- Handheld selfie with extended arm (most common)
-- Steady handheld for stable shots
-- Walking selfie for movement
-- Other natural, personal camera movements
-
-### 6. Voice Consistency (NEVER CHANGES)
-- Detailed description of voice characteristics
-- Tone, pitch, accent, rhythm, delivery style
-- Must remain identical across all scenes
-- Locks in the character's vocal identity
-
-## Technical Terminology Guide
-
-### Shot Composition
-- **Framing**: single shot, two shot, over-the-shoulder shot, group shot
-- **Distance**: extreme close-up, close-up, medium shot, wide shot, extreme wide shot
-- **Angle**: eye level, high angle, low angle, worm's eye view, bird's eye view
-
-### Focus and Lens Effects
-- **Focus Types**: shallow focus, deep focus, soft focus, rack focus
-- **Lens Types**: macro lens, wide-angle lens, telephoto lens, fisheye lens
-- **Depth Effects**: shallow depth of field, bokeh effects, foreground blur
-
-### Camera Movement
-- **Static**: fixed shot, locked-off shot
-- **Moving**: dolly shot, tracking shot, pan shot, tilt shot, zoom shot
-- **Advanced**: crane shot, steadicam shot, handheld shot, gimbal shot
-
-## Audio Integration Best Practices
-
-### Sound Effects
-- Describe in separate sentences: "The audio features water splashing in the background."
-- Be specific about timing: "As the door creaks open, we hear..."
-- Mention intensity: "soft music," "dramatic orchestral score," "subtle ambient sounds"
-
-### Dialogue Guidelines
-- Use speaker identification: "The man in the red hat says..."
-- Include emotional direction: "whispers," "shouts confidently," "says nervously"
-- Specify accent or delivery style when relevant
-- Always clarify subtitle preferences
-
-### Musical Elements
-- Genre specifications: ambient electronic, orchestral, jazz, hip-hop
-- Mood descriptors: upbeat, melancholic, tense, playful
-- Sync requirements: "music syncs with character movement"
-
-## Prompt Enhancement Strategies
-
-### From Basic to Advanced
-1. **Start with Core Concept**: Identify the main subject and action
-2. **Add Visual Details**: Style, setting, lighting, color palette
-3. **Enhance Technical Specs**: Camera work, composition, focus effects
-4. **Layer Audio Elements**: Sound effects, music, dialogue
-5. **Fine-tune Atmosphere**: Mood, ambiance, cultural context
-
-### Common Issues to Address
-- **Vague Subjects**: Transform "a person" to "a young woman in vintage clothing"
-- **Missing Context**: Add specific locations and time periods
-- **Static Scenes**: Introduce camera movement and character actions
-- **Monochrome Descriptions**: Add color palette and lighting details
-- **Silent Videos**: Suggest appropriate audio elements
-
-## Negative Prompting Guidelines
-
-### Best Practices
-- ✅ Describe unwanted elements directly: "urban background, man-made structures"
-- ❌ Avoid instructive language: "don't show walls" or "no buildings"
-- ✅ Use comma-separated lists for multiple exclusions
-- ✅ Focus on visual elements that conflict with desired mood
-
-### Common Negative Prompt Categories
-- **Unwanted Backgrounds**: urban elements, indoor settings, crowds
-- **Mood Conflicts**: dark atmosphere, threatening elements, chaotic scenes  
-- **Technical Issues**: blurry footage, shaky camera, poor lighting
-- **Style Conflicts**: modern elements in historical scenes, realistic elements in cartoon styles
-
-## Creative Enhancement Techniques
-
-### Narrative Depth
-- Add character motivations and emotional stakes
-- Include environmental storytelling elements
-- Create visual metaphors and symbolic elements
-- Build tension through pacing and revelation
-
-### Visual Innovation
-- Combine unexpected elements (dinosaur musician, koala dance battle)
-- Use creative camera angles and movements
-- Experiment with time manipulation (slow motion, time-lapse)
-- Layer multiple visual effects for complexity
-
-### Audio-Visual Sync
-- Match music tempo to action pace
-- Use sound effects to enhance visual impact
-- Create dialogue that serves both story and character
-- Balance environmental audio with featured sounds
-
-## User Interaction Protocol
+# Persona used when none is selected; prompts are loaded from files by the registry
+DEFAULT_PERSONA = "VEO3 JSON Assistant"
 
-### When Enhancing Prompts
-1. **Analyze Current Prompt**: Identify missing categories and weak elements
-2. **Ask Clarifying Questions**: Target specific gaps in the 10-category framework
-3. **Provide Options**: Offer multiple enhancement directions
-4. **Explain Improvements**: Detail why each change will improve output quality
-
-### When Creating New Prompts
-1. **Understand Core Vision**: Extract the essential concept from user input
-2. **Build Systematically**: Work through categories methodically
-3. **Suggest Creative Elements**: Propose unexpected but fitting additions
-4. **Validate Completeness**: Ensure all relevant categories are addressed
-
-### Quality Assurance Checklist
-- [ ] Subject clearly defined with specific details
-- [ ] Setting and context established
-- [ ] Camera work and composition specified
-- [ ] Visual style and mood articulated
-- [ ] Audio elements considered (if applicable)
-- [ ] Color palette and lighting described
-- [ ] Technical terminology properly used
-- [ ] Potential conflicts or contradictions resolved
-
-## Required Output Format
-
-ALWAYS structure your final prompt output in this exact JSON format:
-
-```json
-{
-  "character_details": "[fixed and detailed visual description of the character — height, build, hair/fur/skin, outfit, accessories, props, and any unique identifiers. This should never change across scenes]",
-  "scene_description": "real footage selfie video of [character_details] in [modern-day place]. [action or behavior] while [description of surroundings and context].",
-  "dialogue": "[spoken line or inner thought said by the character during the shot — keep it short, casual or emotional]",
-  "visual_style": "real footage",
-  "camera_movement": "[handheld selfie with extended arm / steady handheld / walking selfie / etc.]",
-  "voice_consistency": "[describe voice tone, pitch, accent, rhythm, delivery style — this locks how the voice *sounds* across all scenes]"
-}
-```
-
-### Example JSON Output:
-
-```json
-{
-  "character_details": "A 25-year-old woman with shoulder-length curly brown hair, hazel eyes, 5'6\" height, medium build, wearing a cream-colored oversized sweater, small silver hoop earrings, and a delicate gold necklace. She has a warm smile with dimples and natural makeup with subtle pink lip gloss.",
-  "scene_description": "real footage selfie video of a 25-year-old woman with shoulder-length curly brown hair in a cozy coffee shop. She's sitting at a wooden table near a window, holding a steaming latte while looking directly at the camera with a genuine smile.",
-  "dialogue": "Good morning everyone! Just grabbed my favorite vanilla latte - perfect way to start the day!",
-  "visual_style": "real footage",
-  "camera_movement": "handheld selfie with extended arm",
-  "voice_consistency": "Warm, friendly tone with a slight raspy morning voice, medium pitch, cheerful delivery with natural pauses and genuine enthusiasm"
-}
-```
-
-## Response Structure
-
-Always structure your responses to include:
-
-1. **Analysis**: Brief assessment of current prompt strengths/weaknesses
-2. **Enhanced JSON Prompt**: Complete JSON structure ready for VEO3
-3. **Key Improvements**: Explanation of major changes made
-4. **Character Consistency Notes**: How the character details ensure consistency
-5. **Optional Variations**: Alternative JSON versions to explore
-
-**CRITICAL**: Every response must end with a properly formatted JSON prompt using the exact structure shown above. Focus on character consistency by maintaining detailed, unchanging character descriptions that will work across multiple video generations.
-
-Remember: This JSON format is optimized for character-consistent video generation. The character_details field should be extremely detailed and never change, while scene_description, dialogue, and other elements can vary based on the specific video being created."""
-
-def initialize_gemini(api_key=None, model_name='gemini-2.0-flash-exp'):
-    """Initialize Gemini with provided API key and model"""
-    if not api_key:
-        return None
-    
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(model_name)
-        # Test the connection
-        response = model.generate_content("Hello")
-        return model
-    except Exception as e:
-        st.error(f"Failed to initialize Gemini: {str(e)}")
-        return None
-
-def chat_with_gemini(model, system_prompt, user_message):
-    """Send message to Gemini and get response"""
-    try:
-        # Combine system prompt and user message
-        full_prompt = f"{system_prompt}\n\nUser: {user_message}\n\nAssistant:"
-        
-        response = model.generate_content(full_prompt)
-        return response.text
-    except Exception as e:
-        return f"Error: {str(e)}"
+# Initialize session state
+if 'request_stats' not in st.session_state:
+    st.session_state.request_stats = []
 
 def main():
+    start_metrics_server()  # Exposes /metrics when METRICS_PORT is set
     st.title("🎬 Gemini VEO3 Assistant")
     st.markdown("---")
     
-    # Load system prompt
-    system_prompt = load_system_prompt()
-    
     # API Key Input Section
     st.header("🔑 API Configuration")
     
@@ -283,7 +65,26 @@ def main():
     # Sidebar for configuration
     with st.sidebar:
         st.header("⚙️ Configuration")
-        st.info("Using VEO3 Assistant System Prompt")
+        
+        # System prompt persona (edits to the file are picked up without a restart)
+        prompts = get_prompt_registry()
+        personas = list(prompts.personas())
+        persona = st.selectbox(
+            "Persona",
+            personas,
+            index=personas.index(DEFAULT_PERSONA) if DEFAULT_PERSONA in personas else 0
+        )
+        try:
+            system_prompt = prompts.get(persona)
+        except (KeyError, OSError) as e:
+            st.error(f"Could not load the {persona} prompt: {str(e)}")
+            st.stop()
+        st.caption(f"📄 {os.path.basename(system_prompt.path)} · {system_prompt.hash[:8]}")
+        
+        # Only the knowledge base sections relevant to each message are sent
+        knowledge_base = st.selectbox("Knowledge base", ["None"] + list(prompts.knowledge_bases()))
+        knowledge_sections = st.slider("Sections per message", 1, 8, DEFAULT_TOP_K,
+                                       disabled=knowledge_base == "None")
         
         # Model selection
         model_name = st.selectbox(
@@ -292,6 +93,23 @@ def main():
             index=0
         )
         
+        stream_responses = st.checkbox(
+            "Stream responses",
+            value=True,
+            help="Show the answer as it is generated"
+        )
+        
+        # Latency of recent requests
+        if st.session_state.request_stats:
+            recent = st.session_state.request_stats[-MAX_REQUEST_STATS:]
+            first_tokens = [t['first_token'] for t in recent if 'first_token' in t]
+            if first_tokens:
+                st.metric("Avg. first token", f"{sum(first_tokens) / len(first_tokens):.2f}s")
+            st.metric("Avg. response time", f"{sum(t['total'] for t in recent) / len(recent):.2f}s")
+            input_tokens = [t['input_tokens'] for t in recent if 'input_tokens' in t]
+            if input_tokens:
+                st.metric("Avg. input tokens", f"{sum(input_tokens) / len(input_tokens):,.0f}")
+        
         # API key info
         st.markdown("---")
         st.markdown("**API Key Help:**")
@@ -301,10 +119,10 @@ def main():
     
     # Initialize Gemini with the provided API key and selected model
     model = None
-    if api_key_input:
-        model = initialize_gemini(api_key_input, model_name)
+    if api_key_input or service_url():
+        model = initialize_gemini(api_key_input, model_name, system_prompt)
     
-    if not api_key_input:
+    if not api_key_input and not service_url():
         st.info("Please enter your Gemini API key to start using the assistant.")
         st.stop()
     elif model is None:
@@ -324,14 +142,29 @@ def main():
     # Send button
     if st.button("🚀 Send", type="primary"):
         if user_input.strip():
-            # Get response from Gemini
-            with st.spinner("Generating response..."):
-                response = chat_with_gemini(model, system_prompt, user_input)
-            
-            # Display the response
             st.markdown("---")
             st.header("🤖 Assistant Response")
-            st.write(response)
+            
+            # Attach the relevant knowledge base sections, if one is selected
+            message, knowledge = user_input, None
+            if knowledge_base != "None":
+                message, knowledge = retrieve(knowledge_base, user_input, knowledge_sections)
+            
+            # Get response from Gemini
+            if stream_responses:
+                response, stats = render_streamed_response(model, message)
+            else:
+                stats = {}
+                start = time.perf_counter()
+                with st.spinner("Generating response..."):
+                    response = chat_with_gemini(model, message, stats)
+                stats['total'] = time.perf_counter() - start
+                st.write(response)
+            if knowledge:
+                stats['knowledge'] = knowledge
+            
+            record_request_stats(stats)
+            st.caption(format_stats(stats))
 
 if __name__ == "__main__":
     main() 